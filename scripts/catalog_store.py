@@ -0,0 +1,207 @@
+"""
+Partitioned Parquet store for the reference catalog.
+
+The catalog CSV (Yoon & Shelly layout: event_id, origin_time, latitude,
+longitude, depth, magnitude, uncertainty_x/z, ...) is converted once into
+Parquet files partitioned by year or by lat/lon cell, each sorted by event_id
+and split into small row groups. query_catalog() prunes partitions from the
+directory names and row groups from the Parquet min/max statistics, so
+looking up a few hundred templates (or a time window / bounding box) reads
+only the row groups that can contain them.
+
+Requires pyarrow (imported on use).
+"""
+import glob
+import json
+import os
+import shutil
+import numpy as np
+import pandas as pd
+
+
+META_FILE = 'catalog_meta.json'
+
+
+def _partition_keys(df, partition, grid_deg):
+    if partition == 'year':
+        return {'year': df['origin_time'].dt.year.to_numpy()}
+    if partition == 'region':
+        return {'lat': (np.floor(df['latitude'].to_numpy() / grid_deg) * grid_deg).astype(int),
+                'lon': (np.floor(df['longitude'].to_numpy() / grid_deg) * grid_deg).astype(int)}
+    raise ValueError(f"Unknown partitioning: {partition} (use 'year' or 'region')")
+
+
+def build_catalog_store(catalog_csv, store_dir, partition='year', grid_deg=1, row_group_size=20000):
+    """
+    Convert a catalog CSV into a partitioned Parquet store.
+
+    Parameters:
+    -----------
+    catalog_csv : str
+        Reference catalog CSV
+    store_dir : str
+        Output directory (replaced if it exists)
+    partition : str
+        'year' (origin time) or 'region' (grid_deg x grid_deg lat/lon cells)
+    grid_deg : int
+        Cell size in degrees for partition='region'
+    row_group_size : int
+        Rows per Parquet row group (smaller groups prune better, larger ones compress better)
+
+    Returns: store_dir
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    df = pd.read_csv(catalog_csv, dtype={'event_id': str})
+    df['origin_time'] = pd.to_datetime(df['origin_time'], format='ISO8601', utc=True).dt.tz_localize(None)
+    keys = _partition_keys(df, partition, grid_deg)
+
+    if os.path.isdir(store_dir):
+        shutil.rmtree(store_dir)
+    os.makedirs(store_dir)
+
+    key_frame = pd.DataFrame(keys, index=df.index)
+    n_files = 0
+    for key, index in key_frame.groupby(list(keys), sort=True).groups.items():
+        key = key if isinstance(key, tuple) else (key,)
+        part = df.loc[index]
+        sub_dir = os.path.join(store_dir, *[f'{name}={int(value)}' for name, value in zip(keys, key)])
+        os.makedirs(sub_dir, exist_ok=True)
+        part = part.sort_values('event_id', kind='stable')
+        pq.write_table(pa.Table.from_pandas(part, preserve_index=False), f'{sub_dir}/part-0.parquet',
+                       row_group_size=row_group_size, write_statistics=True)
+        n_files += 1
+
+    stat = os.stat(catalog_csv)
+    with open(f'{store_dir}/{META_FILE}', 'w') as f:
+        json.dump({'source': os.path.abspath(catalog_csv), 'source_size': stat.st_size,
+                   'source_mtime_ns': stat.st_mtime_ns, 'partition': partition, 'grid_deg': grid_deg,
+                   'n_rows': len(df), 'columns': list(df.columns)}, f, indent=2)
+
+    print(f"✅ Catalog store: {len(df)} events in {n_files} partitions ({partition}) -> {store_dir}")
+    return store_dir
+
+
+def store_is_current(store_dir, catalog_csv):
+    """True if store_dir was built from the current version of catalog_csv."""
+    meta_file = f'{store_dir}/{META_FILE}'
+    if not os.path.exists(meta_file) or not os.path.exists(catalog_csv):
+        return False
+    with open(meta_file, 'r') as f:
+        meta = json.load(f)
+    stat = os.stat(catalog_csv)
+    return meta['source_size'] == stat.st_size and meta['source_mtime_ns'] == stat.st_mtime_ns
+
+
+def _partition_values(path, store_dir):
+    rel = os.path.relpath(os.path.dirname(path), store_dir)
+    return {k: int(v) for k, v in (part.split('=') for part in rel.split(os.sep))}
+
+
+def _overlaps(lo, hi, range_lo, range_hi):
+    return lo is None or hi is None or (hi >= range_lo and lo <= range_hi)
+
+
+def _to_naive(t):
+    t = pd.Timestamp(t)
+    return t.tz_convert('UTC').tz_localize(None) if t.tzinfo is not None else t
+
+
+def query_catalog(store_dir, event_ids=None, time_range=None, bbox=None, columns=None, verbose=True):
+    """
+    Read the catalog rows matching all given filters.
+
+    Parameters:
+    -----------
+    store_dir : str
+        Store written by build_catalog_store
+    event_ids : iterable of str, optional
+        Event IDs to look up
+    time_range : (start, end), optional
+        Origin-time window (inclusive)
+    bbox : (lat_min, lat_max, lon_min, lon_max), optional
+        Bounding box (inclusive)
+    columns : list of str, optional
+        Columns to read (default all)
+
+    Returns: DataFrame
+    """
+    import pyarrow.parquet as pq
+
+    with open(f'{store_dir}/{META_FILE}', 'r') as f:
+        meta = json.load(f)
+
+    ids = np.sort(np.unique(np.asarray([str(i) for i in event_ids], dtype=object))) if event_ids is not None else None
+    if ids is not None and len(ids) == 0:
+        return pd.DataFrame(columns=columns or meta['columns'])
+    if time_range is not None:
+        time_range = (_to_naive(time_range[0]), _to_naive(time_range[1]))
+    read_columns = None
+    if columns is not None:
+        needed = list(columns)
+        if ids is not None:
+            needed.append('event_id')
+        if time_range is not None:
+            needed.append('origin_time')
+        if bbox is not None:
+            needed += ['latitude', 'longitude']
+        read_columns = list(dict.fromkeys(needed))
+
+    tables, n_groups, n_read = [], 0, 0
+    for path in sorted(glob.glob(f'{store_dir}/**/*.parquet', recursive=True)):
+        # --- partition pruning from the directory name
+        part = _partition_values(path, store_dir)
+        if meta['partition'] == 'year' and time_range is not None \
+                and not time_range[0].year <= part['year'] <= time_range[1].year:
+            continue
+        if meta['partition'] == 'region' and bbox is not None:
+            g = meta['grid_deg']
+            if not (_overlaps(part['lat'], part['lat'] + g, bbox[0], bbox[1])
+                    and _overlaps(part['lon'], part['lon'] + g, bbox[2], bbox[3])):
+                continue
+
+        # --- row-group pruning from min/max statistics
+        pf = pq.ParquetFile(path)
+        names = pf.schema_arrow.names
+        selected = []
+        for i in range(pf.metadata.num_row_groups):
+            n_groups += 1
+            rg = pf.metadata.row_group(i)
+            stats = {names[j]: rg.column(j).statistics for j in range(rg.num_columns)}
+
+            def bounds(col):
+                s = stats.get(col)
+                return (s.min, s.max) if s is not None and s.has_min_max else (None, None)
+
+            if ids is not None:
+                lo, hi = bounds('event_id')
+                if lo is not None and np.searchsorted(ids, hi, side='right') == np.searchsorted(ids, lo, side='left'):
+                    continue
+            if time_range is not None and not _overlaps(*bounds('origin_time'), *time_range):
+                continue
+            if bbox is not None and not (_overlaps(*bounds('latitude'), bbox[0], bbox[1])
+                                         and _overlaps(*bounds('longitude'), bbox[2], bbox[3])):
+                continue
+            selected.append(i)
+
+        if selected:
+            n_read += len(selected)
+            tables.append(pf.read_row_groups(selected, columns=read_columns).to_pandas())
+
+    df = pd.concat(tables, ignore_index=True) if tables else pd.DataFrame(columns=read_columns or meta['columns'])
+
+    # --- exact filters on the rows that were read
+    mask = np.ones(len(df), dtype=bool)
+    if ids is not None:
+        mask &= df['event_id'].isin(ids).to_numpy()
+    if time_range is not None:
+        t = pd.to_datetime(df['origin_time'])
+        mask &= ((t >= time_range[0]) & (t <= time_range[1])).to_numpy()
+    if bbox is not None:
+        mask &= df['latitude'].between(bbox[0], bbox[1]).to_numpy() & df['longitude'].between(bbox[2], bbox[3]).to_numpy()
+    df = df[mask].reset_index(drop=True)
+
+    if verbose:
+        print(f"Catalog query: read {n_read} of {n_groups} row groups, {len(df)} events matched")
+    return df[list(columns)] if columns is not None else df
@@ -0,0 +1,267 @@
+"""
+Triplet closure QC of cross-correlation differential times.
+
+For one station and phase, the lags of three linked events must close:
+dt_ij + dt_jk - dt_ik ~ 0 (dt_ij = t_i - t_j, either pair orientation). A
+cycle-skipped or mis-picked lag breaks every triangle it is part of, a good lag
+only the triangles that also contain a bad one. closure_scores() counts for
+every observation the closed triangles its pair is part of and how many of them
+it violates; apply_closure_qc() drops or down-weights the observations that
+violate most of their triangles, before the .cc file is written.
+
+Triangles are enumerated per (station, phase) on the sparse event adjacency
+(CSR layout, edges oriented from lower to higher degree, so no event has more
+than ~sqrt(2 * edges) out-neighbours and hub templates stay cheap). The wedges
+s->t, s->w are the terms of the adjacency product U^T U, expanded instead of
+summed so every triangle keeps its three lags, and a wedge is closed if t->w is
+an edge (searchsorted on the sorted edge keys). Wedges are expanded in chunks to
+bound memory, and the (station, phase) groups are scored in a process pool.
+"""
+import os
+from multiprocessing import Pool
+import numpy as np
+import pandas as pd
+
+
+CLOSURE_TOL_S = 0.05        # |dt_ij + dt_jk - dt_ik| above this violates the triangle
+MAX_VIOLATION_FRAC = 0.5    # offender: violates more than this share of its triangles
+MIN_TRIANGLES = 2           # ... and is part of at least this many
+WEDGE_CHUNK = 4000000       # wedges expanded at once (~0.5 GB peak per worker)
+MIN_POOL_OBS = 200000       # smaller tables are scored in-process
+
+
+def group_closure(id1, id2, dt, weight, tol=CLOSURE_TOL_S, wedge_chunk=WEDGE_CHUNK):
+    """
+    Closure counts of the observations of one station and phase.
+
+    Several observations of the same event pair are each checked against the
+    other two edges of the triangle; the highest-weight observation of a pair
+    stands for the pair in the triangles of the other pairs.
+
+    Returns:
+    --------
+    (n_triangles, n_violations) per observation (int64 arrays aligned with the input),
+    number of triangles, number of violated triangles
+    """
+    n = len(id1)
+    n_tri, n_viol = np.zeros(n, dtype=np.int64), np.zeros(n, dtype=np.int64)
+    obs = np.flatnonzero(id1 != id2)  # self-pairs are in no triangle
+    if len(obs) < 3:
+        return n_tri, n_viol, 0, 0
+    nodes, inv = np.unique(np.concatenate([id1[obs], id2[obs]]), return_inverse=True)
+    a, b = inv[:len(obs)], inv[len(obs):]
+    n_nodes = len(nodes)
+
+    # --- undirected edges (lo < hi), observation values as D[lo, hi] = t_lo - t_hi
+    lo, hi = np.minimum(a, b), np.maximum(a, b)
+    val = np.where(a == lo, dt[obs], -dt[obs])
+    edge_keys, edge_of = np.unique(lo * n_nodes + hi, return_inverse=True)
+    u, v = edge_keys // n_nodes, edge_keys % n_nodes
+    n_edges = len(edge_keys)
+    by_edge = np.lexsort((-weight[obs], edge_of))  # observations grouped by edge, best first
+    edge_start = np.searchsorted(edge_of[by_edge], np.arange(n_edges))
+    edge_count = np.diff(np.append(edge_start, len(obs)))
+    rep = val[by_edge[edge_start]]
+
+    # --- orient from lower to higher degree; CSR order (source, target) in rank labels
+    rank = np.empty(n_nodes, dtype=np.int64)
+    rank[np.argsort(np.bincount(u, minlength=n_nodes) + np.bincount(v, minlength=n_nodes), kind='stable')] = \
+        np.arange(n_nodes)
+    ru, rv = rank[u], rank[v]
+    sign = np.where(ru < rv, 1.0, -1.0)  # D[source, target] = sign * D[lo, hi]
+    src, tgt = np.minimum(ru, rv), np.maximum(ru, rv)
+    csr = np.lexsort((tgt, src))
+    src, tgt, edge = src[csr], tgt[csr], csr
+    d = sign[edge] * rep[edge]
+    keys = src * n_nodes + tgt
+    obs_val = sign[edge_of] * val  # observation values in the oriented frame of their edge
+
+    # wedge (s->t, s->w) for every pair of out-edges of s with t < w
+    n_wedges = np.searchsorted(src, src, side='right') - np.arange(n_edges) - 1
+    ends = np.cumsum(n_wedges)
+    n_triangles = n_violated = 0
+    start = 0
+    while start < n_edges:
+        done = ends[start - 1] if start else 0
+        stop = max(int(np.searchsorted(ends, done + wedge_chunk, side='right')), start + 1)
+        counts = n_wedges[start:stop]
+        e1 = np.repeat(np.arange(start, stop), counts)
+        e2 = e1 + 1 + np.arange(len(e1)) - np.repeat(np.cumsum(counts) - counts, counts)
+        start = stop
+        if len(e1) == 0:
+            continue
+        closing = tgt[e1] * n_nodes + tgt[e2]
+        e3 = np.minimum(np.searchsorted(keys, closing), n_edges - 1)
+        closed = keys[e3] == closing
+        e1, e2, e3 = e1[closed], e2[closed], e3[closed]
+        closure = d[e1] + d[e3] - d[e2]  # (t_s - t_t) + (t_t - t_w) - (t_s - t_w)
+        n_triangles += len(closure)
+        n_violated += int((np.abs(closure) > tol).sum())
+
+        # every observation of each triangle edge against the value the other two edges predict
+        tri_edge = edge[np.concatenate([e1, e3, e2])]
+        predicted = np.concatenate([d[e2] - d[e3], d[e2] - d[e1], d[e1] + d[e3]])
+        per_edge = edge_count[tri_edge]
+        first = np.repeat(edge_start[tri_edge], per_edge)
+        rows = by_edge[first + np.arange(len(first)) - np.repeat(np.cumsum(per_edge) - per_edge, per_edge)]
+        violated = np.abs(obs_val[rows] - np.repeat(predicted, per_edge)) > tol
+        n_tri[obs] += np.bincount(rows, minlength=len(obs))
+        n_viol[obs] += np.bincount(rows[violated], minlength=len(obs))
+    return n_tri, n_viol, n_triangles, n_violated
+
+
+def station_phase_groups(obs):
+    """Group code (0, 1, ...) of every observation's (station, phase)."""
+    station = pd.factorize(obs['station'].astype(str))[0]
+    phase, phases = pd.factorize(obs['phase'].astype(str))
+    return station * len(phases) + phase
+
+
+def _closure_task(task):
+    group, id1, id2, dt, weight, tol = task
+    return group, group_closure(id1, id2, dt, weight, tol)
+
+
+def closure_scores(obs, tol=CLOSURE_TOL_S, processes=None):
+    """
+    Triangle and violation counts of every observation.
+
+    Parameters:
+    -----------
+    obs : DataFrame
+        Observations with id1, id2, station, phase, dt, weight and optionally otc
+        (csv_hypodd.cc_observations, hypodd_formats.read_dt_cc)
+    tol : float
+        Closure tolerance (s)
+    processes : int, optional
+        Worker processes. Default: os.cpu_count(); tables below MIN_POOL_OBS are scored in-process
+
+    Returns:
+    --------
+    (DataFrame with n_triangles, n_violations aligned with obs, summary dict)
+    """
+    n = len(obs)
+    group = station_phase_groups(obs)
+    order = np.argsort(group, kind='stable')
+    bounds = np.flatnonzero(np.diff(group[order])) + 1
+    id1, id2 = obs['id1'].to_numpy(dtype=np.int64), obs['id2'].to_numpy(dtype=np.int64)
+    dt, weight = obs['dt'].to_numpy(dtype=float), obs['weight'].to_numpy(dtype=float)
+    if 'otc' in obs:
+        # hypoDD uses dt - OTC and skips the pairs without a correction (OTC = -999)
+        otc = obs['otc'].to_numpy(dtype=float)
+        dt = dt - otc
+        order = order[np.abs(otc[order] + 999.0) > 0.001]
+        bounds = np.flatnonzero(np.diff(group[order])) + 1
+    rows = [r for r in np.split(order, bounds) if len(r) >= 3]
+    rows.sort(key=len, reverse=True)  # largest groups first, for the load balance
+    tasks = [(i, id1[r], id2[r], dt[r], weight[r], tol) for i, r in enumerate(rows)]
+
+    n_tri, n_viol = np.zeros(n, dtype=np.int64), np.zeros(n, dtype=np.int64)
+    summary = {'groups': len(tasks), 'triangles': 0, 'violated_triangles': 0}
+
+    def collect(result):
+        i, (tri, viol, n_triangles, n_violated) = result
+        n_tri[rows[i]], n_viol[rows[i]] = tri, viol
+        summary['triangles'] += n_triangles
+        summary['violated_triangles'] += n_violated
+
+    if processes == 1 or len(tasks) <= 1 or n < MIN_POOL_OBS:
+        for task in tasks:
+            collect(_closure_task(task))
+    else:
+        with Pool(processes or os.cpu_count()) as pool:
+            for result in pool.imap_unordered(_closure_task, tasks):
+                collect(result)
+    return pd.DataFrame({'n_triangles': n_tri, 'n_violations': n_viol}, index=obs.index), summary
+
+
+def apply_closure_qc(obs, tol=CLOSURE_TOL_S, max_violation_frac=MAX_VIOLATION_FRAC, min_triangles=MIN_TRIANGLES,
+                     mode='drop', n_iter=3, processes=None):
+    """
+    Drop or down-weight observations that violate the closure of most of their triangles.
+
+    Parameters:
+    -----------
+    obs : DataFrame
+        Observations (id1, id2, station, phase, dt, weight, ...)
+    tol : float
+        Closure tolerance (s), ~3x the lag uncertainty
+    max_violation_frac, min_triangles : float, int
+        An observation is an offender if it is part of at least min_triangles
+        triangles and violates more than max_violation_frac of them
+    mode : str
+        'drop' removes offenders; 'downweight' scales their weight by the share of
+        their triangles they close (offenders that close none are removed)
+    n_iter : int
+        Scoring passes. Each pass rescores without the offenders found so far; all
+        but the last only remove observations that violate every triangle, so good
+        lags that failed next to a bad one are judged after the bad one is gone
+    processes : int, optional
+        Worker processes (see closure_scores)
+
+    Returns:
+    --------
+    (observations in input order, report dict)
+    """
+    if mode not in ('drop', 'downweight'):
+        raise ValueError(f"Unknown closure QC mode '{mode}' (use 'drop' or 'downweight')")
+    n = len(obs)
+    group = station_phase_groups(obs)
+    active = np.ones(n, dtype=bool)
+    tri, viol = np.zeros(n, dtype=np.int64), np.zeros(n, dtype=np.int64)
+    frac = np.zeros(n)
+    offender = np.zeros(n, dtype=bool)
+    report = {'n_input': n, 'tol': tol, 'mode': mode, 'iterations': 0}
+    rescore, peel = active, True
+    for it in range(n_iter):
+        idx = np.flatnonzero(rescore)
+        scores, summary = closure_scores(obs.iloc[idx], tol, processes)
+        tri[idx], viol[idx] = scores['n_triangles'].to_numpy(), scores['n_violations'].to_numpy()
+        if it == 0:
+            report.update(summary, n_checked=int((tri > 0).sum()))
+        report['iterations'] = it + 1
+        # clear offenders (violating all their triangles) go first, then the fraction rule
+        candidate = active & (tri >= min_triangles)
+        bad = candidate & (viol >= tri) if peel and it < n_iter - 1 else candidate & (viol > max_violation_frac * tri)
+        if peel and not bad.any():
+            peel = False
+            bad = candidate & (viol > max_violation_frac * tri)
+        if not bad.any():
+            break
+        frac[bad] = viol[bad] / tri[bad]
+        offender |= bad
+        active &= ~bad
+        # only the station/phase groups that lost observations change
+        rescore = active & np.isin(group, np.unique(group[bad]))
+
+    out = obs
+    if mode == 'drop':
+        out = obs[~offender]
+    else:
+        out = obs.copy()
+        scaled = out['weight'].to_numpy(dtype=float) * np.where(offender, 1.0 - frac, 1.0)
+        out['weight'] = scaled
+        out = out[~offender | (scaled > 0)]
+    phase = obs['phase'].astype(str).to_numpy()
+    report.update({
+        'offenders': int(offender.sum()),
+        'offenders_p': int((offender & (phase == 'P')).sum()),
+        'offenders_s': int((offender & (phase == 'S')).sum()),
+        'n_kept': len(out),
+        'n_downweighted': int((offender & (frac < 1.0)).sum()) if mode == 'downweight' else 0,
+        'pairs_input': int(obs[['id1', 'id2']].drop_duplicates().shape[0]),
+        'pairs_kept': int(out[['id1', 'id2']].drop_duplicates().shape[0]),
+    })
+    return out, report
+
+
+def print_closure_report(report):
+    """Print what the closure QC found and removed."""
+    share = report['violated_triangles'] / report['triangles'] if report['triangles'] else 0.0
+    print(f"Closure QC: {report['triangles']} triangles in {report['groups']} station/phase groups, "
+          f"{report['violated_triangles']} ({share:.1%}) violate {report['tol']:g} s; "
+          f"{report['n_checked']} of {report['n_input']} observations are in a triangle")
+    action = (f"dropped {report['n_input'] - report['n_kept']}" if report['mode'] == 'drop' else
+              f"down-weighted {report['n_downweighted']}, dropped {report['n_input'] - report['n_kept']}")
+    print(f"  {report['offenders']} offenders (P={report['offenders_p']}, S={report['offenders_s']}, "
+          f"{report['iterations']} passes): {action}; pairs {report['pairs_kept']} of {report['pairs_input']}")
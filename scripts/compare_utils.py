@@ -5,6 +5,7 @@ import os
 import shutil
 import numpy as np
 import pandas as pd
+from hypodd_io import open_text
 
 
 def compare_relocations(reloc_file1, reloc_file2, label1='Method 1', label2='Method 2'):
@@ -27,7 +28,7 @@ def compare_relocations(reloc_file1, reloc_file2, label1='Method 1', label2='Met
     # Parse relocation files
     def parse_reloc(file):
         events = []
-        with open(file, 'r') as f:
+        with open_text(file, 'r') as f:
             for line in f:
                 parts = line.split()
                 if len(parts) >= 4:
@@ -0,0 +1,304 @@
+"""
+Convergence tracking of hypoDD runs from the per-iteration snapshots.
+
+hypoDD writes the locations after every iteration to hypoDD.reloc.CCC.III
+(cluster CCC, iteration III) and the residual RMS to hypoDD.log. The watcher
+picks up each snapshot as soon as hypoDD has closed it. It stacks the
+locations per cluster into an (iteration x event x xyz) array, computes the
+shifts between iterations and reads the weighted RMS from the log. A
+callback can stop the run once the locations have settled. The history is
+saved as one .npz file, replacing the text snapshots.
+"""
+import glob
+import os
+import re
+import subprocess
+import time
+import numpy as np
+import pandas as pd
+from hypodd_ext import read_hypodd_inp
+
+
+# ID LAT LON DEPTH X Y Z EX EY EZ YR MO DY HR MI SC MAG CID (x, y, z in m from the cluster centroid)
+SNAPSHOT_COLUMNS = ['event_id', 'latitude', 'longitude', 'depth', 'x_m', 'y_m', 'z_m', 'ex_m', 'ey_m', 'ez_m',
+                    'year', 'month', 'day', 'hour', 'minute', 'second', 'magnitude', 'cluster_id']
+HISTORY_FILE = 'convergence.npz'
+
+_STORED_RE = re.compile(r'stored in (\S+)')
+_RMS_RE = re.compile(r'weighted (cc|ct) rms \[s\](?: \(RMS\w+\))? =\s*(\S+)')
+_NCLUST_RE = re.compile(r'# clusters =\s*(\d+)')
+
+
+def snapshot_files(run_dir, reloc_name='hypoDD.reloc'):
+    """Snapshots in a run directory as (cluster, iteration, path), in the order hypoDD writes them."""
+    found = []
+    for path in glob.glob(f'{run_dir}/{reloc_name}.[0-9][0-9][0-9].[0-9][0-9][0-9]'):
+        cluster, iteration = path.rsplit('.', 2)[-2:]
+        found.append((int(cluster), int(iteration), path))
+    return sorted(found)
+
+
+def read_snapshot(path):
+    """
+    Read one snapshot.
+
+    Returns: (event IDs (int64), xyz in m (float32, n x 3), lat/lon/depth (float64, n x 3))
+    """
+    df = pd.read_csv(path, sep=r'\s+', header=None, usecols=range(7), names=SNAPSHOT_COLUMNS[:7], engine='c')
+    return (df['event_id'].to_numpy(dtype=np.int64), df[['x_m', 'y_m', 'z_m']].to_numpy(dtype=np.float32),
+            df[['latitude', 'longitude', 'depth']].to_numpy(dtype=np.float64))
+
+
+def new_history():
+    """Empty convergence history (filled by ingest_snapshot)."""
+    return {'clusters': {}, 'n_clusters': None, 'cid': None, 'stopped': None, 'rms': {}, 'pending_rms': {},
+            'log_pos': 0, 'log_tail': ''}
+
+
+def _cluster_entry(history, cluster, ids):
+    if cluster not in history['clusters']:
+        history['clusters'][cluster] = {'ids': ids, 'iterations': [], 'xyz': [], 'geo': [],
+                                        'rms_cc': [], 'rms_ct': [], 'shift_rms': [], 'shift_max': [],
+                                        'shift_p90': [], 'n_events': []}
+    return history['clusters'][cluster]
+
+
+def ingest_snapshot(history, cluster, iteration, path):
+    """
+    Add one snapshot to the history and compute the shifts from the previous iteration.
+
+    Events are aligned on the IDs of the cluster's first snapshot; events removed
+    later by hypoDD (air quakes) are NaN from then on.
+
+    Returns: the cluster's history entry
+    """
+    ids, xyz, geo = read_snapshot(path)
+    entry = _cluster_entry(history, cluster, ids)
+    pos = pd.Index(entry['ids']).get_indexer(ids)
+    aligned_xyz = np.full((len(entry['ids']), 3), np.nan, dtype=np.float32)
+    aligned_geo = np.full((len(entry['ids']), 3), np.nan)
+    aligned_xyz[pos[pos >= 0]], aligned_geo[pos[pos >= 0]] = xyz[pos >= 0], geo[pos >= 0]
+
+    if entry['xyz']:
+        shift = np.linalg.norm(aligned_xyz - entry['xyz'][-1], axis=1)
+        shift = shift[~np.isnan(shift)]
+    else:
+        shift = np.empty(0)
+    entry['iterations'].append(iteration)
+    entry['xyz'].append(aligned_xyz)
+    entry['geo'].append(aligned_geo)
+    entry['n_events'].append(len(ids))
+    entry['shift_rms'].append(float(np.sqrt(np.mean(shift ** 2))) if len(shift) else np.nan)
+    entry['shift_p90'].append(float(np.percentile(shift, 90)) if len(shift) else np.nan)
+    entry['shift_max'].append(float(shift.max()) if len(shift) else np.nan)
+    rms = history['rms'].get(os.path.basename(path), {})
+    entry['rms_cc'].append(rms.get('cc', np.nan))
+    entry['rms_ct'].append(rms.get('ct', np.nan))
+    return entry
+
+
+def _read_log(history, log_file):
+    """Read new lines of hypoDD.log: weighted RMS per snapshot name and the number of clusters."""
+    if not os.path.exists(log_file):
+        return
+    if os.path.getsize(log_file) < history['log_pos']:
+        history['log_pos'], history['log_tail'] = 0, ''  # rewritten by a new run
+    with open(log_file, 'r', errors='replace') as f:
+        f.seek(history['log_pos'])
+        text = history['log_tail'] + f.read()
+        history['log_pos'] = f.tell()
+    lines = text.split('\n')
+    history['log_tail'] = lines.pop()  # incomplete last line
+    pending = history['pending_rms']
+    for line in lines:
+        if 'no clustering performed' in line:
+            history['n_clusters'] = 1
+        elif _NCLUST_RE.search(line):
+            history['n_clusters'] = int(_NCLUST_RE.search(line).group(1))
+        elif _RMS_RE.search(line):
+            kind, value = _RMS_RE.search(line).groups()
+            try:
+                pending[kind] = float(value)
+            except ValueError:
+                pending[kind] = np.nan  # *** overflow in the log
+        elif _STORED_RE.search(line):
+            name = os.path.basename(_STORED_RE.search(line).group(1))
+            history['rms'][name] = dict(pending)
+            pending.clear()
+
+
+def shift_below(max_shift_m=1.0, patience=2, statistic='shift_p90'):
+    """
+    Stop rule for watch_run: shifts below max_shift_m for `patience` consecutive iterations.
+
+    statistic: 'shift_rms', 'shift_p90' (default) or 'shift_max' of the event shifts (m)
+    """
+    def converged(history, cluster, entry):
+        recent = entry[statistic][-patience:]
+        return len(recent) == patience and all(v <= max_shift_m for v in recent)
+    return converged
+
+
+def watch_run(run_dir, process=None, reloc_name='hypoDD.reloc', log_file='hypoDD.log', callback=None, poll=0.5,
+              history=None):
+    """
+    Ingest snapshots while hypoDD runs (or once, for a finished run).
+
+    Parameters:
+    -----------
+    run_dir : str
+        Run directory of hypoDD
+    process : subprocess.Popen, optional
+        Running hypoDD. Without it, the existing snapshots are ingested and the function returns
+    callback : callable, optional
+        callback(history, cluster, entry) after each snapshot; returning True stops the run
+        (honoured in the last cluster hypoDD relocates, since later clusters would be lost)
+    poll : float
+        Seconds between checks for new snapshots
+
+    Returns: history dict (see new_history)
+    """
+    history = history or new_history()
+    done = set()
+    log_path = f'{run_dir}/{log_file}'
+    while True:
+        finished = process is None or process.poll() is not None
+        _read_log(history, log_path)
+        snapshots = [s for s in snapshot_files(run_dir, reloc_name) if s[2] not in done]
+        for k, (cluster, iteration, path) in enumerate(snapshots):
+            # complete once hypoDD logged it, wrote a later snapshot, or exited
+            if not (finished or k + 1 < len(snapshots) or os.path.basename(path) in history['rms']):
+                break
+            entry = ingest_snapshot(history, cluster, iteration, path)
+            done.add(path)
+            if callback is None or finished or not callback(history, cluster, entry):
+                continue
+            last_cluster = history['cid'] or history['n_clusters'] in (None, cluster)
+            if not last_cluster:
+                print(f"Cluster {cluster} converged at iteration {iteration} (later clusters follow, not stopping)")
+                continue
+            process.terminate()
+            process.wait()
+            history['stopped'] = (cluster, iteration)
+            print(f"✅ Converged: stopped hypoDD after iteration {iteration} of cluster {cluster}")
+            return history
+        if finished:
+            return history
+        time.sleep(poll)
+
+
+def write_stopped_reloc(history, run_dir, reloc_name='hypoDD.reloc'):
+    """
+    Write hypoDD.reloc from the last snapshot of each cluster after an early stop.
+
+    Data counts are not in the snapshots: they are written as 0 and the RMS columns as
+    -9, which marks the rows as early-stop rows (see csv_hypodd.reloc_to_csv). The
+    origin times are not relocated: hypoDD writes the catalog origin times to the
+    snapshots and only applies its origin time shifts (src_t) to the final
+    hypoDD.reloc, so they can be off by the shift (typically tens of ms).
+    """
+    print("WARNING: origin times in the early-stop hypoDD.reloc are the catalog origin times (not relocated)")
+    with open(f'{run_dir}/{reloc_name}', 'w') as out:
+        for cluster, entry in sorted(history['clusters'].items()):
+            path = f'{run_dir}/{reloc_name}.{cluster:03d}.{entry["iterations"][-1]:03d}'
+            with open(path, 'r') as f:
+                for line in f:
+                    parts = line.split()
+                    out.write(' '.join(parts[:17] + ['0', '0', '0', '0', '-9', '-9', parts[17]]) + '\n')
+
+
+def history_arrays(history):
+    """History as flat arrays per cluster (keys c<CCC>_<name>), as stored by save_history."""
+    arrays = {}
+    for cluster, entry in sorted(history['clusters'].items()):
+        prefix = f'c{cluster:03d}_'
+        arrays[prefix + 'ids'] = np.asarray(entry['ids'])
+        arrays[prefix + 'iterations'] = np.asarray(entry['iterations'], dtype=np.int16)
+        arrays[prefix + 'xyz'] = np.stack(entry['xyz'])  # iteration x event x (x, y, z) [m]
+        arrays[prefix + 'geo'] = np.stack(entry['geo'])  # iteration x event x (lat, lon, depth)
+        for key in ('n_events', 'shift_rms', 'shift_p90', 'shift_max', 'rms_cc', 'rms_ct'):
+            arrays[prefix + key] = np.asarray(entry[key], dtype=np.float32)
+    if history['stopped']:
+        arrays['stopped'] = np.asarray(history['stopped'])
+    return arrays
+
+
+def save_history(history, path, remove_snapshots=None):
+    """
+    Save the convergence history as one compressed .npz file.
+
+    remove_snapshots : str, optional
+        Run directory whose hypoDD.reloc.CCC.III files are deleted once the file is written
+    """
+    np.savez_compressed(path, **history_arrays(history))
+    n_removed = 0
+    if remove_snapshots:
+        for _, _, snapshot in snapshot_files(remove_snapshots):
+            os.remove(snapshot)
+            n_removed += 1
+    print(f"✅ Convergence history of {len(history['clusters'])} clusters saved to {path}"
+          + (f" ({n_removed} snapshots removed)" if n_removed else ''))
+    return path
+
+
+def load_history(path):
+    """Load a saved history: {cluster: {name: array}}."""
+    clusters = {}
+    with np.load(path) as data:
+        for key in data.files:
+            if key.startswith('c') and '_' in key:
+                prefix, name = key.split('_', 1)
+                clusters.setdefault(int(prefix[1:]), {})[name] = data[key]
+    return clusters
+
+
+def print_history(history):
+    """Print one line per iteration and cluster."""
+    for cluster, entry in sorted(history['clusters'].items()):
+        print(f"Cluster {cluster}: {len(entry['ids'])} events")
+        print("   IT   EV  SHIFT_RMS  SHIFT_P90  SHIFT_MAX   RMSCC    RMSCT   (m, s)")
+        for k, iteration in enumerate(entry['iterations']):
+            print(f"  {iteration:3d} {entry['n_events'][k]:4d} {entry['shift_rms'][k]:10.1f} "
+                  f"{entry['shift_p90'][k]:10.1f} {entry['shift_max'][k]:10.1f} "
+                  f"{entry['rms_cc'][k]:8.4f} {entry['rms_ct'][k]:8.4f}")
+
+
+def run_watched(hypodd, inp_file, run_dir, stop_when=None, history_file=HISTORY_FILE, keep_snapshots=False,
+                poll=0.5):
+    """
+    Run hypoDD while tracking convergence, optionally stopping early.
+
+    Parameters:
+    -----------
+    hypodd : str
+        hypoDD binary
+    inp_file : str
+        Control file name (in run_dir)
+    stop_when : callable, optional
+        Stop rule, e.g. shift_below(1.0)
+    history_file : str
+        .npz file (in run_dir) for the convergence history
+    keep_snapshots : bool
+        Keep the hypoDD.reloc.CCC.III text files
+
+    Returns: (success, history)
+    """
+    # unbuffered Fortran units: hypoDD.log is written line by line, so snapshots are seen as soon as they close
+    env = {**os.environ, 'GFORTRAN_UNBUFFERED_ALL': 'y'}
+    # outputs of an earlier run would be taken for this run's
+    for old in [s[2] for s in snapshot_files(run_dir)] + [f'{run_dir}/hypoDD.log']:
+        if os.path.exists(old):
+            os.remove(old)
+    history = new_history()
+    history['cid'] = read_hypodd_inp(f'{run_dir}/{inp_file}').get('cid')  # CID > 0: a single cluster is relocated
+    with open(f'{run_dir}/hypoDD.stdout', 'w') as stdout:
+        process = subprocess.Popen([hypodd, inp_file], cwd=run_dir, stdout=stdout, stderr=subprocess.STDOUT, env=env)
+        history = watch_run(run_dir, process, callback=stop_when, poll=poll, history=history)
+    if history['stopped']:
+        write_stopped_reloc(history, run_dir)
+    elif process.returncode != 0:
+        print(f"hypoDD failed with code {process.returncode} (see {run_dir}/hypoDD.stdout)")
+        return False, history
+    if history['clusters']:
+        save_history(history, f'{run_dir}/{history_file}', remove_snapshots=None if keep_snapshots else run_dir)
+    return True, history
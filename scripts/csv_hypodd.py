@@ -7,60 +7,249 @@ import numpy as np
 import pandas as pd
 import re
 from datetime import datetime
+from hypodd_formats import write_dt_cc
+from hypodd_io import open_text, strip_compression
+from obs_budget import print_budget_report, select_observations
+from closure_qc import apply_closure_qc, print_closure_report
+from validate_inputs import read_inc_limits
 
 
-def create_station_file(station_csv, output_file):
+EARTH_RADIUS_KM = 6371.0
+
+# Cache for parsed input tables, installed by the warm daemon (see warm_daemon.py)
+_table_cache = None
+
+
+def set_table_cache(cache_get):
+    """Serve read_table from cache_get(key, loader) (None: always read the file)."""
+    global _table_cache
+    _table_cache = cache_get
+
+
+def read_table(path, **kwargs):
+    """
+    pd.read_csv through the table cache, if one is installed.
+
+    Entries are keyed by path, size, mtime and read options, so edited files are
+    re-read. Returns a copy that the caller may modify.
+    """
+    if _table_cache is None:
+        return pd.read_csv(path, **kwargs)
+    stat = os.stat(path)
+    key = ('csv', os.path.abspath(path), stat.st_size, stat.st_mtime_ns, repr(sorted(kwargs.items())))
+    return _table_cache(key, lambda: pd.read_csv(path, **kwargs)).copy()
+
+
+def read_ph2dt_inp(ph2dt_inp):
+    """
+    Read a ph2dt.inp control file.
+
+    Returns: dict with station_file, phase_file, minwght, maxdist, maxsep,
+             maxngh, minlnk, minobs, maxobs
+    """
+    with open(ph2dt_inp, 'r') as f:
+        lines = [line.strip() for line in f if not (line[:1] == '*' or line[1:2] == '*') and line.strip()]
+    # station file, phase file, then MINWGHT MAXDIST MAXSEP MAXNGH MINLNK MINOBS MAXOBS
+    values = lines[2].split()
+    params = {'station_file': lines[0], 'phase_file': lines[1]}
+    params.update(zip(['minwght', 'maxdist', 'maxsep'], map(float, values[:3])))
+    params.update(zip(['maxngh', 'minlnk', 'minobs', 'maxobs'], map(int, values[3:7])))
+    return params
+
+
+def ph2dt_station_radius(ph2dt_inp):
+    """
+    Station search radius (km) implied by a ph2dt.inp file.
+
+    ph2dt uses stations within MAXDIST of the centroid of an event pair, and
+    paired events are at most MAXSEP apart, so every station ph2dt can use lies
+    within MAXDIST + MAXSEP/2 of one of the events.
+    """
+    params = read_ph2dt_inp(ph2dt_inp)
+    return params['maxdist'] + params['maxsep'] / 2
+
+
+def _unit_vectors(lat, lon):
+    lat, lon = np.radians(np.asarray(lat, dtype=float)), np.radians(np.asarray(lon, dtype=float))
+    return np.column_stack([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)])
+
+
+def dedupe_stations(df, rule='latest'):
+    """
+    Keep one row per station code (ph2dt stops if a code is listed twice).
+
+    rule: 'latest' keeps the row with the latest end_date/start_date (the currently
+          operating station, falls back to 'first' without these columns);
+          'first' keeps the first row in the table.
+
+    Returns: (deduplicated DataFrame, DataFrame of dropped rows)
+    """
+    if rule not in ('latest', 'first'):
+        raise ValueError(f"Unknown station dedupe rule: {rule}")
+    order = np.arange(len(df))
+    if rule == 'latest' and {'start_date', 'end_date'} <= set(df.columns):
+        # blank end_date: the station is still operating
+        end = pd.to_datetime(df['end_date'], errors='coerce', utc=True, format='ISO8601').fillna(pd.Timestamp.max.tz_localize('UTC'))
+        start = pd.to_datetime(df['start_date'], errors='coerce', utc=True, format='ISO8601').fillna(pd.Timestamp.min.tz_localize('UTC'))
+        order = np.lexsort((order, -start.astype('int64').to_numpy(), -end.astype('int64').to_numpy()))
+    ranked = df.iloc[order]
+    keep = ~ranked['station'].duplicated(keep='first').to_numpy()
+    kept = ranked[keep].sort_index()
+    return kept, ranked[~keep].sort_index()
+
+
+def select_stations(station_csv, csv_file=None, catalog_info=None, max_dist_km=None, dedupe='latest'):
+    """
+    Select the stations to write to station.dat.
+
+    Parameters:
+    -----------
+    station_csv : str or DataFrame
+        Station table (station, latitude, longitude, elevation, optional network/start_date/end_date)
+    csv_file : str or DataFrame, optional
+        Detection picks. Only stations with picks are kept
+    catalog_info : dict, optional
+        Output of load_catalog. With max_dist_km, only stations within max_dist_km
+        of at least one event location (events and templates in csv_file) are kept
+    max_dist_km : float, optional
+        Station search radius (see ph2dt_station_radius)
+    dedupe : str
+        Rule for station codes shared by several networks (see dedupe_stations)
+
+    Returns: DataFrame of selected stations (input order)
+    """
+    df = read_table(station_csv) if isinstance(station_csv, str) else station_csv.copy()
+    df['station'] = df['station'].astype(str)
+    n_input = len(df)
+
+    df, dropped = dedupe_stations(df, dedupe)
+    if len(dropped):
+        label = dropped['network'].astype(str) + '.' + dropped['station'] if 'network' in dropped else dropped['station']
+        print(f"Dropped {len(dropped)} duplicate station codes (rule: {dedupe}): {', '.join(label.iloc[:10])}"
+              + (' ...' if len(dropped) > 10 else ''))
+
+    picks = None
+    if csv_file is not None:
+        picks = read_table(csv_file) if isinstance(csv_file, str) else csv_file
+        with_picks = df['station'].isin(picks['station'].astype(str).unique()).to_numpy()
+        print(f"Stations with picks: {with_picks.sum()} of {len(df)}")
+        df = df[with_picks]
+
+    if max_dist_km is not None and catalog_info:
+        from scipy.spatial import cKDTree
+
+        if picks is not None:
+            ids = pd.unique(pd.concat([picks['event_id'], picks['template_id']]).astype(str))
+            locs = [catalog_info[i] for i in ids if i in catalog_info]
+        else:
+            locs = list(catalog_info.values())
+        if locs:
+            events = _unit_vectors([c['lat'] for c in locs], [c['lon'] for c in locs])
+            chord, _ = cKDTree(events).query(_unit_vectors(df['latitude'], df['longitude']), k=1)
+            # Great-circle distance to the nearest event
+            dist_km = 2 * EARTH_RADIUS_KM * np.arcsin(np.clip(chord / 2, 0, 1))
+            near = dist_km <= max_dist_km
+            print(f"Stations within {max_dist_km:g} km of an event: {near.sum()} of {len(df)}")
+            df = df[near]
+
+    print(f"Selected {len(df)} of {n_input} stations")
+    return df
+
+
+def create_station_file(station_csv, output_file, csv_file=None, catalog_info=None, max_dist_km=None, dedupe='latest'):
     """
     Create HypoDD station file from station CSV.
     
     Format: STA LAT LON ELV
+
+    Stations are deduplicated by code and optionally restricted to stations with
+    picks and within max_dist_km of the events (see select_stations).
+
+    Returns: DataFrame of the written stations
     """
-    df = pd.read_csv(station_csv)
-    
-    with open(output_file, 'w') as f:
-        for _, row in df.iterrows():
-            # Station code, lat, lon, elevation (in meters)
-            f.write(f"{row['station']:7s} {row['latitude']:9.5f} {row['longitude']:10.5f} {row['elevation']:6.1f}\n")
-    
+    df = select_stations(station_csv, csv_file, catalog_info, max_dist_km, dedupe)
+
+    # Station code, lat, lon, elevation (in meters)
+    table = df[['station', 'latitude', 'longitude', 'elevation']].to_numpy(dtype=object)
+    np.savetxt(output_file, table, fmt='%-7s %9.5f %10.5f %6.1f')
+
     print(f"Created station file: {output_file} with {len(df)} stations")
 
+    limit = read_inc_limits().get('MAXSTA', 400)
+    if len(df) > limit:
+        print(f"WARNING: {len(df)} stations exceed MAXSTA={limit} of hypoDD; pass csv_file/max_dist_km to reduce")
+    return df
+
 
-def load_catalog(catalog_csv):
+def load_catalog(catalog_csv, event_ids=None, time_range=None, bbox=None):
     """
     Load catalog from Yoon & Shelly CSV into dict format.
+
+    catalog_csv: catalog CSV or a Parquet store directory (see catalog_store.build_catalog_store).
+                 With a store, the filters are pushed down and only matching row groups are read.
+    event_ids: only load these events (e.g. events and templates of the detection CSV)
+    time_range: (start, end) origin-time window
+    bbox: (lat_min, lat_max, lon_min, lon_max)
     
     Returns: dict {event_id: {'lat': x, 'lon': y, 'depth': z, 'mag': m, 'eh': ex, 'ez': ez}}
     """
-    df = pd.read_csv(catalog_csv)
-    catalog = {}
-    
-    for _, row in df.iterrows():
-        event_id = str(row['event_id'])
-        catalog[event_id] = {
-            'lat': row['latitude'],
-            'lon': row['longitude'],
-            'depth': row['depth'],
-            'mag': row['magnitude'],
-            # Use uncertainties if available, otherwise 0.0
-            'eh': row.get('uncertainty_x', 0.0) if pd.notna(row.get('uncertainty_x')) else 0.0,
-            'ez': row.get('uncertainty_z', 0.0) if pd.notna(row.get('uncertainty_z')) else 0.0
-        }
+    if os.path.isdir(catalog_csv):
+        from catalog_store import query_catalog
+        df = query_catalog(catalog_csv, event_ids, time_range, bbox)
+    else:
+        df = read_table(catalog_csv, dtype={'event_id': str})
+        mask = np.ones(len(df), dtype=bool)
+        if event_ids is not None:
+            mask &= df['event_id'].isin([str(e) for e in event_ids]).to_numpy()
+        if time_range is not None:
+            t = pd.to_datetime(df['origin_time'], format='ISO8601', utc=True)
+            start, end = pd.to_datetime(list(time_range), utc=True, format='ISO8601')
+            mask &= ((t >= start) & (t <= end)).to_numpy()
+        if bbox is not None:
+            mask &= (df['latitude'].between(bbox[0], bbox[1]) & df['longitude'].between(bbox[2], bbox[3])).to_numpy()
+        df = df[mask]
+
+    # Use uncertainties if available, otherwise 0.0
+    zeros = pd.Series(0.0, index=df.index)
+    eh = df['uncertainty_x'].fillna(0.0) if 'uncertainty_x' in df else zeros
+    ez = df['uncertainty_z'].fillna(0.0) if 'uncertainty_z' in df else zeros
+    catalog = {
+        str(event_id): {'lat': lat, 'lon': lon, 'depth': depth, 'mag': mag, 'eh': ex, 'ez': ezz}
+        for event_id, lat, lon, depth, mag, ex, ezz in zip(
+            df['event_id'], df['latitude'].tolist(), df['longitude'].tolist(), df['depth'].tolist(),
+            df['magnitude'].tolist(), eh.tolist(), ez.tolist())
+    }
     
     print(f"Loaded catalog with {len(catalog)} events")
     return catalog
 
 
-def create_event_id_mapping(csv_file, output_file='event_id_mapping.csv'):
+def detection_event_ids(csv_file):
+    """Original IDs of all events and templates in a detection CSV (the catalog entries csv_to_pha can use)."""
+    df = read_table(csv_file, usecols=['event_id', 'template_id'], dtype=str)
+    return pd.unique(pd.concat([df['event_id'], df['template_id']]))
+
+
+def create_event_id_mapping(csv_file, output_file='event_id_mapping.csv', registry_file=None):
     """
     Create mapping between original event_ids and synthetic integer IDs.
+
+    registry_file: persistent event registry (see event_registry.py). Events already
+                   in it keep their IDs and new events get the next free IDs, so IDs
+                   are stable across runs and partitions. Without it, IDs are numbered
+                   from 100,000 in CSV order.
     
     Returns: dict {original_event_id: synthetic_id}
     """
-    df = pd.read_csv(csv_file)
+    df = read_table(csv_file)
     unique_events = df['event_id'].unique()
     
-    # Generate synthetic IDs (starting from 100,000)
-    synthetic_ids = np.arange(100000, 100000 + len(unique_events))
+    if registry_file is not None:
+        from event_registry import register_events
+        synthetic_ids = register_events(registry_file, unique_events)
+    else:
+        # Generate synthetic IDs (starting from 100,000)
+        synthetic_ids = np.arange(100000, 100000 + len(unique_events))
     mapping_df = pd.DataFrame({
         'original_id': unique_events,
         'synthetic_id': synthetic_ids
@@ -68,12 +257,23 @@ def create_event_id_mapping(csv_file, output_file='event_id_mapping.csv'):
     mapping_df.to_csv(output_file, index=False)
     
     print(f"Created event ID mapping: {output_file}")
-    print(f"Mapped {len(mapping_df)} events (IDs: 100000 to {100000 + len(mapping_df) - 1})")
+    if len(mapping_df):
+        print(f"Mapped {len(mapping_df)} events (IDs: {synthetic_ids.min()} to {synthetic_ids.max()})")
 
     # Return as dict {original_event_id: synthetic_id}
     return mapping_df.set_index('original_id')['synthetic_id'].to_dict()
 
 
+def load_event_id_mapping(mapping_file):
+    """
+    Load an event_id_mapping.csv written by create_event_id_mapping.
+
+    Returns: dict {original_event_id: synthetic_id}
+    """
+    mapping_df = read_table(mapping_file)
+    return mapping_df.set_index('original_id')['synthetic_id'].to_dict()
+
+
 def csv_to_pha(csv_file, output_file, catalog_info=None, event_id_mapping=None, apply_lag_correction=False):
     """
     Convert CSV to .pha format.
@@ -85,11 +285,12 @@ def csv_to_pha(csv_file, output_file, catalog_info=None, event_id_mapping=None,
     event_id_mapping: dict {original_event_id: synthetic_id} or None
     apply_lag_correction: If True, apply lag times to detected event travel times
                          (for catalog-only relocation method). Template events remain unchanged.
+    output_file may end in .gz or .zst (compressed while writing).
     """
-    df = pd.read_csv(csv_file)
+    df = read_table(csv_file)
     unique_events = df['event_id'].unique()
     
-    with open(output_file, 'w') as f:
+    with open_text(output_file, 'w') as f:
         for event in unique_events:
             event_data = df[df['event_id'] == event].iloc[0]
             
@@ -136,8 +337,10 @@ def csv_to_pha(csv_file, output_file, catalog_info=None, event_id_mapping=None,
             f.write(f"#{yr:5d} {mo:2d} {dy:2d} {hr:2d} {mn:2d} {sc:5.2f} "
                    f"{lat:8.4f} {lon:9.4f} {depth:7.2f}{mag:6.2f}{eh:6.2f}{ez:6.2f}{0.0:6.2f} {event_id:10d}\n")
             
-            # Write phase picks: STA TT WGHT PHA
+            # Write phase picks: STA TT WGHT PHA (once per station and phase: merged duplicate
+            # detections carry the picks of several templates, the first row wins)
             picks = df[df['event_id'] == event]
+            written = set()
             for _, pick in picks.iterrows():
                 station = pick['station']
                 
@@ -145,7 +348,8 @@ def csv_to_pha(csv_file, output_file, catalog_info=None, event_id_mapping=None,
                 is_detected_event = str(event) != str(pick['template_id'])
                 
                 # P-phase pick
-                if pd.notna(pick['travel_time_p']):
+                if pd.notna(pick['travel_time_p']) and (station, 'P') not in written:
+                    written.add((station, 'P'))
                     tt_p = pick['travel_time_p']
                     
                     # Apply lag correction for detected events if requested
@@ -157,7 +361,8 @@ def csv_to_pha(csv_file, output_file, catalog_info=None, event_id_mapping=None,
                     f.write(f"{station:7s} {tt_p:8.3f} {wght:6.3f} P\n")
                 
                 # S-phase pick
-                if pd.notna(pick['travel_time_s']):
+                if pd.notna(pick['travel_time_s']) and (station, 'S') not in written:
+                    written.add((station, 'S'))
                     tt_s = pick['travel_time_s']
                     
                     # Apply lag correction for detected events if requested
@@ -170,50 +375,88 @@ def csv_to_pha(csv_file, output_file, catalog_info=None, event_id_mapping=None,
     print(f"Created {output_file} with {len(unique_events)} events")
 
 
-def csv_to_cc(csv_file, output_file, min_cc=0.0, event_id_mapping=None):
+def cc_observations(csv_file, min_cc=0.0, event_id_mapping=None):
     """
-    Convert CSV to .cc format.
-    
-    Format: # ID1 ID2 OTC
-            STA DT WGHT PHA
-    
-    min_cc: minimum CC threshold
-    event_id_mapping: dict {original_event_id: synthetic_id} or None to auto-generate
+    Long-form table of the cross-correlation observations written to .cc.
+
+    One row per (detection, template, station, phase) with a lag and CC >= min_cc,
+    in .cc order: pairs by first appearance, picks in CSV order, P before S.
+
+    Returns: DataFrame with id1, id2, event_id, template_id, station, phase, dt, weight
     """
-    df = pd.read_csv(csv_file)
+    df = read_table(csv_file) if isinstance(csv_file, str) else csv_file
     detections = df[df['event_id'] != df['template_id']]
     
     if len(detections) == 0:
         detections = df.copy()
     
-    pairs = detections[['event_id', 'template_id']].drop_duplicates()
-    
     # Create mapping if not provided
     if event_id_mapping is None:
         all_events = pd.concat([detections['event_id'], detections['template_id']]).unique()
         event_id_mapping = {event: i for i, event in enumerate(all_events, start=1)}
+
+    pair_order = pd.factorize(pd.MultiIndex.from_frame(detections[['event_id', 'template_id']]))[0]
+    # merged duplicate detections (detection_dedupe): lags are relative to the detection's own origin time
+    shift = detections['origin_shift_s'].fillna(0.0) if 'origin_shift_s' in detections else 0.0
+    phases = []
+    for phase, pha in ((0, 'p'), (1, 's')):
+        valid = (detections[f'lag_time_{pha}'].notna() & detections[f'cc_{pha}'].notna()
+                 & (detections[f'cc_{pha}'] >= min_cc)).to_numpy()
+        phases.append(pd.DataFrame({
+            'pair': pair_order[valid],
+            'row': np.flatnonzero(valid),
+            'phase_order': phase,
+            'event_id': detections['event_id'].to_numpy()[valid],
+            'template_id': detections['template_id'].to_numpy()[valid],
+            'station': detections['station'].astype(str).to_numpy()[valid],
+            'phase': pha.upper(),
+            'dt': (detections[f'lag_time_{pha}'] + shift).to_numpy(dtype=float)[valid],
+            'weight': detections[f'cc_{pha}'].to_numpy(dtype=float)[valid],
+        }))
+    obs = pd.concat(phases, ignore_index=True).sort_values(['pair', 'row', 'phase_order'], kind='stable')
+
+    id1 = obs['event_id'].map(event_id_mapping)
+    id2 = obs['template_id'].map(event_id_mapping)
+    unmapped = id1.isna() | id2.isna()
+    if unmapped.any():
+        missing = pd.unique(pd.concat([obs.loc[id1.isna(), 'event_id'], obs.loc[id2.isna(), 'template_id']]))
+        raise KeyError(f"Events missing from event_id_mapping: {list(missing[:5])}")
+    obs.insert(0, 'id2', id2.astype(np.int64))
+    obs.insert(0, 'id1', id1.astype(np.int64))
+    return obs.drop(columns=['pair', 'row', 'phase_order']).reset_index(drop=True)
+
+
+def csv_to_cc(csv_file, output_file, min_cc=0.0, event_id_mapping=None,
+              max_obs_per_event=None, max_obs_total=None, station_csv=None, catalog_info=None, n_az_bins=8,
+              closure_tol=None, closure_mode='drop'):
+    """
+    Convert CSV to .cc format.
     
-    with open(output_file, 'w') as f:
-        for _, pair in pairs.iterrows():
-            picks = detections[(detections['event_id'] == pair['event_id']) & 
-                             (detections['template_id'] == pair['template_id'])]
-            
-            # Get synthetic IDs
-            id1 = event_id_mapping[pair['event_id']]
-            id2 = event_id_mapping[pair['template_id']]
-            
-            # Collect valid picks
-            valid_picks = []
-            for _, pick in picks.iterrows():
-                if pd.notna(pick['lag_time_p']) and pd.notna(pick['cc_p']) and pick['cc_p'] >= min_cc:
-                    valid_picks.append((pick['station'], pick['lag_time_p'], pick['cc_p'], 'P'))
-                if pd.notna(pick['lag_time_s']) and pd.notna(pick['cc_s']) and pick['cc_s'] >= min_cc:
-                    valid_picks.append((pick['station'], pick['lag_time_s'], pick['cc_s'], 'S'))
-            
-            if valid_picks:
-                f.write(f"# {id1:9d} {id2:9d} 0.000000\n")
-                for sta, dt, wght, pha in valid_picks:
-                    f.write(f"{sta:7s} {dt:9.6f} {wght:5.3f} {pha}\n")
+    Format: # ID1 ID2 OTC
+            STA DT WGHT PHA
+    
+    min_cc: minimum CC threshold
+    event_id_mapping: dict {original_event_id: synthetic_id} or None to auto-generate
+    max_obs_per_event, max_obs_total: observation budgets (see obs_budget.select_observations);
+                         station_csv and catalog_info give the azimuths used to spread the
+                         per-event selection over the stations
+    closure_tol: triplet closure tolerance (s) or None to skip the check; observations
+                 violating most of their station/phase triangles are dropped or, with
+                 closure_mode='downweight', down-weighted (see closure_qc.apply_closure_qc)
+    output_file may end in .gz or .zst (compressed while writing).
+    """
+    obs = cc_observations(csv_file, min_cc, event_id_mapping)
+
+    if closure_tol is not None:
+        obs, report = apply_closure_qc(obs, tol=closure_tol, mode=closure_mode)
+        print_closure_report(report)
+
+    if max_obs_per_event is not None or max_obs_total is not None:
+        stations = read_table(station_csv) if isinstance(station_csv, str) else station_csv
+        obs, report = select_observations(obs, stations, catalog_info, max_obs_per_event, max_obs_total, n_az_bins)
+        print_budget_report(report)
+
+    write_dt_cc(obs, output_file)
     
     print(f"Created {output_file}")
 
@@ -225,7 +468,7 @@ def reloc_to_csv(reloc_file, output_dir=None, method_suffix='', event_id_mapping
     Parameters:
     -----------
     reloc_file : str
-        Path to the hypoDD.reloc file
+        Path to the hypoDD.reloc file (plain, .gz or .zst)
     output_dir : str, optional
         Directory to save the CSV file. Default: '../data/hypoDD_outputs'
     method_suffix : str, optional
@@ -250,7 +493,7 @@ def reloc_to_csv(reloc_file, output_dir=None, method_suffix='', event_id_mapping
     # Read the relocation file
     # Format: ID LAT LON DEPTH X Y Z EX EY EZ YR MO DY HR MI SC MAG NCCP NCCS NCTP NCTS RCC RCT CID
     data = []
-    with open(reloc_file, 'r') as f:
+    with open_text(reloc_file, 'r') as f:
         for line in f:
             parts = line.split()
             if len(parts) >= 24:  # Full format
@@ -292,7 +535,7 @@ def reloc_to_csv(reloc_file, output_dir=None, method_suffix='', event_id_mapping
     
     # Map HypoDD IDs back to original event IDs if mapping file provided
     if event_id_mapping_file and os.path.exists(event_id_mapping_file):
-        mapping_df = pd.read_csv(event_id_mapping_file)
+        mapping_df = read_table(event_id_mapping_file)
         
         # Try both old and new column naming conventions
         if 'synthetic_id' in mapping_df.columns and 'original_id' in mapping_df.columns:
@@ -322,9 +565,15 @@ def reloc_to_csv(reloc_file, output_dir=None, method_suffix='', event_id_mapping
                    f"{int(row['hour']):02d}:{int(row['minute']):02d}:{row['second']:06.3f}Z",
         axis=1
     )
+    # Rows written by convergence.write_stopped_reloc after an early stop (no counts, RMS -9)
+    # keep the catalog origin time
+    stopped = (df[['n_cc_p', 'n_cc_s', 'n_cat_p', 'n_cat_s']].sum(axis=1) == 0) & (df['rms_cc'] == -9) & (df['rms_cat'] == -9)
+    df['origin_time_relocated'] = ~stopped
+    if stopped.any():
+        print(f"WARNING: {stopped.sum()} events from an early-stopped run keep their catalog origin time")
     
     # Generate output filename
-    base_name = os.path.basename(reloc_file).replace('.reloc', '')
+    base_name = os.path.basename(strip_compression(reloc_file)).replace('.reloc', '')
     output_file = os.path.abspath(f'{output_dir}/{base_name}{method_suffix}.csv')
     
     # Save to CSV
@@ -0,0 +1,273 @@
+"""
+Level-of-detail plots of relocated catalogs (map view and depth sections).
+
+Events are binned once into a pyramid of 2D histograms (finest level first,
+each coarser level sums 2x2 bins), built in chunks so memory stays bounded
+for any catalog size, and cached as .npz. Rendering picks the pyramid level
+that matches the visible range; individual events are only read and drawn
+when the view contains few enough of them.
+
+Input is a reloc_to_csv output (hypoDD.csv) or a DataFrame with latitude,
+longitude and depth. matplotlib is imported on use.
+"""
+import hashlib
+import json
+import os
+import numpy as np
+import pandas as pd
+
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+TILE_CACHE = os.path.abspath(f'{script_dir}/../data/plot_cache')
+EARTH_RADIUS_KM = 6371.0
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Great-circle distance in km (element-wise, broadcasts)."""
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(v, dtype=float)) for v in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+
+def section_view(start, end, width_km):
+    """
+    Cross-section view along the line start -> end ((lat, lon) tuples).
+
+    Events within width_km of the line are projected to (distance along the line, depth).
+    """
+    return {'kind': 'section', 'start': list(start), 'end': list(end), 'width_km': float(width_km)}
+
+
+# x/y columns of the simple views
+VIEWS = {
+    'map': ('longitude', 'latitude'),
+    'lon_depth': ('longitude', 'depth'),
+    'lat_depth': ('latitude', 'depth'),
+}
+
+
+def _view_spec(view):
+    return {'kind': view} if isinstance(view, str) else view
+
+
+def _project(chunk, view):
+    """x, y of the events of a chunk in a view (events outside a section's width are dropped)."""
+    view = _view_spec(view)
+    if view['kind'] in VIEWS:
+        x_col, y_col = VIEWS[view['kind']]
+        return chunk[x_col].to_numpy(dtype=float), chunk[y_col].to_numpy(dtype=float)
+
+    (lat0, lon0), (lat1, lon1) = view['start'], view['end']
+    scale = np.radians(1.0) * EARTH_RADIUS_KM
+    coslat = np.cos(np.radians((lat0 + lat1) / 2))
+    ex, ny = (lon1 - lon0) * coslat * scale, (lat1 - lat0) * scale
+    length = np.hypot(ex, ny)
+    ux, uy = ex / length, ny / length
+    px = (chunk['longitude'].to_numpy(dtype=float) - lon0) * coslat * scale
+    py = (chunk['latitude'].to_numpy(dtype=float) - lat0) * scale
+    along, across = px * ux + py * uy, px * uy - py * ux
+    keep = (np.abs(across) <= view['width_km']) & (along >= 0) & (along <= length)
+    return along[keep], chunk['depth'].to_numpy(dtype=float)[keep]
+
+
+def _chunks(reloc, chunksize, columns=('latitude', 'longitude', 'depth')):
+    if isinstance(reloc, pd.DataFrame):
+        for start in range(0, len(reloc), chunksize):
+            yield reloc.iloc[start:start + chunksize]
+    else:
+        yield from pd.read_csv(reloc, usecols=list(columns), chunksize=chunksize)
+
+
+def _source_key(reloc):
+    if isinstance(reloc, pd.DataFrame):
+        cols = reloc[['latitude', 'longitude', 'depth']]
+        return {'frame': int(pd.util.hash_pandas_object(cols, index=False).sum() % (2 ** 63)), 'n': len(reloc)}
+    stat = os.stat(reloc)
+    return {'file': os.path.abspath(reloc), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def build_tiles(reloc, view='map', bounds=None, base_bins=2048, min_bins=32, chunksize=1000000,
+                cache_dir=TILE_CACHE):
+    """
+    Bin a catalog into a multi-resolution histogram pyramid (cached).
+
+    Parameters:
+    -----------
+    reloc : str or DataFrame
+        hypoDD.csv (read in chunks) or DataFrame with latitude, longitude, depth
+    view : str or dict
+        'map', 'lon_depth', 'lat_depth' or section_view(...)
+    bounds : (xmin, xmax, ymin, ymax), optional
+        Histogram extent. Default: data extent (one extra pass)
+    base_bins : int
+        Bins per axis of the finest level (power of two)
+    min_bins : int
+        Bins per axis of the coarsest level
+    chunksize : int
+        Rows binned at a time
+    cache_dir : str or None
+        Directory for the .npz cache (None disables caching)
+
+    Returns: dict with 'view', 'bounds', 'n_events' and 'levels' (list of count arrays [x, y], finest first)
+    """
+    spec = _view_spec(view)
+    key = hashlib.sha256(json.dumps({'source': _source_key(reloc), 'view': spec,
+                                     'bounds': list(bounds) if bounds is not None else None,
+                                     'base_bins': base_bins, 'min_bins': min_bins}, sort_keys=True).encode()).hexdigest()
+    cache_file = f'{cache_dir}/tiles_{key[:20]}.npz' if cache_dir else None
+    if cache_file and os.path.exists(cache_file):
+        with np.load(cache_file) as data:
+            levels = [data[f'level_{i}'] for i in range(int(data['n_levels']))]
+            return {'view': spec, 'bounds': tuple(data['bounds'].tolist()), 'n_events': int(data['n_events']),
+                    'levels': levels}
+
+    if bounds is None:
+        lo, hi = np.array([np.inf, np.inf]), np.array([-np.inf, -np.inf])
+        for chunk in _chunks(reloc, chunksize):
+            x, y = _project(chunk, spec)
+            if len(x):
+                lo = np.minimum(lo, [x.min(), y.min()])
+                hi = np.maximum(hi, [x.max(), y.max()])
+        if not np.isfinite(lo).all():
+            print(f"WARNING: no events in view {spec}; using unit bounds")
+            lo, hi = np.array([0.0, 0.0]), np.array([1.0, 1.0])
+        pad = np.maximum((hi - lo) * 1e-6, 1e-9)
+        bounds = (float(lo[0] - pad[0]), float(hi[0] + pad[0]), float(lo[1] - pad[1]), float(hi[1] + pad[1]))
+
+    counts = np.zeros((base_bins, base_bins), dtype=np.int64)
+    edges = (np.linspace(bounds[0], bounds[1], base_bins + 1), np.linspace(bounds[2], bounds[3], base_bins + 1))
+    for chunk in _chunks(reloc, chunksize):
+        x, y = _project(chunk, spec)
+        counts += np.histogram2d(x, y, bins=edges)[0].astype(np.int64)
+
+    levels = [counts]
+    while levels[-1].shape[0] > min_bins:
+        c = levels[-1]
+        levels.append(c.reshape(c.shape[0] // 2, 2, c.shape[1] // 2, 2).sum(axis=(1, 3)))
+
+    if cache_file:
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp = f'{cache_file}.tmp.npz'
+        np.savez_compressed(tmp, n_levels=len(levels), n_events=int(counts.sum()), bounds=np.asarray(bounds),
+                            **{f'level_{i}': lv for i, lv in enumerate(levels)})
+        os.replace(tmp, cache_file)
+    print(f"Binned {int(counts.sum())} events into {len(levels)} levels ({base_bins}-{levels[-1].shape[0]} bins)")
+    return {'view': spec, 'bounds': tuple(bounds), 'n_events': int(counts.sum()), 'levels': levels}
+
+
+def _visible(tiles, level, xlim, ylim):
+    """Bin index ranges of a level inside xlim/ylim."""
+    counts = tiles['levels'][level]
+    x0, x1, y0, y1 = tiles['bounds']
+    nx, ny = counts.shape
+    ix = np.clip([int(np.floor((xlim[0] - x0) / (x1 - x0) * nx)), int(np.ceil((xlim[1] - x0) / (x1 - x0) * nx))], 0, nx)
+    iy = np.clip([int(np.floor((ylim[0] - y0) / (y1 - y0) * ny)), int(np.ceil((ylim[1] - y0) / (y1 - y0) * ny))], 0, ny)
+    return ix, iy
+
+
+def choose_level(tiles, xlim, ylim, target_bins=512):
+    """Finest pyramid level with at most target_bins visible bins along each axis."""
+    for level in range(len(tiles['levels'])):
+        ix, iy = _visible(tiles, level, xlim, ylim)
+        if max(ix[1] - ix[0], iy[1] - iy[0]) <= target_bins:
+            return level
+    return len(tiles['levels']) - 1
+
+
+def count_in_view(tiles, xlim, ylim):
+    """Upper bound of the number of events in the view (from the finest level)."""
+    ix, iy = _visible(tiles, 0, xlim, ylim)
+    return int(tiles['levels'][0][ix[0]:ix[1], iy[0]:iy[1]].sum())
+
+
+def points_in_view(reloc, view, xlim, ylim, chunksize=1000000):
+    """x, y (and depth) of the events inside the view, read chunk by chunk."""
+    xs, ys, zs = [], [], []
+    for chunk in _chunks(reloc, chunksize):
+        spec = _view_spec(view)
+        x, y = _project(chunk, spec)
+        depth = chunk['depth'].to_numpy(dtype=float)
+        if spec['kind'] == 'section':
+            depth = y
+        keep = (x >= xlim[0]) & (x <= xlim[1]) & (y >= ylim[0]) & (y <= ylim[1])
+        xs.append(x[keep])
+        ys.append(y[keep])
+        zs.append(depth[keep])
+    return np.concatenate(xs), np.concatenate(ys), np.concatenate(zs)
+
+
+def render(ax, reloc, tiles, xlim=None, ylim=None, max_points=20000, target_bins=512, cmap='viridis', **scatter_kw):
+    """
+    Draw a view of the catalog on a matplotlib axis.
+
+    Shows individual events (colored by depth) when at most max_points fall
+    inside xlim/ylim, otherwise the matching histogram level (log color scale).
+    scatter_kw go to ax.scatter; for the histogram, label, alpha and zorder go to
+    ax.imshow and a label also adds a legend entry.
+
+    Returns: the matplotlib artist (for a colorbar)
+    """
+    from matplotlib.colors import LogNorm
+
+    x0, x1, y0, y1 = tiles['bounds']
+    xlim = xlim or (x0, x1)
+    ylim = ylim or (y0, y1)
+
+    if count_in_view(tiles, xlim, ylim) <= max_points:
+        x, y, depth = points_in_view(reloc, tiles['view'], xlim, ylim)
+        artist = ax.scatter(x, y, c=depth, cmap=cmap, s=scatter_kw.pop('s', 4), **scatter_kw)
+    else:
+        level = choose_level(tiles, xlim, ylim, target_bins)
+        counts = tiles['levels'][level]
+        ix, iy = _visible(tiles, level, xlim, ylim)
+        nx, ny = counts.shape
+        sub = counts[ix[0]:ix[1], iy[0]:iy[1]].T.astype(float)
+        sub[sub == 0] = np.nan
+        extent = (x0 + ix[0] * (x1 - x0) / nx, x0 + ix[1] * (x1 - x0) / nx,
+                  y0 + iy[0] * (y1 - y0) / ny, y0 + iy[1] * (y1 - y0) / ny)
+        image_kw = {k: scatter_kw[k] for k in ('label', 'alpha', 'zorder') if k in scatter_kw}
+        artist = ax.imshow(sub, origin='lower', extent=extent, aspect='auto', cmap=cmap,
+                           norm=LogNorm(vmin=1, vmax=max(np.nanmax(sub) if np.isfinite(sub).any() else 1, 1)),
+                           interpolation='nearest', **image_kw)
+        if 'label' in image_kw:
+            # images are not legend handles: add an empty patch in the colormap's color
+            from matplotlib.patches import Rectangle
+            ax.add_patch(Rectangle((extent[0], extent[2]), 0, 0, color=artist.cmap(0.75), label=image_kw['label']))
+    ax.set_xlim(*xlim)
+    if tiles['view']['kind'] == 'map':
+        ax.set_ylim(*ylim)
+    else:
+        ax.set_ylim(ylim[1], ylim[0])  # depth increases downward
+    return artist
+
+
+def map_figure(reloc, xlim=None, ylim=None, sections=(), max_points=20000, cache_dir=TILE_CACHE, figsize=(14, 8)):
+    """
+    Map view plus depth sections of a relocated catalog.
+
+    sections: section_view(...) dicts; default longitude-depth and latitude-depth sections
+    Returns: matplotlib Figure
+    """
+    import matplotlib.pyplot as plt
+
+    views = ['map'] + (list(sections) or ['lon_depth', 'lat_depth'])
+    fig, axes = plt.subplots(1, len(views), figsize=figsize, squeeze=False)
+    labels = {'map': ('Longitude', 'Latitude'), 'lon_depth': ('Longitude', 'Depth (km)'),
+              'lat_depth': ('Latitude', 'Depth (km)'), 'section': ('Distance along section (km)', 'Depth (km)')}
+    for ax, view in zip(axes[0], views):
+        tiles = build_tiles(reloc, view, cache_dir=cache_dir)
+        kind = _view_spec(view)['kind']
+        if kind == 'map':
+            view_xlim, view_ylim = xlim, ylim
+        elif kind == 'lon_depth':
+            view_xlim, view_ylim = xlim, None
+        elif kind == 'lat_depth':
+            view_xlim, view_ylim = ylim, None
+        else:
+            view_xlim, view_ylim = None, None
+        artist = render(ax, reloc, tiles, view_xlim, view_ylim, max_points=max_points)
+        ax.set_xlabel(labels[kind][0])
+        ax.set_ylabel(labels[kind][1])
+        fig.colorbar(artist, ax=ax, label='Depth (km)' if artist.__class__.__name__ == 'PathCollection' else 'Events per bin')
+    fig.tight_layout()
+    return fig
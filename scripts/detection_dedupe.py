@@ -0,0 +1,174 @@
+"""
+Merge detections of the same earthquake by different templates.
+
+With many templates, one earthquake is often detected several times: rows with
+different template_id and event_id but nearly the same origin_time. Converted
+as they are, these become separate hypoDD events with identical picks, which
+inflates the event count, the pairs and the hypoDD cost.
+
+find_duplicates() sorts the detected events by origin time and joins every
+event to its predecessor in time (a sorted as-of join with a tolerance, done
+as a difference of the sorted times). Events closer than the tolerance form a
+cluster. Clusters that span more than the tolerance (chains of separate
+events) or contain a template twice (one template detecting two events) are
+ambiguous and left alone. In every other cluster the detection with the best
+mean CC becomes the canonical event. merge_duplicate_detections() relabels
+the other detections to it and shifts their picks to the canonical origin
+time, so each merged detection becomes one more template link of the
+canonical event in .cc instead of a separate event.
+"""
+import numpy as np
+import pandas as pd
+from csv_hypodd import read_table
+
+
+DUPLICATE_TOL_S = 2.0   # origin times of one earthquake differ by the template location errors
+ORIGIN_SHIFT = 'origin_shift_s'  # column: origin time of the detection minus the canonical origin time
+
+
+def detected_events(df):
+    """
+    One row per detected event (event_id != template_id).
+
+    Returns: DataFrame with event_id, origin_time (as in the CSV), time (UTC), cc (mean
+             CC of its picks) and n_picks, in order of first appearance
+    """
+    det = df[df['event_id'] != df['template_id']]
+    cc = det[['cc_p', 'cc_s']].mean(axis=1)
+    events = det.assign(cc=cc).groupby('event_id', sort=False).agg(
+        origin_time=('origin_time', 'first'), cc=('cc', 'mean'), n_picks=('station', 'size')).reset_index()
+    events['time'] = pd.to_datetime(events['origin_time'], errors='coerce', utc=True, format='ISO8601')
+    return events
+
+
+def find_duplicates(df, tol_s=DUPLICATE_TOL_S):
+    """
+    Detected events that are the same earthquake as a better detection.
+
+    Parameters:
+    -----------
+    df : DataFrame
+        Detection phase picks (event_id, template_id, origin_time, station, cc_p, cc_s, ...)
+    tol_s : float
+        Max. origin time difference (s) between detections of one earthquake (None: merge nothing)
+
+    Returns:
+    --------
+    (DataFrame with event_id, canonical_id, canonical_time, shift_s = origin time minus the
+     canonical origin time, one row per merged detection; number of ambiguous clusters)
+    """
+    events = detected_events(df)
+    events = events[events['time'].notna()]
+    columns = ['event_id', 'canonical_id', 'canonical_time', 'shift_s']
+    if tol_s is None or len(events) < 2:
+        return pd.DataFrame(columns=columns), 0
+    events = events.sort_values(['time', 'event_id'], kind='stable').reset_index(drop=True)
+    t = (events['time'] - events['time'].iloc[0]).dt.total_seconds().to_numpy()
+
+    # --- clusters: each event joins its predecessor in time if it is within tol_s
+    cluster = np.cumsum(np.concatenate([[True], np.diff(t) > tol_s]))
+    events['cluster'] = cluster
+    first, last = np.searchsorted(cluster, cluster), np.searchsorted(cluster, cluster, side='right') - 1
+    size, span = last - first + 1, t[last] - t[first]
+
+    templates = df.loc[df['event_id'] != df['template_id'], ['event_id', 'template_id']].drop_duplicates()
+    templates = templates.assign(cluster=templates['event_id'].map(events.set_index('event_id')['cluster']))
+    repeated = templates.loc[templates.duplicated(['cluster', 'template_id']), 'cluster'].unique()
+    ambiguous = (size > 1) & ((span > tol_s) | np.isin(cluster, repeated))
+    merge = (size > 1) & ~ambiguous
+
+    # --- canonical event per cluster: best mean CC, then most picks, then earliest
+    candidates = events[merge].sort_values(['cluster', 'cc', 'n_picks', 'time'],
+                                           ascending=[True, False, False, True], kind='stable')
+    n_ambiguous = int(len(np.unique(cluster[ambiguous])))
+    if len(candidates) == 0:
+        return pd.DataFrame(columns=columns), n_ambiguous
+    canonical = candidates.drop_duplicates('cluster').set_index('cluster')
+    dup = candidates[~candidates['event_id'].isin(canonical['event_id'])].copy()
+    dup['canonical_id'] = dup['cluster'].map(canonical['event_id'])
+    dup['canonical_time'] = dup['cluster'].map(canonical['origin_time'])
+    dup['shift_s'] = (dup['time'] - dup['cluster'].map(canonical['time'])).dt.total_seconds()
+    return dup[columns].reset_index(drop=True), n_ambiguous
+
+
+def merge_duplicate_detections(df, tol_s=DUPLICATE_TOL_S):
+    """
+    Relabel duplicate detections to their canonical event.
+
+    The picks of a merged detection keep their template_id, lags and CC; event_id
+    and origin_time become the canonical ones and the travel times are shifted by
+    the origin time difference, so they stay the arrival times relative to the new
+    origin time (in .pha with and without lag correction). The shift is kept in the
+    origin_shift_s column, which csv_to_cc adds to the lags (.cc dt is relative to
+    the origin times of both events). Rows
+    that would pair an event with itself and repeated (event, template, station)
+    rows are dropped. The rows of each event stay together, the canonical
+    detection's rows first (csv_to_pha keeps the first pick per station and phase).
+
+    Returns: (merged detections, duplicates table from find_duplicates, report dict)
+    """
+    dup, n_ambiguous = find_duplicates(df, tol_s)
+    n_events = df['event_id'].nunique()
+    out = df.copy()
+    if len(dup):
+        lookup = dup.set_index('event_id')
+        merged = out['event_id'].isin(lookup.index).to_numpy() & (out['event_id'] != out['template_id']).to_numpy()
+        ids = out.loc[merged, 'event_id']
+        shift = ids.map(lookup['shift_s'])
+        for pha in ('p', 's'):
+            out.loc[merged, f'travel_time_{pha}'] = out.loc[merged, f'travel_time_{pha}'] + shift
+        out[ORIGIN_SHIFT] = 0.0
+        out.loc[merged, ORIGIN_SHIFT] = shift
+        out.loc[merged, 'origin_time'] = ids.map(lookup['canonical_time'])
+        out.loc[merged, 'event_id'] = ids.map(lookup['canonical_id'])
+
+        self_pair = merged & (out['event_id'] == out['template_id']).to_numpy()
+        out, merged = out[~self_pair], merged[~self_pair]
+        order = np.lexsort((merged, pd.factorize(out['event_id'])[0]))
+        out = out.iloc[order]
+    n_rows = len(out)
+    out = out.drop_duplicates(['event_id', 'template_id', 'station']).reset_index(drop=True)
+
+    report = {
+        'events_input': n_events,
+        'events_kept': out['event_id'].nunique(),
+        'merged_detections': len(dup),
+        'canonical_events': dup['canonical_id'].nunique() if len(dup) else 0,
+        'ambiguous_clusters': n_ambiguous,
+        'duplicate_rows_dropped': n_rows - len(out),
+        'max_shift_s': float(dup['shift_s'].abs().max()) if len(dup) else 0.0,
+    }
+    return out, dup, report
+
+
+def print_dedupe_report(report, tol_s=DUPLICATE_TOL_S):
+    """Print how many detections were merged."""
+    if tol_s is None:
+        print(f"Duplicate detections: not merged ({report['events_input']} events)")
+        return
+    print(f"Duplicate detections (within {tol_s:g} s): merged {report['merged_detections']} into "
+          f"{report['canonical_events']} events, {report['events_input']} -> {report['events_kept']} events "
+          f"(max. origin shift {report['max_shift_s']:.2f} s)")
+    if report['ambiguous_clusters']:
+        print(f"  {report['ambiguous_clusters']} clusters left unmerged (longer than {tol_s:g} s or a template twice)")
+    if report['duplicate_rows_dropped']:
+        print(f"  dropped {report['duplicate_rows_dropped']} repeated (event, template, station) rows")
+
+
+def dedupe_detections(csv_file, output_file, duplicates_file=None, tol_s=DUPLICATE_TOL_S):
+    """
+    Write the detection table with duplicate detections merged (see merge_duplicate_detections).
+
+    duplicates_file: CSV listing every merged detection with its canonical event and
+                     origin time shift, to trace the merged event IDs back
+
+    Returns: merged detections DataFrame
+    """
+    df = read_table(csv_file) if isinstance(csv_file, str) else csv_file
+    out, dup, report = merge_duplicate_detections(df, tol_s)
+    out.to_csv(output_file, index=False)
+    if duplicates_file is not None:
+        dup.to_csv(duplicates_file, index=False)
+    print_dedupe_report(report, tol_s)
+    print(f"✅ Created {output_file}")
+    return out
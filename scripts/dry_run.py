@@ -0,0 +1,590 @@
+"""
+Dry-run prediction of the events ph2dt and hypoDD will keep.
+
+Rebuilds ph2dt's event-pair link graph from the .pha and station files with
+NumPy: the MINWGHT/MINOBS event selection, station distance, outlier and
+nearest-neighbour rules (MAXSEP, MAXNGH, MINLNK, MINOBS, MAXOBS). It then
+applies hypoDD's data selection (IDAT, IPHA, DIST, WDCC/WDCT of the first
+iteration set) and the OBSCC/OBSCT clustering of cluster1.f as a union-find
+over the .cc and predicted dt.ct links. The result is the selected events,
+cluster membership and data counts per cluster, in milliseconds instead of a
+full ph2dt + hypoDD run. Parameter sweeps can drop hopeless settings first.
+
+hypoDD can still remove events during the inversion (air quakes, events
+losing all data by re-weighting), so the predicted cluster sizes are an upper
+bound of the relocated events.
+"""
+import itertools
+import os
+import time
+import numpy as np
+import pandas as pd
+from csv_hypodd import read_ph2dt_inp
+from hypodd_io import compressed_source
+from hypodd_ext import read_hypodd_files, read_hypodd_inp
+from hypodd_formats import read_dt_cc, read_station_dat
+from legacy_import import read_pha
+
+
+KMPERDEG = 111.1949266    # ph2dt event separation
+PH2DT_VEL = {'P': 4.0, 'S': 2.3}  # ph2dt outlier rule: |dt| > offset / vel + 0.5 s
+PH2DT_PARAMS = ('minwght', 'maxdist', 'maxsep', 'maxngh', 'minlnk', 'minobs', 'maxobs')
+# Up to this many events, ties in event separation are ordered like ph2dt's heapsort
+EXACT_TIES_MAX_EVENTS = 3000
+
+
+def delaz_km(alat, alon, blat, blon):
+    """Distance (km) between points as computed by hypoDD/ph2dt's delaz.f (element-wise)."""
+    rad, flat, pi2 = 1.745329e-02, 0.993231, 1.570796
+    alat, alon, blat, blon = (np.asarray(v, dtype=float) for v in (alat, alon, blat, blon))
+    acol = pi2 - np.arctan(flat * np.tan(alat * rad))
+    bcol = pi2 - np.arctan(flat * np.tan(blat * rad))
+    diflon = (blon - alon) * rad
+    cosdel = np.sin(acol) * np.sin(bcol) * np.cos(diflon) + np.cos(acol) * np.cos(bcol)
+    colat = pi2 - (alat + blat) * rad / 2
+    radius = 6378.163 * (1 + 3.35278e-3 * (1 / 3 - np.cos(colat) ** 2))
+    return np.arccos(np.clip(cosdel, -1, 1)) * radius
+
+
+def _indexx(values):
+    """Sort permutation of ph2dt's indexx.f (heapsort), which orders ties differently from a stable sort."""
+    n = len(values)
+    if n < 2:
+        return np.arange(n)
+    a = [None] + [float(v) for v in values]
+    ind = list(range(n + 1))
+    l, ir = n // 2 + 1, n
+    while True:
+        if l > 1:
+            l -= 1
+            indxt = ind[l]
+        else:
+            indxt = ind[ir]
+            ind[ir] = ind[1]
+            ir -= 1
+            if ir == 1:
+                ind[1] = indxt
+                break
+        q = a[indxt]
+        i, j = l, l + l
+        while j <= ir:
+            if j < ir and a[ind[j]] < a[ind[j + 1]]:
+                j += 1
+            if q < a[ind[j]]:
+                ind[i] = ind[j]
+                i, j = j, j + j
+            else:
+                j = ir + 1
+        ind[i] = indxt
+    return np.array(ind[1:]) - 1
+
+
+def _separation(lat1, lon1, dep1, lat2, lon2, dep2, km_per_deg=KMPERDEG):
+    """
+    Event separation as in ph2dt/getdata (longitude scaled at the first event's latitude).
+
+    With float32 inputs this reproduces ph2dt's single precision values, which decide its neighbour order.
+    """
+    pi, km_per_deg = (np.asarray(v, dtype=np.result_type(lat1, np.float32)) for v in (3.141593, km_per_deg))
+    return np.sqrt(((lat1 - lat2) * km_per_deg) ** 2
+                   + ((lon1 - lon2) * (np.cos(lat1 * pi / 180) * km_per_deg)) ** 2
+                   + (dep1 - dep2) ** 2)
+
+
+def long_picks(picks):
+    """read_pha picks (one row per event/station) -> one row per phase (event_id, station, phase, tt, weight)."""
+    parts = []
+    for pha in ('P', 'S'):
+        tt = picks[f'travel_time_{pha.lower()}']
+        ok = tt.notna().to_numpy()
+        parts.append(pd.DataFrame({'event_id': picks['event_id'].to_numpy()[ok], 'station': picks['station'].to_numpy()[ok],
+                                   'phase': pha, 'tt': tt.to_numpy()[ok],
+                                   'weight': picks[f'cc_{pha.lower()}'].to_numpy()[ok]}))
+    return pd.concat(parts, ignore_index=True)
+
+
+def pair_observations(events, picks, stations, minwght, minobs, maxsep, chunk_rows=5000000):
+    """
+    Event selection and common observations of all event pairs within maxsep.
+
+    Everything here is independent of MAXDIST, MAXNGH, MINLNK and MAXOBS, so
+    one result serves all values of those parameters (and any MAXSEP <= maxsep).
+
+    Parameters:
+    -----------
+    events : DataFrame
+        Events in .pha order (event_id, latitude, longitude, depth), from read_pha
+    picks : DataFrame
+        Long-form picks (event_id, station, phase, tt, weight), see long_picks
+    stations : DataFrame
+        Station file (station, latitude, longitude)
+    minwght, minobs, maxsep :
+        ph2dt's MINWGHT, MINOBS and MAXSEP
+    chunk_rows : int
+        Max. candidate observations expanded at once (bounds memory)
+
+    Returns: dict of arrays (pairs are directed; the reverse of pair j is j ^ 1)
+    """
+    # --- event selection: picks with 0 <= weight < MINWGHT are dropped, events need MINOBS picks
+    w = picks['weight'].to_numpy(dtype=float)
+    picks = picks[~((w >= 0) & (w < minwght))]
+    n_picks = picks.groupby('event_id').size().reindex(events['event_id'], fill_value=0).to_numpy()
+    selected = events[n_picks >= minobs].reset_index(drop=True)
+    n = len(selected)
+    lat, lon, dep = (selected[c].to_numpy(dtype=float) for c in ('latitude', 'longitude', 'depth'))
+
+    # --- picks of selected events at known stations, grouped by event (file order kept)
+    sta_table = stations.drop_duplicates('station').reset_index(drop=True)
+    sta_index = pd.Series(np.arange(len(sta_table)), index=sta_table['station'].astype(str))
+    p_ev = picks['event_id'].map(pd.Series(np.arange(n), index=selected['event_id'])).to_numpy(dtype=float)
+    p_sta = picks['station'].astype(str).map(sta_index).to_numpy(dtype=float)
+    ok = ~np.isnan(p_ev) & ~np.isnan(p_sta) & picks['phase'].isin(['P', 'S']).to_numpy()
+    order = np.argsort(p_ev[ok], kind='stable')
+    p_ev = p_ev[ok][order].astype(np.int64)
+    p_code = (p_sta[ok][order].astype(np.int64) * 2 + (picks['phase'].to_numpy()[ok][order] == 'S'))
+    p_tt = picks['tt'].to_numpy(dtype=float)[ok][order]
+    p_w = picks['weight'].to_numpy(dtype=float)[ok][order]
+    counts = np.bincount(p_ev, minlength=n)
+    start = np.cumsum(counts) - counts
+    # ph2dt pairs each pick of event i with the first pick of event k at the same station and phase
+    n_codes = 2 * len(sta_table)
+    first_keys, first_idx = np.unique(p_ev * n_codes + p_code, return_index=True)
+    dense = n * n_codes <= 20000000
+    if dense:
+        first_pick = np.full(n * n_codes, -1, dtype=np.int64)
+        first_pick[first_keys] = first_idx
+    s_lat, s_lon = (sta_table[c].to_numpy(dtype=float) for c in ('latitude', 'longitude'))
+
+    # --- candidate pairs within maxsep (both directions: separations differ slightly)
+    if n > 1:
+        from scipy.spatial import cKDTree
+
+        cmin = np.cos(np.radians(np.abs(lat).max()))  # smallest longitude scale: a superset of the pairs
+        xyz = np.column_stack([lon * cmin * KMPERDEG, lat * KMPERDEG, dep])
+        und = cKDTree(xyz).query_pairs(maxsep * (1 + 1e-6) + 1e-6, output_type='ndarray')
+    else:
+        und = np.empty((0, 2), dtype=np.int64)
+    src = np.column_stack([und[:, 0], und[:, 1]]).ravel()
+    dst = np.column_stack([und[:, 1], und[:, 0]]).ravel()
+    lat32, lon32, dep32 = (v.astype(np.float32) for v in (lat, lon, dep))
+    aoff = _separation(lat32[src], lon32[src], dep32[src], lat32[dst], lon32[dst], dep32[dst])
+    n_pairs = len(src)
+
+    # --- common observations of every candidate pair (chunked expansion of the picks of src)
+    obs = {k: [] for k in ('pair', 'pi', 'pk', 'dist', 'outlier')}
+    reps = counts[src]
+    bounds = np.searchsorted(np.cumsum(reps), np.arange(0, reps.sum() + chunk_rows, chunk_rows), side='right')
+    for c0, c1 in zip(np.r_[0, bounds[:-1]], bounds):
+        if c1 <= c0:
+            continue
+        pair = np.repeat(np.arange(c0, c1), reps[c0:c1])
+        within = np.arange(len(pair)) - np.repeat(np.cumsum(reps[c0:c1]) - reps[c0:c1], reps[c0:c1])
+        pi = start[src[pair]] + within
+        lookup = dst[pair] * n_codes + p_code[pi]
+        if dense:
+            pk = first_pick[lookup]
+            match = pk >= 0
+        else:
+            pos = np.minimum(np.searchsorted(first_keys, lookup), len(first_keys) - 1)
+            match = first_keys[pos] == lookup
+            pk = first_idx[pos]
+        pair, pi, pk = pair[match], pi[match], pk[match]
+        sta = p_code[pi] // 2
+        dist = delaz_km(s_lat[sta], s_lon[sta], (lat[src[pair]] + lat[dst[pair]]) / 2,
+                        (lon[src[pair]] + lon[dst[pair]]) / 2)
+        vel = np.where(p_code[pi] % 2 == 1, PH2DT_VEL['S'], PH2DT_VEL['P'])
+        outlier = np.abs(p_tt[pi] - p_tt[pk]) > aoff[pair].astype(float) / vel + 0.5
+        for key, values in zip(obs, (pair, pi, pk, dist.astype(np.float32), outlier)):
+            obs[key].append(values)
+    obs = {k: np.concatenate(v) if v else np.empty(0, dtype=np.int64) for k, v in obs.items()}
+    obs['important'] = (p_w[obs['pi']] < 0) | (p_w[obs['pk']] < 0)
+
+    # --- neighbour order of every event: by separation (ties are resolved in predict_ph2dt when they matter)
+    order = np.lexsort((dst, aoff, src))
+    first = np.searchsorted(src[order], np.arange(n + 1))
+
+    return {
+        'events_total': len(events), 'selected': selected, 'phases': int(n_picks[n_picks >= minobs].sum()),
+        'maxsep': maxsep, 'stations': sta_table['station'].astype(str).to_numpy(),
+        'p_code': p_code, 'p_tt': p_tt, 'p_w': p_w,
+        'src': src, 'dst': dst, 'aoff': aoff, 'order': order, 'first': first, 'tie_resolved': set(),
+        'obs': obs,
+    }
+
+
+def _resolve_ties(pairs, i):
+    """Order the neighbours of event i like ph2dt's heapsort over all events (in place)."""
+    order, first, dst, aoff = pairs['order'], pairs['first'], pairs['dst'], pairs['aoff']
+    lat, lon, dep = (pairs['selected'][c].to_numpy(dtype=np.float32) for c in ('latitude', 'longitude', 'depth'))
+    full = _separation(lat[i], lon[i], dep[i], lat, lon, dep)
+    full[i] = 99999
+    rank = np.empty(len(full), dtype=np.int64)
+    rank[_indexx(full)] = np.arange(len(full))
+    idx = order[first[i]:first[i + 1]]
+    order[first[i]:first[i + 1]] = idx[np.argsort(rank[dst[idx]], kind='stable')]
+    pairs['tie_resolved'].add(i)
+
+
+def predict_ph2dt(events, picks, stations, params, pairs=None):
+    """
+    Predict ph2dt's output without running it.
+
+    Parameters:
+    -----------
+    events : DataFrame
+        Events in .pha order (event_id, latitude, longitude, depth), from read_pha
+    picks : DataFrame
+        Long-form picks (event_id, station, phase, tt, weight), see long_picks
+    stations : DataFrame
+        Station file (station, latitude, longitude)
+    params : dict
+        ph2dt parameters (read_ph2dt_inp)
+    pairs : dict, optional
+        pair_observations result to reuse (same MINWGHT/MINOBS, MAXSEP at least params['maxsep'])
+
+    Returns:
+    --------
+    (selected events, dt.ct observations (id1, id2, station, t1, t2, weight, phase), station.sel codes, stats dict)
+    """
+    mnb, minlnk, minobs, maxobs = (int(params[k]) for k in ('maxngh', 'minlnk', 'minobs', 'maxobs'))
+    if pairs is None:
+        pairs = pair_observations(events, picks, stations, params['minwght'], minobs, params['maxsep'])
+    src, dst, aoff, order, first, obs = (pairs[k] for k in ('src', 'dst', 'aoff', 'order', 'first', 'obs'))
+    p_code, p_tt, p_w = pairs['p_code'], pairs['p_tt'], pairs['p_w']
+    n, n_pairs = len(pairs['selected']), len(src)
+
+    # --- observations surviving the station distance and outlier tests
+    far = obs['dist'] > params['maxdist']
+    outlier = ~far & obs['outlier']
+    keep = np.flatnonzero(~far & ~outlier)
+    iobs = np.bincount(obs['pair'][keep], minlength=n_pairs)
+    iimp = np.bincount(obs['pair'][keep[obs['important'][keep]]], minlength=n_pairs)
+
+    # --- nearest-neighbour selection, event by event as in ph2dt (take(i,k): 1 strong, 2 weak)
+    state = np.zeros(n_pairs, dtype=np.int8)
+    evaluated = np.zeros(n_pairs, dtype=bool)
+    weakly_linked = 0
+    exact_ties = n <= EXACT_TIES_MAX_EVENTS
+
+    def neighbours(i):
+        idx = order[first[i]:first[i + 1]]
+        back = state[idx ^ 1]
+        fresh = back == 0
+        blocked = np.flatnonzero(fresh & (aoff[idx] > params['maxsep']))
+        stop = blocked[0] if len(blocked) else len(idx)
+        inc = (back == 1) | (fresh & (iobs[idx] >= minlnk))
+        inc[stop:] = False
+        processed = np.cumsum(inc) - inc < mnb
+        processed[stop:] = False
+        return idx, fresh, inc, processed
+
+    for i in range(n):
+        idx, fresh, inc, processed = neighbours(i)
+        end = processed.sum()
+        if exact_ties and 0 < end < len(idx) and i not in pairs['tie_resolved'] \
+                and aoff[idx[end - 1]] == aoff[idx[end]]:
+            _resolve_ties(pairs, i)  # the neighbour limit cuts through equally distant events
+            idx, fresh, inc, processed = neighbours(i)
+        new = idx[processed & fresh]
+        state[new] = np.where(iobs[new] >= minlnk, 1, 2)
+        evaluated[new] = True
+        if inc[processed].sum() < mnb:
+            weakly_linked += 1
+    saved_pair = evaluated & (iobs >= minobs)
+
+    # --- observations written per saved pair: nearest stations first, at most MAXOBS (+ fixed-weight ones)
+    n_write = np.where(iobs > maxobs, np.minimum(maxobs + iimp, iobs), iobs)
+    rows = keep[saved_pair[obs['pair'][keep]]]
+    dist = np.where(obs['important'][rows], 0, obs['dist'][rows])
+    sort = np.lexsort((dist, obs['pair'][rows]))
+    rows, dist = rows[sort], dist[sort]
+    pair_of = obs['pair'][rows]
+    starts = np.flatnonzero(np.r_[True, pair_of[1:] != pair_of[:-1]]) if len(rows) else np.empty(0, dtype=np.int64)
+    rank = np.arange(len(rows)) - np.repeat(starts, np.diff(np.r_[starts, len(rows)]))
+    # equal distances across the MAXOBS cut: ph2dt's heapsort decides which observations stay
+    cut = np.flatnonzero((rank == n_write[pair_of] - 1) & (iobs[pair_of] > n_write[pair_of]))
+    cut = cut[dist[cut] == dist[cut + 1]]
+    for s in starts[np.searchsorted(starts, cut, side='right') - 1]:
+        e = s + iobs[pair_of[s]]
+        block = np.sort(rows[s:e])  # observation order of ph2dt (picks of the first event)
+        rows[s:e] = block[_indexx(np.where(obs['important'][block], 0, obs['dist'][block]))]
+    rows = rows[rank < n_write[pair_of]]
+
+    # dt.ct order: events in file order, neighbours by separation
+    pair_pos = np.empty(n_pairs, dtype=np.int64)
+    pair_pos[order] = np.arange(n_pairs)
+    rows = rows[np.argsort(pair_pos[obs['pair'][rows]], kind='stable')]
+    pair, pi, pk = obs['pair'][rows], obs['pi'][rows], obs['pk'][rows]
+    ids = pairs['selected']['event_id'].astype(np.int64).to_numpy()
+    dt_ct = pd.DataFrame({
+        'id1': ids[src[pair]], 'id2': ids[dst[pair]],
+        'station': pairs['stations'][p_code[pi] // 2],
+        't1': p_tt[pi], 't2': p_tt[pk], 'weight': (np.abs(p_w[pi]) + np.abs(p_w[pk])) / 2,
+        'phase': np.where(p_code[pi] % 2 == 1, 'S', 'P'),
+    })
+    used = keep[evaluated[obs['pair'][keep]]]
+    station_sel = pairs['stations'][np.unique(p_code[obs['pi'][used]] // 2)]
+    in_evaluated = evaluated[obs['pair']]
+
+    stats = {
+        'events_total': int(pairs['events_total']),
+        'events_selected': int(n),
+        'phases': pairs['phases'],
+        'pairs_saved': int(saved_pair.sum()),
+        'obs_saved': int(len(dt_ct)),
+        'obs_saved_p': int((dt_ct['phase'] == 'P').sum()),
+        'obs_saved_s': int((dt_ct['phase'] == 'S').sum()),
+        'outliers': int((outlier & in_evaluated).sum()),
+        'far_phases': int((far & in_evaluated).sum()),
+        'weakly_linked': int(weakly_linked),
+        'stations_selected': int(len(station_sel)),
+        'exact_ties': exact_ties,
+    }
+    return pairs['selected'], dt_ct, station_sel, stats
+
+
+def _union_find(n, a, b):
+    """Connected-component labels (smallest member index) of n nodes joined by edges a-b."""
+    labels = np.arange(n)
+    while True:
+        m = np.minimum(labels[a], labels[b])
+        before = labels.copy()
+        np.minimum.at(labels, a, m)
+        np.minimum.at(labels, b, m)
+        labels = labels[labels]  # pointer jumping
+        if np.array_equal(labels, before):
+            return labels
+
+
+def predict_hypodd(events, stations, params, dt_cc=None, dt_ct=None):
+    """
+    Predict hypoDD's data selection and clustering (cluster1.f).
+
+    Parameters:
+    -----------
+    events : DataFrame
+        hypoDD's event file (event_id as hypoDD ID, latitude, longitude, depth)
+    stations : DataFrame
+        hypoDD's station file (station, latitude, longitude)
+    params : dict
+        hypoDD parameters (read_hypodd_inp, plus optional 'wdcc'/'wdct' overrides)
+    dt_cc, dt_ct : DataFrame, optional
+        Observations (id1, id2, station, phase[, otc])
+
+    Returns: dict with the clusters (largest first), isolated events and data counts
+    """
+    ids = events['event_id'].astype(np.int64).to_numpy()
+    keep_ev = np.isin(ids, params['ids']) if len(params.get('ids') or []) else np.ones(len(ids), dtype=bool)
+    ev = events[keep_ev].reset_index(drop=True)
+    ids = ids[keep_ev]
+    n = len(ev)
+    lat, lon, dep = (ev[c].to_numpy(dtype=float) for c in ('latitude', 'longitude', 'depth'))
+    sort_ids = np.sort(ids)
+    pos_of = pd.Series(np.arange(n), index=ids)
+    idat, ipha = int(params['idat']), int(params['ipha'])
+    wdcc = params.get('wdcc', params['iterations'][0][4])
+    wdct = params.get('wdct', params['iterations'][0][8])
+
+    sta = stations.drop_duplicates('station')
+    sta_index = pd.Index(sta['station'].astype(str))
+    s_lat, s_lon = sta['latitude'].to_numpy(dtype=float), sta['longitude'].to_numpy(dtype=float)
+
+    def select(obs, is_cc, maxsep):
+        if obs is None or len(obs) == 0 or n == 0:
+            return {'a': np.empty(0, np.int64), 'b': np.empty(0, np.int64), 'sta': np.empty(0, np.int64),
+                    'is_s': np.empty(0, bool), 'is_cc': np.empty(0, bool)}
+        a = pos_of.reindex(obs['id1'].to_numpy()).to_numpy(dtype=float)
+        b = pos_of.reindex(obs['id2'].to_numpy()).to_numpy(dtype=float)
+        s = sta_index.get_indexer(obs['station'])
+        ok = ~np.isnan(a) & ~np.isnan(b) & (s >= 0)
+        if 'otc' in obs:
+            ok &= np.abs(obs['otc'].to_numpy(dtype=float) + 999) >= 0.001
+        a, b = np.where(ok, a, 0).astype(np.int64), np.where(ok, b, 0).astype(np.int64)
+        if maxsep > 0:
+            ok &= _separation(lat[a], lon[a], dep[a], lat[b], lon[b], dep[b], km_per_deg=111) <= maxsep
+        is_s = (obs['phase'] == 'S').to_numpy()
+        ok &= (~is_s & (ipha != 2)) | (is_s & (ipha != 1))
+        return {'a': a[ok], 'b': b[ok], 'sta': s[ok], 'is_s': is_s[ok], 'is_cc': np.full(ok.sum(), is_cc)}
+
+    cc = select(dt_cc if idat in (1, 3) else None, True, wdcc)
+    ct = select(dt_ct if idat in (2, 3) else None, False, wdct)
+    data = {k: np.concatenate([cc[k], ct[k]]) for k in cc}
+
+    def near_stations(members):
+        clat, clon = lat[members].mean(), lon[members].mean()
+        return delaz_km(clat, clon, s_lat, s_lon) <= params['dist']
+
+    if n:
+        near = near_stations(np.arange(n))[data['sta']]
+        data = {k: v[near] for k, v in data.items()}
+    # events without data after the selection are dropped by hypoDD
+    matched = np.bincount(np.r_[data['a'], data['b']], minlength=n) > 0
+
+    # --- clustering: pairs linked by at least OBSCC + OBSCT observations (cc and ct counted together)
+    obscc = params['obscc'] if idat in (1, 3) else 0
+    obsct = params['obsct'] if idat in (2, 3) else 0
+    if obscc + obsct == 0:
+        clusters = [np.flatnonzero(matched)] if matched.any() else []
+    else:
+        rank = np.searchsorted(sort_ids, ids)  # cluster1 works on the events sorted by ID
+        hi = np.maximum(rank[data['a']], rank[data['b']])
+        lo = np.minimum(rank[data['a']], rank[data['b']])
+        key, n_links = np.unique(hi * n + lo, return_counts=True)
+        key = key[n_links >= obscc + obsct]
+        by_rank = np.argsort(rank)
+        a, b = by_rank[key // n], by_rank[key % n]
+        labels = _union_find(n, a, b)
+        # cluster numbers in order of the first link, then cluster1's size sort (swaps equal sizes too)
+        first_link = pd.Series(key).groupby(labels[a]).min().sort_values()
+        clusters = [np.flatnonzero(labels == lab) for lab in first_link.index]
+        if len(clusters) <= 2000:
+            for i in range(len(clusters) - 1):
+                for j in range(i + 1, len(clusters)):
+                    if len(clusters[i]) <= len(clusters[j]):
+                        clusters[i], clusters[j] = clusters[j], clusters[i]
+        else:
+            clusters.sort(key=len, reverse=True)
+    clustered = np.zeros(n, dtype=bool)
+    for members in clusters:
+        clustered[members] = True
+
+    # --- data per cluster: hypoDD re-reads the data with the stations near the cluster centroid
+    summary = []
+    for c, members in enumerate(clusters, start=1):
+        in_cluster = np.zeros(n, dtype=bool)
+        in_cluster[members] = True
+        d = in_cluster[data['a']] & in_cluster[data['b']]
+        if len(members) < n:
+            d &= near_stations(members)[data['sta']]
+        is_cc, is_s = data['is_cc'][d], data['is_s'][d]
+        summary.append({
+            'cluster': c, 'n_events': int(len(members)),
+            'n_cc_p': int((is_cc & ~is_s).sum()), 'n_cc_s': int((is_cc & is_s).sum()),
+            'n_ct_p': int((~is_cc & ~is_s).sum()), 'n_ct_s': int((~is_cc & is_s).sum()),
+            'event_ids': ids[members].tolist(),
+        })
+
+    cid = int(params.get('cid') or 0)
+    relocated = [s for s in summary if cid == 0 or s['cluster'] == cid]
+    return {
+        'events': int(matched.sum()),
+        'stations': int(len(np.unique(data['sta']))),
+        'n_cc': int(data['is_cc'].sum()),
+        'n_ct': int((~data['is_cc']).sum()),
+        'clusters': summary,
+        'n_clustered': int(clustered.sum()),
+        'isolated': ids[~clustered].tolist(),
+        'cid': cid,
+        'n_relocated_max': int(sum(s['n_events'] for s in relocated)),
+    }
+
+
+def load_inputs(run_dir, hypodd_inp, ph2dt_inp='ph2dt.inp'):
+    """Read the control files, .pha, station file and .cc of a run directory once (for dry_run/sweep)."""
+    ph2dt_params = read_ph2dt_inp(f'{run_dir}/{ph2dt_inp}')
+    hypodd_params = read_hypodd_inp(f'{run_dir}/{hypodd_inp}')
+    files = read_hypodd_files(f'{run_dir}/{hypodd_inp}')
+    events, picks = read_pha(compressed_source(f"{run_dir}/{ph2dt_params['phase_file']}"))
+    cc_file = compressed_source(f"{run_dir}/{files['cc']}") if files['cc'] else None
+    return {
+        'ph2dt': ph2dt_params,
+        'hypodd': hypodd_params,
+        'files': files,
+        'events': events,
+        'picks': long_picks(picks),
+        'stations': read_station_dat(compressed_source(f"{run_dir}/{ph2dt_params['station_file']}")),
+        'dt_cc': read_dt_cc(cc_file) if cc_file and os.path.getsize(cc_file) else None,
+    }
+
+
+def dry_run(run_dir, hypodd_inp, ph2dt_inp='ph2dt.inp', inputs=None, ph2dt=None, hypodd=None, verbose=True):
+    """
+    Predict the outcome of ph2dt + hypoDD for a run directory.
+
+    Parameters:
+    -----------
+    run_dir : str
+        Run directory with ph2dt.inp, the hypoDD control file and their inputs
+    hypodd_inp : str
+        hypoDD control file name
+    inputs : dict, optional
+        Output of load_inputs (avoids re-reading the files, e.g. in sweeps)
+    ph2dt : dict, optional
+        Overrides of ph2dt parameters (minwght, maxdist, maxsep, maxngh, minlnk, minobs, maxobs)
+    hypodd : dict, optional
+        Overrides of hypoDD parameters (idat, ipha, dist, obscc, obsct, cid, wdcc, wdct)
+
+    Returns: report dict ('ph2dt' stats, 'hypodd' clusters, 'elapsed_ms')
+    """
+    inputs = inputs or load_inputs(run_dir, hypodd_inp, ph2dt_inp)
+    start = time.perf_counter()
+    p_params = {**inputs['ph2dt'], **(ph2dt or {})}
+    h_params = {**inputs['hypodd'], **(hypodd or {})}
+
+    # the pair observations only depend on MINWGHT, MINOBS and MAXSEP: reused between calls on the same inputs
+    cache = inputs.setdefault('pair_cache', {})
+    key = (float(p_params['minwght']), int(p_params['minobs']))
+    if key not in cache or cache[key]['maxsep'] < p_params['maxsep']:
+        maxsep = max(p_params['maxsep'], inputs.get('max_maxsep', 0))
+        cache[key] = pair_observations(inputs['events'], inputs['picks'], inputs['stations'], *key, maxsep)
+    selected, dt_ct, station_sel, stats = predict_ph2dt(inputs['events'], inputs['picks'], inputs['stations'], p_params,
+                                                        pairs=cache[key])
+
+    # hypoDD reads the files named in its control file: ph2dt's selections or the full inputs
+    files = inputs['files']
+    events = selected if os.path.basename(files['event']) != 'event.dat' else inputs['events']
+    stations = inputs['stations']
+    if os.path.basename(files['station']) == 'station.sel':
+        stations = stations[stations['station'].astype(str).isin(station_sel)]
+    result = predict_hypodd(events, stations, h_params, dt_cc=inputs['dt_cc'], dt_ct=dt_ct if files['ct'] else None)
+
+    report = {'ph2dt': stats, 'hypodd': result, 'elapsed_ms': round((time.perf_counter() - start) * 1000, 1)}
+    if verbose:
+        print_dry_run(report)
+    return report
+
+
+def print_dry_run(report):
+    """Print a dry-run report."""
+    p, h = report['ph2dt'], report['hypodd']
+    print(f"Dry run ({report['elapsed_ms']:.0f} ms)")
+    print(f"  ph2dt: {p['events_selected']} of {p['events_total']} events selected, {p['pairs_saved']} pairs, "
+          f"{p['obs_saved']} dt.ct obs (P={p['obs_saved_p']}, S={p['obs_saved_s']}), "
+          f"{p['weakly_linked']} weakly linked, {p['outliers']} outliers, {p['stations_selected']} stations")
+    print(f"  hypoDD: {h['events']} events, {h['n_cc']} cc + {h['n_ct']} ct obs at {h['stations']} stations")
+    print(f"  {h['n_clustered']} clustered in {len(h['clusters'])} clusters, {len(h['isolated'])} isolated")
+    for s in h['clusters'][:10]:
+        print(f"    cluster {s['cluster']}: {s['n_events']} events, cc P/S {s['n_cc_p']}/{s['n_cc_s']}, "
+              f"ct P/S {s['n_ct_p']}/{s['n_ct_s']}")
+    target = 'all clusters' if h['cid'] == 0 else f"cluster {h['cid']}"
+    print(f"  ✅ at most {h['n_relocated_max']} events relocated ({target})")
+
+
+def sweep(run_dir, hypodd_inp, ph2dt_grid=None, hypodd_grid=None, ph2dt_inp='ph2dt.inp'):
+    """
+    Dry-run every combination of parameter values.
+
+    ph2dt_grid / hypodd_grid: {parameter: [values]} (see dry_run for the names)
+    Returns: DataFrame with one row per combination, most relocated events first
+    """
+    inputs = load_inputs(run_dir, hypodd_inp, ph2dt_inp)
+    ph2dt_grid, hypodd_grid = ph2dt_grid or {}, hypodd_grid or {}
+    inputs['max_maxsep'] = max(ph2dt_grid.get('maxsep', [0]))  # one pair set serves all MAXSEP values
+    names = list(ph2dt_grid) + list(hypodd_grid)
+    rows = []
+    for values in itertools.product(*ph2dt_grid.values(), *hypodd_grid.values()):
+        p = dict(zip(ph2dt_grid, values[:len(ph2dt_grid)]))
+        h = dict(zip(hypodd_grid, values[len(ph2dt_grid):]))
+        report = dry_run(run_dir, hypodd_inp, inputs=inputs, ph2dt=p, hypodd=h, verbose=False)
+        hr = report['hypodd']
+        rows.append({**dict(zip(names, values)),
+                     'events_selected': report['ph2dt']['events_selected'],
+                     'obs_ct': report['ph2dt']['obs_saved'],
+                     'n_clusters': len(hr['clusters']),
+                     'largest_cluster': hr['clusters'][0]['n_events'] if hr['clusters'] else 0,
+                     'n_isolated': len(hr['isolated']),
+                     'n_relocated_max': hr['n_relocated_max'],
+                     'elapsed_ms': report['elapsed_ms']})
+    df = pd.DataFrame(rows).sort_values('n_relocated_max', ascending=False, kind='stable').reset_index(drop=True)
+    print(f"✅ Dry-ran {len(df)} parameter sets, best: {df['n_relocated_max'].iloc[0] if len(df) else 0} events")
+    return df
@@ -0,0 +1,282 @@
+"""
+One-pass streaming QC statistics of differential-time files (.cc, dt.ct).
+
+The file is cut into byte ranges that start at '#' pair headers and scanned in
+a process pool, so every byte is read once. Each worker turns its chunk into
+mergeable partial states per station/phase, per phase and over event pairs:
+count/mean/M2 (merged with Chan's parallel form of Welford's update), min/max,
+a fixed-bin histogram and a small t-digest for quantiles. The parent merges the
+partial states as they arrive. Memory does not depend on the file size.
+
+Compressed files (.gz, .zst) cannot be split by byte offset; they are
+decompressed once in the parent and the blocks are handed to the workers.
+
+Quantities: dt (.cc: dt column, dt.ct: t1 - t2) and weight per observation;
+n_obs, mean weight and dt spread (std over the stations) per event pair.
+"""
+import io
+import os
+from collections import deque
+from multiprocessing import Pool
+import numpy as np
+import pandas as pd
+from hypodd_io import compression, open_binary, open_text
+
+
+CHUNK_BYTES = 64 * 1024 ** 2
+DIGEST_DELTA = 200  # t-digest compression: ~delta/2 centroids, finer at the tails
+# Histogram edges per quantity (values outside go to the first/last bin)
+HIST_BINS = {
+    'dt': np.linspace(-2.0, 2.0, 401),
+    'weight': np.linspace(0.0, 1.0, 51),
+    'n_obs': np.arange(0, 202, 2),
+    'mean_weight': np.linspace(0.0, 1.0, 51),
+    'dt_std': np.linspace(0.0, 1.0, 101),
+}
+OBS_COLUMNS = {'cc': ['station', 'dt', 'weight', 'phase'], 'ct': ['station', 't1', 't2', 'weight', 'phase']}
+QUANTILES = (0.01, 0.05, 0.5, 0.95, 0.99)
+
+
+# --- mergeable summary of one quantity -------------------------------------------
+
+def _compress(means, weights, delta=DIGEST_DELTA, presorted=False):
+    """Merge t-digest centroids: buckets of unit width on the k1 scale (narrow at the tails)."""
+    if not presorted:
+        order = np.argsort(means, kind='stable')
+        means, weights = means[order], weights[order]
+    q = (np.cumsum(weights) - weights / 2) / weights.sum()
+    k = np.floor(delta / (2 * np.pi) * np.arcsin(2 * q - 1))
+    starts = np.flatnonzero(np.r_[True, k[1:] != k[:-1]])
+    w = np.add.reduceat(weights, starts)
+    return np.add.reduceat(means * weights, starts) / w, w
+
+
+def summarize(values, quantity):
+    """Partial state of a 1-D array of values."""
+    values = np.sort(np.asarray(values, dtype=float))
+    values = values[np.isfinite(values)]
+    edges = HIST_BINS[quantity]
+    hist = np.diff(np.r_[0, np.searchsorted(values, edges[1:-1], side='right'), len(values)])
+    if len(values) == 0:
+        return {'n': 0, 'mean': 0.0, 'm2': 0.0, 'min': np.inf, 'max': -np.inf, 'hist': hist,
+                'digest': (np.empty(0), np.empty(0))}
+    mean = values.mean()
+    return {'n': len(values), 'mean': mean, 'm2': float(((values - mean) ** 2).sum()),
+            'min': values[0], 'max': values[-1], 'hist': hist,
+            'digest': _compress(values, np.ones(len(values)), presorted=True)}
+
+
+def merge(a, b):
+    """Merge two partial states (Chan et al. for mean and M2)."""
+    if b['n'] == 0:
+        return a
+    if a['n'] == 0:
+        return b
+    n = a['n'] + b['n']
+    delta = b['mean'] - a['mean']
+    means = np.concatenate([a['digest'][0], b['digest'][0]])
+    weights = np.concatenate([a['digest'][1], b['digest'][1]])
+    return {'n': n, 'mean': a['mean'] + delta * b['n'] / n,
+            'm2': a['m2'] + b['m2'] + delta ** 2 * a['n'] * b['n'] / n,
+            'min': min(a['min'], b['min']), 'max': max(a['max'], b['max']), 'hist': a['hist'] + b['hist'],
+            'digest': _compress(means, weights)}
+
+
+def quantile(state, q):
+    """Quantile estimate from the t-digest of a partial state."""
+    means, weights = state['digest']
+    if state['n'] == 0:
+        return np.nan
+    cum = (np.cumsum(weights) - weights / 2) / weights.sum()
+    return float(np.interp(q, np.r_[0, cum, 1], np.r_[state['min'], means, state['max']]))
+
+
+def merge_states(total, part):
+    """Merge {group: {quantity: state}} dicts (in place into total)."""
+    for group, quantities in part.items():
+        into = total.setdefault(group, {})
+        for quantity, state in quantities.items():
+            into[quantity] = merge(into[quantity], state) if quantity in into else state
+    return total
+
+
+# --- scanning -------------------------------------------------------------------
+
+def chunk_ranges(path, chunk_bytes=CHUNK_BYTES):
+    """Byte ranges of about chunk_bytes that start at a '#' pair header."""
+    size = os.path.getsize(path)
+    starts = [0]
+    with open(path, 'rb') as f:
+        for target in range(chunk_bytes, size, chunk_bytes):
+            if target <= starts[-1]:
+                continue
+            f.seek(target)
+            f.readline()  # rest of the current line
+            pos = f.tell()
+            while True:
+                line = f.readline()
+                if not line:
+                    pos = size
+                    break
+                if line.startswith(b'#'):
+                    break
+                pos = f.tell()
+            if pos < size:
+                starts.append(pos)
+    return list(zip(starts, starts[1:] + [size]))
+
+
+def _group_states(codes, labels, columns, quantities):
+    """States per group for every quantity (codes: group index per value, columns: {quantity: values})."""
+    order = np.argsort(codes, kind='stable')
+    bounds = np.searchsorted(codes[order], np.arange(len(labels) + 1))
+    return {label: {q: summarize(columns[q][order[bounds[g]:bounds[g + 1]]], q) for q in quantities}
+            for g, label in enumerate(labels) if bounds[g + 1] > bounds[g]}
+
+
+def compressed_blocks(path, chunk_bytes=CHUNK_BYTES):
+    """Decompressed blocks of about chunk_bytes of a compressed file, each starting at a '#' pair header."""
+    rest = b''
+    with open_binary(path) as f:
+        while True:
+            data = f.read(chunk_bytes)
+            if not data:
+                break
+            data = rest + data
+            cut = data.rfind(b'\n#')
+            if cut < 0:
+                rest = data
+                continue
+            yield data[:cut + 1]
+            rest = data[cut + 1:]
+    if rest.strip():
+        yield rest
+
+
+def scan_chunk(path, start, end, kind):
+    """Partial states of one byte range (in a worker process)."""
+    with open(path, 'rb') as f:
+        f.seek(start)
+        data = f.read(end - start)
+    return scan_block(data, kind)
+
+
+def scan_block(data, kind):
+    """Partial states of a block of whole pairs (bytes)."""
+    if not data.strip():
+        return {}
+    # .cc: '# id1 id2 otc' / 'STA dt weight PHA', dt.ct: '# id1 id2' / 'STA t1 t2 weight PHA'
+    n_cols = len(OBS_COLUMNS[kind])
+    dtype = {0: 'category', 1: float, 2: float, n_cols - 1: 'category'}
+    if kind == 'ct':
+        dtype[3] = float
+    raw = pd.read_csv(io.BytesIO(data), sep=r'\s+', header=None, names=range(n_cols), dtype=dtype, engine='c')
+    first = raw[0].cat
+    is_header = first.codes.to_numpy() == first.categories.get_loc('#') if '#' in first.categories \
+        else np.zeros(len(raw), dtype=bool)
+    pair = np.cumsum(is_header)[~is_header] - 1
+    n_pairs = int(is_header.sum())
+    obs = raw[~is_header]
+    dt = (obs[1] if kind == 'cc' else obs[1] - obs[2]).to_numpy(dtype=float)
+    weight = obs[2 if kind == 'cc' else 3].to_numpy(dtype=float)
+    columns = {'dt': dt, 'weight': weight}
+
+    stations, phases = first.categories.astype(str), obs[n_cols - 1].cat.categories.astype(str)
+    sta_code = first.codes.to_numpy()[~is_header].astype(np.int64)
+    pha_code = obs[n_cols - 1].cat.codes.to_numpy().astype(np.int64)
+    labels = [f'{s}|{p}' for s in stations for p in phases]
+    states = _group_states(sta_code * len(phases) + pha_code, labels, columns, ('dt', 'weight'))
+    merge_states(states, _group_states(pha_code, [f'*|{p}' for p in phases], columns, ('dt', 'weight')))
+
+    # per event pair (pairs never span chunks): number of observations, mean weight, dt spread
+    n_obs = np.bincount(pair, minlength=n_pairs)
+    has = n_obs > 0
+    w_sum = np.bincount(pair, weights=weight, minlength=n_pairs)
+    dt_sum = np.bincount(pair, weights=dt, minlength=n_pairs)
+    dt_sq = np.bincount(pair, weights=dt ** 2, minlength=n_pairs)
+    var = np.where(n_obs > 1, (dt_sq - dt_sum ** 2 / np.maximum(n_obs, 1)) / np.maximum(n_obs - 1, 1), np.nan)
+    states['pairs|*'] = {'n_obs': summarize(n_obs[has], 'n_obs'),
+                         'mean_weight': summarize(w_sum[has] / n_obs[has], 'mean_weight'),
+                         'dt_std': summarize(np.sqrt(np.clip(var[has], 0, None)), 'dt_std')}
+    return states
+
+
+def _scan_task(task):
+    return scan_chunk(*task)
+
+
+def dt_file_stats(path, kind=None, processes=None, chunk_bytes=CHUNK_BYTES):
+    """
+    Streaming statistics of a .cc or dt.ct file.
+
+    Parameters:
+    -----------
+    path : str
+        Differential-time file (plain, .gz or .zst)
+    kind : str, optional
+        'cc' or 'ct'. Default: from the header (.cc headers carry the origin-time correction)
+    processes : int, optional
+        Worker processes. Default: os.cpu_count()
+    chunk_bytes : int
+        Approximate bytes per task
+
+    Returns: {'station|phase': {quantity: state}} with '*|P', '*|S' totals and 'pairs|*'
+    """
+    if kind is None:
+        with open_text(path, 'r') as f:
+            kind = 'cc' if len(f.readline().split()) >= 4 else 'ct'
+    states = {}
+    if compression(path):
+        n_blocks, processes = 0, processes or os.cpu_count()
+        with Pool(processes) as pool:
+            pending = deque()  # bounded, so memory stays at a few blocks
+            for block in compressed_blocks(path, chunk_bytes):
+                pending.append(pool.apply_async(scan_block, (block, kind)))
+                n_blocks += 1
+                if len(pending) > 2 * processes:
+                    merge_states(states, pending.popleft().get())
+            while pending:
+                merge_states(states, pending.popleft().get())
+        print(f"✅ Scanned {path} ({os.path.getsize(path) / 1024 ** 2:.0f} MB compressed, {n_blocks} blocks)")
+        return states
+
+    tasks = [(path, start, end, kind) for start, end in chunk_ranges(path, chunk_bytes)]
+    if len(tasks) == 1 or processes == 1:
+        for task in tasks:
+            merge_states(states, _scan_task(task))
+    else:
+        with Pool(processes) as pool:
+            for part in pool.imap_unordered(_scan_task, tasks):
+                merge_states(states, part)
+    print(f"✅ Scanned {path} ({os.path.getsize(path) / 1024 ** 2:.0f} MB, {len(tasks)} chunks)")
+    return states
+
+
+def qc_report(states):
+    """One row per group and quantity: n, mean, std, min, quantiles, max."""
+    rows = []
+    for group, quantities in sorted(states.items()):
+        station, phase = group.split('|')
+        for quantity, s in quantities.items():
+            row = {'station': station, 'phase': phase, 'quantity': quantity, 'n': s['n'],
+                   'mean': s['mean'] if s['n'] else np.nan,
+                   'std': np.sqrt(s['m2'] / (s['n'] - 1)) if s['n'] > 1 else np.nan,
+                   'min': s['min'] if s['n'] else np.nan}
+            row.update({f'p{round(q * 100):02d}': quantile(s, q) for q in QUANTILES})
+            row['max'] = s['max'] if s['n'] else np.nan
+            rows.append(row)
+    return pd.DataFrame(rows)
+
+
+def save_report(states, prefix):
+    """Write <prefix>.csv (summary table) and <prefix>.npz (histograms, bin edges and digests)."""
+    report = qc_report(states)
+    report.to_csv(f'{prefix}.csv', index=False, float_format='%.6g')
+    arrays = {f'edges_{q}': edges for q, edges in HIST_BINS.items()}
+    for group, quantities in states.items():
+        for quantity, s in quantities.items():
+            arrays[f'hist_{group}_{quantity}'] = s['hist']
+            arrays[f'digest_{group}_{quantity}'] = np.vstack(s['digest'])
+    np.savez_compressed(f'{prefix}.npz', **arrays)
+    print(f"✅ QC report: {prefix}.csv ({len(report)} rows), histograms in {prefix}.npz")
+    return report
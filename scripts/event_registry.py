@@ -0,0 +1,217 @@
+"""
+Persistent, append-only registry of hypoDD event IDs.
+
+create_event_id_mapping used to number the events of each CSV from 100000 in
+order of appearance, so the same event got different hypoDD IDs across runs,
+incremental updates and partitions. The registry keeps every
+original -> hypoDD ID assignment ever made; new IDs are only allocated for
+events it has not seen, and existing assignments never change.
+
+Storage: one .npz with the original IDs (sorted, as bytes), the aligned hypoDD
+IDs and the permutation that sorts the hypoDD IDs, so bulk lookups in both
+directions are np.searchsorted calls (~2 s per million IDs). Allocation takes a
+lock file (O_CREAT | O_EXCL, works on shared file systems) and replaces the
+.npz atomically, so partitions on several hosts can register concurrently.
+The holder touches the lock while it works, so only the lock of a crashed
+process goes stale.
+"""
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+import numpy as np
+import pandas as pd
+from validate_inputs import MAX_HYPODD_ID as MAX_ID  # .cc/dt.ct headers are %9d, .pha i10
+
+
+FIRST_ID = 100000
+LOCK_TIMEOUT_S = 60    # a lock not touched for this long is left over from a crashed process
+
+
+def empty_registry():
+    return {'original': np.empty(0, dtype='S1'), 'hypodd': np.empty(0, dtype=np.int64),
+            'by_hypodd': np.empty(0, dtype=np.int64)}
+
+
+def load_registry(registry_file):
+    """
+    Read a registry (empty if the file does not exist).
+
+    Returns: dict with 'original' (sorted original IDs as UTF-8 bytes), 'hypodd'
+             (aligned hypoDD IDs) and 'by_hypodd' (permutation sorting 'hypodd')
+    """
+    if not os.path.exists(registry_file):
+        return empty_registry()
+    with np.load(registry_file) as data:
+        return {key: data[key] for key in ('original', 'hypodd', 'by_hypodd')}
+
+
+def _save(registry, registry_file):
+    tmp = f'{registry_file}.{uuid.uuid4().hex}.tmp.npz'
+    np.savez(tmp, **registry)
+    os.replace(tmp, registry_file)
+
+
+def _lock(registry_file, timeout_s=LOCK_TIMEOUT_S):
+    """Take the registry lock (a lock file). Returns its path and the owner token written into it."""
+    lock_file = f'{registry_file}.lock'
+    token = f'{os.uname().nodename}:{os.getpid()}:{uuid.uuid4().hex}'
+    while True:
+        try:
+            fd = os.open(lock_file, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            with os.fdopen(fd, 'w') as f:
+                f.write(token)
+            return lock_file, token
+        except FileExistsError:
+            try:
+                if time.time() - os.path.getmtime(lock_file) > timeout_s:
+                    os.remove(lock_file)
+                    continue
+            except FileNotFoundError:
+                continue
+            time.sleep(0.05)
+
+
+def _heartbeat(lock_file, interval, stop):
+    while not stop.wait(interval):
+        try:
+            os.utime(lock_file)
+        except FileNotFoundError:
+            return
+
+
+@contextmanager
+def _locked(registry_file, timeout_s=LOCK_TIMEOUT_S):
+    """Hold the registry lock, touching it every timeout_s / 5 so it never looks stale while held."""
+    lock_file, token = _lock(registry_file, timeout_s)
+    stop = threading.Event()
+    beat = threading.Thread(target=_heartbeat, args=(lock_file, timeout_s / 5.0, stop), daemon=True)
+    beat.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        beat.join()
+        try:
+            with open(lock_file, 'r') as f:
+                owned = f.read() == token
+            if owned:  # never remove a lock another process took after breaking ours
+                os.remove(lock_file)
+        except FileNotFoundError:
+            pass
+
+
+def _as_ids(event_ids):
+    """Original IDs as a bytes array (fixed-width bytes compare ~2x faster than numpy str)."""
+    ids = np.asarray(pd.Series(event_ids, dtype=object).astype(str), dtype=str)
+    try:
+        return ids.astype('S')
+    except UnicodeEncodeError:
+        return np.char.encode(ids, 'utf-8')
+
+
+def lookup(registry, event_ids):
+    """
+    hypoDD IDs of original event IDs (vectorized).
+
+    Returns: int64 array, -1 for events not in the registry
+    """
+    ids = _as_ids(event_ids)
+    out = np.full(len(ids), -1, dtype=np.int64)
+    original = registry['original']
+    if len(original) == 0 or len(ids) == 0:
+        return out
+    order = np.argsort(ids, kind='stable')  # sorted needles walk the table in order (cache friendly)
+    pos = np.minimum(np.searchsorted(original, ids[order]), len(original) - 1)
+    found = original[pos] == ids[order]
+    out[order[found]] = registry['hypodd'][pos[found]]
+    return out
+
+
+def original_ids(registry, hypodd_ids):
+    """
+    Original event IDs of hypoDD IDs (vectorized).
+
+    Returns: object array of str, None for IDs not in the registry
+    """
+    hypodd_ids = np.asarray(hypodd_ids, dtype=np.int64)
+    out = np.full(len(hypodd_ids), None, dtype=object)
+    if len(registry['hypodd']) == 0:
+        return out
+    by_hypodd = registry['by_hypodd']
+    pos = np.minimum(np.searchsorted(registry['hypodd'][by_hypodd], hypodd_ids), len(by_hypodd) - 1)
+    rows = by_hypodd[pos]
+    found = registry['hypodd'][rows] == hypodd_ids
+    out[found] = np.char.decode(registry['original'][rows[found]], 'utf-8')
+    return out
+
+
+def _append(registry, new_original, new_hypodd):
+    original = np.concatenate([registry['original'], new_original])
+    hypodd = np.concatenate([registry['hypodd'], new_hypodd]).astype(np.int64)
+    order = np.argsort(original, kind='stable')
+    original, hypodd = original[order], hypodd[order]
+    if len(original) > 1 and (original[1:] == original[:-1]).any():
+        raise ValueError("An original event ID would be registered twice")
+    by_hypodd = np.argsort(hypodd, kind='stable')
+    if len(hypodd) > 1 and (np.diff(hypodd[by_hypodd]) == 0).any():
+        raise ValueError("A hypoDD ID would be assigned twice")
+    return {'original': original, 'hypodd': hypodd, 'by_hypodd': by_hypodd}
+
+
+def register_events(registry_file, event_ids, first_id=FIRST_ID):
+    """
+    hypoDD IDs of event_ids, allocating IDs for events the registry has not seen.
+
+    New events get consecutive IDs after the largest ID in the registry (first_id
+    for an empty registry), in order of first appearance in event_ids.
+
+    Returns: int64 array aligned with event_ids
+    """
+    ids = _as_ids(event_ids)
+    with _locked(registry_file):
+        registry = load_registry(registry_file)
+        hypodd = lookup(registry, ids)
+        unseen = pd.unique(ids[hypodd < 0])
+        if len(unseen):
+            start = int(registry['hypodd'].max()) + 1 if len(registry['hypodd']) else first_id
+            if start + len(unseen) - 1 > MAX_ID:
+                raise OverflowError(f"Registry {registry_file} is full: {len(unseen)} new events would exceed "
+                                    f"hypoDD ID {MAX_ID} (i10/%9d fields)")
+            registry = _append(registry, np.asarray(unseen, dtype=ids.dtype),
+                               np.arange(start, start + len(unseen), dtype=np.int64))
+            _save(registry, registry_file)
+            hypodd = lookup(registry, ids)
+    if len(unseen):
+        print(f"Registered {len(unseen)} new events in {registry_file} "
+              f"(IDs {start} to {start + len(unseen) - 1}, {len(registry['hypodd'])} total)")
+    return hypodd
+
+
+def import_mapping(registry_file, mapping_file):
+    """
+    Add the assignments of an existing event_id_mapping.csv to the registry.
+
+    Assignments the registry already has are skipped; an event or hypoDD ID that
+    is registered with a different partner raises ValueError.
+
+    Returns: number of imported assignments
+    """
+    mapping = pd.read_csv(mapping_file, dtype={'original_id': str})
+    original, hypodd = _as_ids(mapping['original_id']), mapping['synthetic_id'].to_numpy(dtype=np.int64)
+    if hypodd.min(initial=FIRST_ID) < 1 or hypodd.max(initial=FIRST_ID) > MAX_ID:
+        raise ValueError(f"{mapping_file} has hypoDD IDs outside 1..{MAX_ID}")
+    with _locked(registry_file):
+        registry = load_registry(registry_file)
+        known = lookup(registry, original)
+        clash = (known >= 0) & (known != hypodd)
+        taken = (known < 0) & pd.notna(original_ids(registry, hypodd))
+        if clash.any() or taken.any():
+            bad = [b.decode() for b in original[clash | taken][:5]]
+            raise ValueError(f"{mapping_file} conflicts with {registry_file} for events {bad}")
+        new = known < 0
+        if new.any():
+            _save(_append(registry, original[new], hypodd[new]), registry_file)
+    print(f"Imported {int(new.sum())} of {len(original)} assignments from {mapping_file}")
+    return int(new.sum())
@@ -0,0 +1,356 @@
+"""
+Optional in-process binding of the hypoDD core, built with f2py.
+
+build_extension() compiles the unmodified HypoDD-2.1b/src/hypoDD sources into
+an extension module. The main program is turned into a subroutine
+hypodd_main(fn_inp) (a copy of hypoDD.f is patched at build time: the .inp file
+name is passed as an argument instead of read from the command line, and all
+units are closed on return). relocate() is the array-level entry point: it
+takes events, stations and differential times as DataFrames/arrays and .inp
+parameters as keyword arguments, and returns relocations and residuals as
+DataFrames. Without the extension it falls back to the hypoDD binary, so
+callers can use the same API either way.
+
+Notes:
+- Fortran STOP statements (fatal input errors, array limits) terminate the
+  calling process. Use relocate(..., isolate=True) to run the call in a
+  forked child when inputs are not validated beforehand.
+- hypoDD works with relative file names, so the call changes the working
+  directory of the process; calls are serialized with a lock.
+"""
+import glob
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import numpy as np
+from hypodd_formats import (DT_CC_COLUMNS, DT_CT_COLUMNS, EVENT_COLUMNS, STATION_COLUMNS, read_dt_cc, read_dt_ct,
+                            read_event_dat, read_outputs, read_station_dat, write_dt_cc, write_dt_ct,
+                            write_event_dat, write_station_dat)
+
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+HYPODD_ROOT = os.path.abspath(f'{script_dir}/../HypoDD-2.1b')
+HYPODD_SRC = f'{HYPODD_ROOT}/src/hypoDD'
+EXT_DIR = f'{HYPODD_ROOT}/src/hypoDD_f2py'
+EXT_NAME = '_hypodd_core'
+
+# tmpfs keeps the intermediate text files off disk where available
+DEFAULT_WORK_ROOT = '/dev/shm' if os.path.isdir('/dev/shm') else None
+
+# .inp parameters (lower-case keyword arguments of relocate), hypoDD_2 format
+DEFAULT_PARAMS = {
+    'idat': 3, 'ipha': 3, 'dist': -9,
+    'obscc': 0, 'obsct': 0, 'mindist': -999, 'maxdist': -999, 'maxgap': -999,
+    'istart': 2, 'isolv': 2, 'iaq': 0,
+    # NITER WTCCP WTCCS WRCC WDCC WTCTP WTCTS WRCT WDCT DAMP
+    'iterations': [(5, 1.0, 0.5, -9, -9, 1.0, 0.5, -9, -9, 80)],
+    'imod': 0,
+    'ratio': 1.73, 'top': [0.0], 'vel': [6.0],   # imod 0: fixed vp/vs; imod 1: ratio may be a list
+    'mod3d': None,                                # imod 9: (file, lat_3d, lon_3d, rot_3d, (IPHA NDIP ISKIP SCALE1 SCALE2 XFAC TLIM NITPB))
+    'cid': 0, 'ids': [],
+}
+
+_lock = threading.Lock()
+
+
+def build_extension(force=False, fc_flags='-O'):
+    """
+    Compile the hypoDD sources into the f2py extension (requires gfortran,
+    numpy.f2py and meson/ninja).
+
+    Returns: path to the build directory
+    """
+    if not force and glob.glob(f'{EXT_DIR}/{EXT_NAME}*.so'):
+        print(f"Extension already built in {EXT_DIR}")
+        return EXT_DIR
+
+    build_dir = tempfile.mkdtemp(prefix='hypodd_f2py_')
+    for src in glob.glob(f'{HYPODD_SRC}/*.f') + glob.glob(f'{HYPODD_SRC}/*.c'):
+        if os.path.basename(src) != 'hypoDD.f':
+            shutil.copy(src, build_dir)
+
+    with open(f'{HYPODD_SRC}/hypoDD.f', 'r') as f:
+        source = f.read()
+    patches = [
+        ("      program hypoDD\n", "      subroutine hypodd_main(fn_arg)\n"),
+        ("\tinteger\t\tiargc\n", "\tinteger\t\tiargc\n\tcharacter\tfn_arg*(*)\n\tinteger\t\tiu\n\tlogical\t\tisopen\n"),
+        ("      narguments = iargc()\n", "      narguments = 1\n"),
+        ("          call getarg(1,fn_inp)\n", "          fn_inp= fn_arg\n"),
+        ("      end !of main routine",
+         "c--- close all files so outputs are flushed before returning\n"
+         "      do iu= 7,99\n"
+         "         inquire(unit=iu,opened=isopen)\n"
+         "         if(isopen) close(iu)\n"
+         "      enddo\n"
+         "      return\n"
+         "      end !of main routine"),
+    ]
+    for old, new in patches:
+        if old not in source:
+            raise RuntimeError(f"Cannot patch hypoDD.f, source line not found: {old.strip()}")
+        source = source.replace(old, new, 1)
+    with open(f'{build_dir}/hypodd_main.f', 'w') as f:
+        f.write(source)
+
+    sources = sorted(os.path.basename(p) for p in glob.glob(f'{build_dir}/*.f') + glob.glob(f'{build_dir}/*.c'))
+    cmd = [sys.executable, '-m', 'numpy.f2py', '-c', '-m', EXT_NAME, '--backend', 'meson',
+           f'-I{HYPODD_ROOT}/include', f'--opt={fc_flags}'] + sources + ['only:', 'hypodd_main', ':']
+    print(f"Building {EXT_NAME} with f2py in {build_dir}...")
+    result = subprocess.run(cmd, cwd=build_dir, capture_output=True, text=True)
+    if result.returncode != 0:
+        print(result.stdout[-3000:])
+        print("STDERR:", result.stderr[-3000:])
+        raise RuntimeError(f"f2py build failed with code {result.returncode}")
+
+    os.makedirs(EXT_DIR, exist_ok=True)
+    for so in glob.glob(f'{build_dir}/{EXT_NAME}*.so'):
+        shutil.copy(so, EXT_DIR)
+    shutil.rmtree(build_dir, ignore_errors=True)
+    print(f"✅ Extension built: {EXT_DIR}")
+    return EXT_DIR
+
+
+def load_extension():
+    """Import the compiled extension, or return None if it has not been built."""
+    if EXT_DIR not in sys.path:
+        sys.path.insert(0, EXT_DIR)
+    try:
+        import _hypodd_core
+    except ImportError:
+        return None
+    return _hypodd_core
+
+
+# ---------------------------------------------------------------------------
+# Input writers
+
+def write_hypodd_inp(inp_file, **params):
+    """
+    Write a hypoDD_2 control file from keyword parameters (see DEFAULT_PARAMS).
+    Input/output file names are the hypoDD defaults used by relocate().
+    """
+    p = {**DEFAULT_PARAMS, **params}
+    lines = ['hypoDD_2',
+             'dt.cc' if p['idat'] in (1, 3) else '', 'dt.ct' if p['idat'] in (2, 3) else '',
+             'event.dat', 'station.dat',
+             'hypoDD.loc', 'hypoDD.reloc', 'hypoDD.sta', 'hypoDD.res', 'hypoDD.src',
+             f"{p['idat']} {p['ipha']} {p['dist']}",
+             f"{p['obscc']} {p['obsct']} {p['mindist']} {p['maxdist']} {p['maxgap']}",
+             f"{p['istart']} {p['isolv']} {p['iaq']} {len(p['iterations'])}"]
+    lines += [' '.join(str(v) for v in it) for it in p['iterations']]
+    lines.append(str(p['imod']))
+
+    if p['imod'] == 0:
+        lines += [f"{len(p['top'])} {p['ratio']}",
+                  ' '.join(str(v) for v in p['top']),
+                  ' '.join(str(v) for v in p['vel'])]
+    elif p['imod'] == 1:
+        ratio = p['ratio'] if np.ndim(p['ratio']) else [p['ratio']] * len(p['top'])
+        lines += [' '.join(str(v) for v in list(p['top']) + [-9]),
+                  ' '.join(str(v) for v in list(p['vel']) + [-9]),
+                  ' '.join(str(v) for v in list(ratio) + [-9])]
+    elif p['imod'] == 9:
+        fn_mod3d, lat_3d, lon_3d, rot_3d, raypar = p['mod3d']
+        lines += [fn_mod3d, f'{lat_3d} {lon_3d} {rot_3d}', ' '.join(str(v) for v in raypar)]
+    else:
+        raise ValueError(f"IMOD={p['imod']} is not supported by write_hypodd_inp")
+
+    lines.append(str(p['cid']))
+    ids = list(p['ids'])
+    lines += [' '.join(str(i) for i in ids[k:k + 8]) for k in range(0, len(ids), 8)]
+
+    with open(inp_file, 'w') as f:
+        # Blank file names must stay as empty lines (they are counted by getinp2)
+        f.write('\n'.join(lines) + '\n')
+
+
+def read_hypodd_inp(inp_file):
+    """
+    Parse a hypoDD_2 control file into keyword parameters for relocate().
+    File names in the control file are ignored.
+    """
+    with open(inp_file, 'r') as f:
+        if not f.readline().startswith(('hypoDD_2', 'hypoDD_v2')):
+            raise ValueError(f"{inp_file} is not in hypoDD_2 format")
+        lines = [line.rstrip('\n') for line in f if not (line[:1] == '*' or line[1:2] == '*')]
+
+    p = {}
+    p['idat'], p['ipha'], p['dist'] = [_num(v) for v in lines[9].split()[:3]]
+    p['obscc'], p['obsct'], p['mindist'], p['maxdist'], p['maxgap'] = [_num(v) for v in lines[10].split()[:5]]
+    p['istart'], p['isolv'], p['iaq'], nset = [_num(v) for v in lines[11].split()[:4]]
+    p['iterations'] = [tuple(_num(v) for v in lines[12 + i].split()[:10]) for i in range(nset)]
+    k = 12 + nset
+    p['imod'] = _num(lines[k].split()[0])
+    if p['imod'] == 0:
+        nl, p['ratio'] = _num(lines[k + 1].split()[0]), _num(lines[k + 1].split()[1])
+        p['top'] = [_num(v) for v in lines[k + 2].split()[:nl]]
+        p['vel'] = [_num(v) for v in lines[k + 3].split()[:nl]]
+    elif p['imod'] == 1:
+        p['top'], p['vel'], p['ratio'] = [[_num(v) for v in lines[k + j].split() if _num(v) != -9] for j in (1, 2, 3)]
+    elif p['imod'] == 9:
+        lat_3d, lon_3d, rot_3d = [_num(v) for v in lines[k + 2].split()[:3]]
+        p['mod3d'] = (lines[k + 1].strip(), lat_3d, lon_3d, rot_3d, tuple(_num(v) for v in lines[k + 3].split()[:8]))
+    else:
+        raise ValueError(f"IMOD={p['imod']} is not supported by read_hypodd_inp")
+    rest = [line for line in lines[k + 4:] if line.strip()]
+    p['cid'] = _num(rest[0].split()[0]) if rest else 0
+    p['ids'] = [int(v) for line in rest[1:] for v in line.split()]
+    return p
+
+
+def read_hypodd_files(inp_file):
+    """
+    File names of a hypoDD_2 control file.
+
+    Returns: dict with cc, ct, event, station (inputs) and loc, reloc, sta, res, src (outputs)
+    """
+    with open(inp_file, 'r') as f:
+        f.readline()
+        lines = [line.strip() for line in f if not (line[:1] == '*' or line[1:2] == '*')]
+    return dict(zip(['cc', 'ct', 'event', 'station', 'loc', 'reloc', 'sta', 'res', 'src'], lines[:9]))
+
+
+def _num(s):
+    v = float(s)
+    return int(v) if v.is_integer() and '.' not in s else v
+
+
+# ---------------------------------------------------------------------------
+# Entry points
+
+def run_inp(inp_file, work_dir, backend='auto', isolate=False):
+    """
+    Run hypoDD on an existing control file in work_dir.
+
+    backend: 'extension', 'subprocess' or 'auto' (extension if built)
+    Returns: True on success
+    """
+    ext = load_extension() if backend in ('auto', 'extension') else None
+    if ext is None:
+        if backend == 'extension':
+            raise RuntimeError("hypoDD extension not built: run hypodd_ext.build_extension()")
+        result = subprocess.run([f'{HYPODD_SRC}/hypoDD', inp_file], cwd=work_dir, capture_output=True, text=True)
+        return result.returncode == 0
+
+    def call():
+        with _lock:
+            cwd = os.getcwd()
+            os.chdir(work_dir)
+            try:
+                ext.hypodd_main(inp_file)
+            finally:
+                os.chdir(cwd)
+
+    if not isolate:
+        call()
+        return True
+
+    import multiprocessing
+    child = multiprocessing.get_context('fork').Process(target=call)
+    child.start()
+    child.join()
+    return child.exitcode == 0
+
+
+def relocate(events, stations, dt_cc=None, dt_ct=None, work_dir=None, backend='auto', isolate=False,
+             keep_files=False, **params):
+    """
+    Relocate events from in-memory tables.
+
+    Parameters:
+    -----------
+    events : DataFrame
+        EVENT_COLUMNS (event.dat layout: date yyyymmdd, time hhmmsscc, lat, lon, depth, mag, eh, ez, rms, id)
+    stations : DataFrame
+        STATION_COLUMNS
+    dt_cc, dt_ct : DataFrame, optional
+        DT_CC_COLUMNS / DT_CT_COLUMNS differential times, one block per consecutive (id1, id2) run
+    work_dir : str, optional
+        Scratch directory. Default: a temporary directory on /dev/shm
+    backend : str
+        'extension', 'subprocess' or 'auto'
+    isolate : bool
+        Run the extension in a forked child so a Fortran STOP cannot kill the caller
+    keep_files : bool
+        Keep the scratch directory (returned as 'work_dir')
+    **params :
+        .inp parameters, see DEFAULT_PARAMS (e.g. idat=1, obscc=4, iterations=[...])
+
+    Returns:
+    --------
+    dict of DataFrames: 'reloc', 'loc', 'residuals', 'stations' (+ 'work_dir' if kept)
+    """
+    params = {**DEFAULT_PARAMS, **params}
+    if params['idat'] in (1, 3) and dt_cc is None:
+        raise ValueError("IDAT uses cross-correlation data but dt_cc is None")
+    if params['idat'] in (2, 3) and dt_ct is None:
+        raise ValueError("IDAT uses catalog data but dt_ct is None")
+
+    own_dir = work_dir is None
+    work_dir = work_dir or tempfile.mkdtemp(prefix='hypodd_', dir=DEFAULT_WORK_ROOT)
+    os.makedirs(work_dir, exist_ok=True)
+    try:
+        write_event_dat(events, f'{work_dir}/event.dat')
+        write_station_dat(stations, f'{work_dir}/station.dat')
+        if dt_cc is not None:
+            write_dt_cc(dt_cc, f'{work_dir}/dt.cc')
+        if dt_ct is not None:
+            write_dt_ct(dt_ct, f'{work_dir}/dt.ct')
+        if params['imod'] == 9:
+            shutil.copy(params['mod3d'][0], work_dir)
+            params['mod3d'] = (os.path.basename(params['mod3d'][0]),) + tuple(params['mod3d'][1:])
+        write_hypodd_inp(f'{work_dir}/hypoDD.inp', **params)
+
+        if not run_inp('hypoDD.inp', work_dir, backend=backend, isolate=isolate):
+            raise RuntimeError(f"hypoDD failed in {work_dir}")
+        outputs = read_outputs(work_dir)
+        if keep_files:
+            outputs['work_dir'] = work_dir
+        return outputs
+    finally:
+        if own_dir and not keep_files:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def compare_backends(example_dir, inp_file='hypoDD.inp'):
+    """
+    Run an example with the hypoDD binary and with the extension (from arrays
+    read out of the example's input files) and compare the outputs.
+
+    Returns: True if relocations and residuals are identical
+    """
+    params = read_hypodd_inp(f'{example_dir}/{inp_file}')
+    files = read_hypodd_files(f'{example_dir}/{inp_file}')
+    fn_cc, fn_ct, fn_eve, fn_sta = files['cc'], files['ct'], files['event'], files['station']
+
+    ref_dir = tempfile.mkdtemp(prefix='hypodd_ref_')
+    try:
+        for name in os.listdir(example_dir):
+            if os.path.isfile(f'{example_dir}/{name}'):
+                shutil.copy(f'{example_dir}/{name}', ref_dir)
+        print("Running hypoDD binary...")
+        run_inp(inp_file, ref_dir, backend='subprocess')
+        reference = read_outputs(ref_dir)
+    finally:
+        shutil.rmtree(ref_dir, ignore_errors=True)
+
+    print("Running hypoDD extension from arrays...")
+    outputs = relocate(
+        read_event_dat(f'{example_dir}/{fn_eve}'),
+        read_station_dat(f'{example_dir}/{fn_sta}'),
+        dt_cc=read_dt_cc(f'{example_dir}/{fn_cc}') if fn_cc else None,
+        dt_ct=read_dt_ct(f'{example_dir}/{fn_ct}') if fn_ct else None,
+        backend='extension', **params)
+
+    same = True
+    for key in ('reloc', 'residuals', 'stations'):
+        a, b = reference[key], outputs[key]
+        numeric = a.select_dtypes('number').columns
+        equal = a.shape == b.shape and np.allclose(a[numeric].to_numpy(float), b[numeric].to_numpy(float),
+                                                   rtol=0, atol=1e-6, equal_nan=True)
+        print(f"  {key:10s} binary={a.shape} extension={b.shape} {'identical' if equal else 'DIFFERENT'}")
+        same &= equal
+    return same
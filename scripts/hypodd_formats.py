@@ -0,0 +1,154 @@
+"""
+Plain-text hypoDD formats: event.dat, station.dat, .cc/dt.ct and the output files.
+
+Vectorized writers and readers shared by the converters (csv_hypodd), the
+in-process binding (hypodd_ext), the dry run and the QC tools. Paths ending in
+.gz or .zst are compressed/decompressed on the fly (see hypodd_io).
+"""
+import os
+import numpy as np
+import pandas as pd
+from hypodd_io import compressed_source, open_text
+
+
+EVENT_COLUMNS = ['date', 'time', 'latitude', 'longitude', 'depth', 'magnitude', 'eh', 'ez', 'rms', 'hypodd_id']
+STATION_COLUMNS = ['station', 'latitude', 'longitude', 'elevation']
+DT_CC_COLUMNS = ['id1', 'id2', 'station', 'dt', 'weight', 'phase']
+DT_CT_COLUMNS = ['id1', 'id2', 'station', 't1', 't2', 'weight', 'phase']
+RELOC_COLUMNS = ['hypodd_id', 'latitude', 'longitude', 'depth', 'x_m', 'y_m', 'z_m', 'ex_m', 'ey_m', 'ez_m',
+                 'year', 'month', 'day', 'hour', 'minute', 'second', 'magnitude',
+                 'n_cc_p', 'n_cc_s', 'n_cat_p', 'n_cat_s', 'rms_cc', 'rms_cat', 'cluster_id']
+LOC_COLUMNS = RELOC_COLUMNS[:17] + ['cluster_id']
+RES_COLUMNS = ['station', 'dt', 'id1', 'id2', 'data_type', 'weight_in', 'residual_ms', 'weight', 'offset_m']
+STA_COLUMNS = ['station', 'latitude', 'longitude', 'distance_m', 'azimuth', 'n_cc_p', 'n_cc_s',
+               'n_cat_p', 'n_cat_s', 'rms_cc', 'rms_cat', 'cluster_id']
+
+
+def _fmt(fmt, values):
+    return np.char.mod(fmt, np.asarray(values))
+
+
+def write_event_dat(events, event_file):
+    """Write events (EVENT_COLUMNS) in ph2dt's event.dat layout."""
+    ev = events[EVENT_COLUMNS]
+    lines = (_fmt('%8d', ev['date'].astype(np.int64)) + '  ' + _fmt('%8d', ev['time'].astype(np.int64)) + '  '
+             + _fmt('%8.4f', ev['latitude']) + '  ' + _fmt('%9.4f', ev['longitude']) + '  '
+             + _fmt('%9.3f', ev['depth']) + '  ' + _fmt('%5.2f', ev['magnitude']) + '  '
+             + _fmt('%6.2f', ev['eh']) + '  ' + _fmt('%6.2f', ev['ez']) + '  '
+             + _fmt('%5.2f', ev['rms']) + ' ' + _fmt('%10d', ev['hypodd_id'].astype(np.int64)))
+    with open_text(event_file, 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+
+
+def write_station_dat(stations, station_file):
+    """Write stations (STATION_COLUMNS) as STA LAT LON ELV."""
+    np.savetxt(station_file, stations[STATION_COLUMNS].to_numpy(dtype=object), fmt='%-7s %10.6f %11.6f %9.1f')
+
+
+def _write_pairs(obs, out_file, header_fmt, obs_lines):
+    """Write observations with a '#' header line wherever the (id1, id2) pair changes (row order is kept)."""
+    id1 = obs['id1'].astype(np.int64).to_numpy()
+    id2 = obs['id2'].astype(np.int64).to_numpy()
+    new_pair = np.ones(len(obs), dtype=bool)
+    new_pair[1:] = (id1[1:] != id1[:-1]) | (id2[1:] != id2[:-1])
+
+    out = np.empty(len(obs) + new_pair.sum(), dtype=object)
+    pos = np.arange(len(obs)) + np.cumsum(new_pair)
+    out[pos] = obs_lines
+    out[pos[new_pair] - 1] = header_fmt(obs[new_pair])
+    with open_text(out_file, 'w') as f:
+        if len(out):
+            f.write('\n'.join(out) + '\n')
+
+
+def write_dt_cc(dt_cc, cc_file):
+    """Write cross-correlation differential times (DT_CC_COLUMNS, optional 'otc')."""
+    obs_lines = (dt_cc['station'].astype(str).str.ljust(7).to_numpy(dtype=str) + ' '
+                 + _fmt('%9.6f', dt_cc['dt']) + ' ' + _fmt('%5.3f', dt_cc['weight']) + ' '
+                 + dt_cc['phase'].astype(str).to_numpy(dtype=str))
+
+    def header(first):
+        otc = first['otc'] if 'otc' in first else np.zeros(len(first))
+        return ('# ' + _fmt('%9d', first['id1'].astype(np.int64)) + ' ' + _fmt('%9d', first['id2'].astype(np.int64))
+                + ' ' + _fmt('%.6f', otc))
+
+    _write_pairs(dt_cc, cc_file, header, obs_lines)
+
+
+def write_dt_ct(dt_ct, ct_file):
+    """Write catalog differential times (DT_CT_COLUMNS)."""
+    obs_lines = (dt_ct['station'].astype(str).str.ljust(7).to_numpy(dtype=str) + ' '
+                 + _fmt('%9.3f', dt_ct['t1']) + ' ' + _fmt('%9.3f', dt_ct['t2']) + ' '
+                 + _fmt('%6.4f', dt_ct['weight']) + ' ' + dt_ct['phase'].astype(str).to_numpy(dtype=str))
+
+    def header(first):
+        return '# ' + _fmt('%9d', first['id1'].astype(np.int64)) + ' ' + _fmt('%9d', first['id2'].astype(np.int64))
+
+    _write_pairs(dt_ct, ct_file, header, obs_lines)
+
+
+# ---------------------------------------------------------------------------
+# Readers (input files of the examples and hypoDD outputs)
+
+def _read_table(path, columns, str_cols=()):
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return pd.DataFrame(columns=columns)
+    try:
+        df = pd.read_csv(path, sep=r'\s+', header=None, names=columns, usecols=range(len(columns)),
+                         dtype={c: str for c in str_cols}, engine='c')
+    except pd.errors.EmptyDataError:  # compressed empty file
+        return pd.DataFrame(columns=columns)
+    return df
+
+
+def read_event_dat(event_file):
+    return _read_table(event_file, EVENT_COLUMNS)
+
+
+def read_station_dat(station_file):
+    try:
+        return _read_table(station_file, STATION_COLUMNS, str_cols=('station',))
+    except pd.errors.ParserError:  # elevation is optional in hypoDD station files
+        return _read_table(station_file, STATION_COLUMNS[:3], str_cols=('station',)).assign(elevation=0.0)
+
+
+def _read_pairs(path, obs_columns):
+    raw = pd.read_csv(path, sep=r'\s+', header=None, names=range(len(obs_columns)), dtype=str, engine='c')
+    is_header = (raw[0] == '#').to_numpy()
+    pair_idx = np.cumsum(is_header) - 1
+    hdr = raw[is_header]
+    obs = raw[~is_header].copy()
+    obs.columns = obs_columns
+    obs_pair = pair_idx[~is_header]
+    obs.insert(0, 'id2', hdr[2].astype(np.int64).to_numpy()[obs_pair])
+    obs.insert(0, 'id1', hdr[1].astype(np.int64).to_numpy()[obs_pair])
+    for col in obs_columns[1:-1]:
+        obs[col] = pd.to_numeric(obs[col])
+    return obs.reset_index(drop=True), hdr, obs_pair
+
+
+def read_dt_cc(cc_file):
+    obs, hdr, obs_pair = _read_pairs(cc_file, ['station', 'dt', 'weight', 'phase'])
+    obs['otc'] = pd.to_numeric(hdr[3]).fillna(0.0).to_numpy()[obs_pair]
+    return obs
+
+
+def read_dt_ct(ct_file):
+    return _read_pairs(ct_file, ['station', 't1', 't2', 'weight', 'phase'])[0]
+
+
+def read_outputs(work_dir):
+    """
+    Read hypoDD outputs of a run directory into DataFrames (plain or .gz/.zst files).
+
+    Returns: dict with 'reloc', 'loc', 'residuals' and 'stations'
+    """
+    def path(name):
+        return compressed_source(f'{work_dir}/{name}') or f'{work_dir}/{name}'
+
+    return {
+        'reloc': _read_table(path('hypoDD.reloc'), RELOC_COLUMNS),
+        'loc': _read_table(path('hypoDD.loc'), LOC_COLUMNS),
+        'residuals': _read_table(path('hypoDD.res'), RES_COLUMNS, str_cols=('station',)),
+        'stations': _read_table(path('hypoDD.sta'), STA_COLUMNS, str_cols=('station',)),
+    }
@@ -0,0 +1,358 @@
+"""
+Compressed text files and FIFO streaming to the Fortran programs.
+
+open_text() opens .gz and .zst paths with streaming (de)compression, so the
+wrappers can keep .pha, .cc, dt.ct and .res files compressed. zstandard is
+imported only for .zst paths.
+
+ph2dt and hypoDD only read plain files, under the names given in their control
+files. fortran_files() serves a compressed file under its plain name while a
+program runs:
+- inputs read once (ph2dt's station and phase files) are fed through a named
+  pipe by a producer thread, so the decompressed text never reaches the disk;
+- inputs read more than once (hypoDD reads its data again for every cluster)
+  are decompressed to a temporary file on tmpfs, linked under the plain name;
+- outputs opened once (ph2dt's dt.ct) are written to a named pipe and
+  compressed on the fly by a consumer thread; outputs reopened by the program
+  (hypoDD's residual file) go to a temporary file compressed after the run.
+"""
+import gzip
+import io
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+
+SUFFIXES = {'.gz': 'gz', '.zst': 'zst'}
+GZIP_LEVEL = 3   # level 6 (the default) is ~3x slower for ~10% smaller .cc files
+ZSTD_LEVEL = 3
+COPY_BYTES = 1024 ** 2
+
+# Temporary copies of inputs read more than once stay off the shared file system where possible
+TMP_ROOT = '/dev/shm' if os.path.isdir('/dev/shm') else None
+
+
+def compression(path):
+    """'gz', 'zst' or None, from the file name."""
+    return SUFFIXES.get(os.path.splitext(str(path))[1])
+
+
+def strip_compression(path):
+    """Path without a .gz/.zst suffix."""
+    return os.path.splitext(path)[0] if compression(path) else path
+
+
+def open_binary(path, mode='rb'):
+    """Open a file for binary streaming, compressing/decompressing by suffix."""
+    codec = compression(path)
+    if codec == 'gz':
+        return gzip.open(path, mode, compresslevel=GZIP_LEVEL)
+    if codec == 'zst':
+        import zstandard
+
+        raw = open(path, mode)
+        if 'r' in mode:
+            return zstandard.ZstdDecompressor().stream_reader(raw, closefd=True)
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).stream_writer(raw, closefd=True)
+    return open(path, mode)
+
+
+def open_text(path, mode='r'):
+    """open() for text that also reads and writes .gz/.zst paths."""
+    if compression(path) is None:
+        return open(path, mode)
+    return io.TextIOWrapper(open_binary(path, mode.replace('t', '') + 'b'), encoding='utf-8')
+
+
+def compressed_source(path):
+    """
+    File that holds the contents of path: path itself, or a compressed sibling
+    (path.gz, path.zst) if path does not exist. None if neither exists.
+    """
+    if os.path.exists(path):
+        siblings = [path + s for s in SUFFIXES if os.path.exists(path + s)]
+        if siblings:
+            raise ValueError(f"Both {path} and {siblings[0]} exist; remove the stale one")
+        return path
+    for suffix in SUFFIXES:
+        if os.path.exists(path + suffix):
+            return path + suffix
+    return None
+
+
+# --- serving compressed files to the Fortran programs ---------------------------
+
+def _input_fifo(path):
+    """
+    Named pipe at path for an input read once, or None if the program could not see its end.
+
+    gfortran opens files read-write first and only falls back to read-only when that
+    is refused, and a reader that also holds a write end never gets end-of-file. The
+    wrapper therefore opens its ends (a write end and an idle read end that keeps the
+    pipe open until the program arrives) and then makes the pipe read-only. Where
+    read-write access is still granted (root ignores the permission bits), the caller
+    falls back to a temporary file.
+
+    Returns: (write fd, idle read fd) or None
+    """
+    os.mkfifo(path, 0o600)
+    idle = os.open(path, os.O_RDONLY | os.O_NONBLOCK)
+    write = os.open(path, os.O_WRONLY)
+    os.chmod(path, 0o444)
+    try:
+        os.close(os.open(path, os.O_RDWR | os.O_NONBLOCK))
+    except PermissionError:
+        return write, idle
+    os.close(write)
+    os.close(idle)
+    os.remove(path)
+    return None
+
+
+def _feed(write_fd, source, errors):
+    """Producer: decompress source into the named pipe (blocks while the pipe is full)."""
+    try:
+        with os.fdopen(write_fd, 'wb') as out, open_binary(source) as src:
+            shutil.copyfileobj(src, out, COPY_BYTES)
+    except Exception as e:
+        errors.append(e)
+
+
+def _drain(fifo, target, errors):
+    """Consumer: compress what the program writes to the named pipe into target."""
+    try:
+        with open(fifo, 'rb') as src, open_binary(target, 'wb') as out:
+            shutil.copyfileobj(src, out, COPY_BYTES)
+    except Exception as e:
+        errors.append(e)
+
+
+def _release(fifo, idle_fd):
+    """Unblock a thread after the program exited without reading or opening its pipe."""
+    if idle_fd is None:  # consumer waiting for the program to open the output
+        try:
+            os.close(os.open(fifo, os.O_WRONLY | os.O_NONBLOCK))
+        except OSError:
+            pass
+        return
+    os.set_blocking(idle_fd, True)  # producer waiting for room in the pipe: discard the rest
+    while os.read(idle_fd, COPY_BYTES):
+        pass
+
+
+def _suffix(codec):
+    return next(s for s, c in SUFFIXES.items() if c == codec)
+
+
+def remove_variants(path):
+    """Remove the plain/compressed siblings of path (not path itself), so compressed_source stays unambiguous."""
+    plain = strip_compression(path)
+    for old in [plain] + [plain + s for s in SUFFIXES]:
+        if old != path and os.path.lexists(old):
+            os.remove(old)
+
+
+def _remove_outputs(path):
+    for old in [path] + [path + s for s in SUFFIXES]:
+        if os.path.lexists(old):
+            os.remove(old)
+
+
+@contextmanager
+def fortran_files(run_dir, read_once=(), read_many=(), write_once=None, write_many=None):
+    """
+    Serve compressed inputs and outputs under the plain names a Fortran program uses.
+
+    Parameters:
+    -----------
+    run_dir : str
+        Working directory of the program
+    read_once : list of str
+        Input names (relative to run_dir) the program reads in one pass: fed through a named
+        pipe (or a temporary file, see _input_fifo)
+    read_many : list of str
+        Input names the program may rewind or reopen: decompressed to a temporary file
+    write_once : dict, optional
+        {output name: 'gz'|'zst'} of outputs opened once: compressed from a named pipe into <name>.gz/.zst
+    write_many : dict, optional
+        {output name: 'gz'|'zst'} of outputs the program may reopen: written to a temporary
+        file and compressed when the context exits
+
+    Inputs that exist as plain files are left alone.
+    Yields: {name: 'fifo'|'tmpfile'} of the staged files
+    """
+    staged, threads, errors, links, pending = {}, [], [], [], []
+    tmp_dir = tempfile.mkdtemp(prefix='hypodd_io_', dir=TMP_ROOT)
+    try:
+        for name, once in [(n, True) for n in read_once] + [(n, False) for n in read_many]:
+            if not name or name in staged:
+                continue
+            path = f'{run_dir}/{name}'
+            source = compressed_source(path)
+            if source is None or source == path:
+                continue
+            ends = _input_fifo(path) if once else None
+            if ends:
+                thread = threading.Thread(target=_feed, args=(ends[0], source, errors), daemon=True)
+                threads.append((thread, path, ends[1]))
+                thread.start()
+                staged[name] = 'fifo'
+            else:
+                tmp = f'{tmp_dir}/{os.path.basename(name)}'
+                with open_binary(source) as src, open(tmp, 'wb') as out:
+                    shutil.copyfileobj(src, out, COPY_BYTES)
+                os.symlink(tmp, path)
+                staged[name] = 'tmpfile'
+            links.append(path)
+
+        for name, codec in (write_once or {}).items():
+            path = f'{run_dir}/{name}'
+            _remove_outputs(path)
+            os.mkfifo(path)
+            links.append(path)
+            thread = threading.Thread(target=_drain, args=(path, path + _suffix(codec), errors), daemon=True)
+            threads.append((thread, path, None))
+            thread.start()
+            staged[name] = 'fifo'
+
+        for name, codec in (write_many or {}).items():
+            path = f'{run_dir}/{name}'
+            _remove_outputs(path)
+            tmp = f'{tmp_dir}/out_{os.path.basename(name)}'
+            os.symlink(tmp, path)
+            links.append(path)
+            pending.append((tmp, path + _suffix(codec)))
+            staged[name] = 'tmpfile'
+        yield staged
+    finally:
+        for thread, fifo, idle_fd in threads:
+            thread.join(timeout=0.1)
+            if thread.is_alive():
+                _release(fifo, idle_fd)
+            thread.join()
+            if idle_fd is not None:
+                os.close(idle_fd)
+        for path in links:
+            if os.path.lexists(path):
+                os.remove(path)
+        try:
+            for tmp, target in pending:
+                if os.path.exists(tmp):
+                    with open(tmp, 'rb') as src, open_binary(target, 'wb') as out:
+                        shutil.copyfileobj(src, out, COPY_BYTES)
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+    if errors:
+        raise errors[0]
+
+
+def ph2dt_streams(ph2dt_params, compress=None):
+    """fortran_files() arguments for ph2dt (params: read_ph2dt_inp), optionally compressing dt.ct."""
+    return {'read_once': [ph2dt_params['station_file'], ph2dt_params['phase_file']],
+            'write_once': {'dt.ct': compress} if compress else None}
+
+
+def hypodd_streams(files, params, compress=None):
+    """
+    fortran_files() arguments for hypoDD, optionally compressing the residual file.
+
+    files: file names of the control file (read_hypodd_files)
+    params: read_hypodd_inp() parameters. hypoDD reads its inputs again for every
+            cluster unless no clustering applies (OBSCC/OBSCT of the used data are 0),
+            so inputs are only piped in that case. The residual file is rewritten
+            for every cluster.
+    """
+    names = [files['event'], files['station']]
+    names += [files['cc']] if params['idat'] in (1, 3) else []
+    names += [files['ct']] if params['idat'] in (2, 3) else []
+    min_obs = {1: params['obscc'], 2: params['obsct'], 3: params['obscc'] + params['obsct']}.get(params['idat'], 0)
+    streams = {'read_once': names} if min_obs == 0 else {'read_many': names}
+    if compress and files['res']:
+        streams['write_many'] = {files['res']: compress}
+    return streams
+
+
+# --- benchmark ------------------------------------------------------------------
+
+def _dir_bytes(directory):
+    return sum(os.path.getsize(f'{directory}/{name}') for name in os.listdir(directory)
+               if os.path.isfile(f'{directory}/{name}'))
+
+
+def benchmark_io(run_dir, hypodd_inp='hypoDD.inp', ph2dt='ph2dt', hypodd='hypoDD', codecs=('gz', 'zst'),
+                 repeat=3):
+    """
+    Compare plain and compressed files for a ph2dt + hypoDD run.
+
+    The run directory is copied next to itself (same file system), once per run.
+    Compressed runs keep the phase and .cc files compressed, ph2dt writes dt.ct
+    through a compressing pipe and hypoDD reads the compressed files and writes a
+    compressed residual file. Reports the bytes written to the directory (inputs
+    and outputs) and the best wall time, and checks that hypoDD.reloc is unchanged.
+
+    Parameters:
+    -----------
+    run_dir : str
+        Directory with ph2dt.inp, the hypoDD control file and their inputs
+    hypodd_inp : str
+        hypoDD control file in run_dir
+    ph2dt, hypodd : str
+        Program paths
+    codecs : tuple
+        Codecs to compare with the plain run (zst is skipped without zstandard)
+    repeat : int
+        Runs per codec
+
+    Returns: DataFrame with one row per codec
+    """
+    import importlib.util
+    import pandas as pd
+    from csv_hypodd import read_ph2dt_inp
+    from hypodd_ext import read_hypodd_files, read_hypodd_inp
+
+    ph2dt_params = read_ph2dt_inp(f'{run_dir}/ph2dt.inp')
+    hypodd_params = read_hypodd_inp(f'{run_dir}/{hypodd_inp}')
+    files = read_hypodd_files(f'{run_dir}/{hypodd_inp}')
+    outputs = {'dt.ct', 'event.dat', 'event.sel', 'station.sel'} | {files[k] for k in ('loc', 'reloc', 'sta', 'res', 'src')}
+    rows, reference = [], None
+    for codec in (None,) + tuple(codecs):
+        if codec == 'zst' and importlib.util.find_spec('zstandard') is None:
+            print("zstandard not installed, skipping zst")
+            continue
+        timings = []
+        for _ in range(repeat):
+            work = tempfile.mkdtemp(prefix='hypodd_iobench_', dir=os.path.dirname(os.path.abspath(run_dir)))
+            try:
+                start = time.perf_counter()
+                for name in (ph2dt_params['station_file'], ph2dt_params['phase_file'], files['cc'], 'ph2dt.inp', hypodd_inp):
+                    if name in outputs or not name:
+                        continue
+                    if codec and name in (ph2dt_params['phase_file'], files['cc']):
+                        with open(f'{run_dir}/{name}', 'rb') as src, open_binary(f'{work}/{name}{_suffix(codec)}', 'wb') as out:
+                            shutil.copyfileobj(src, out, COPY_BYTES)
+                    else:
+                        shutil.copy(f'{run_dir}/{name}', work)
+                input_bytes = _dir_bytes(work)
+                with fortran_files(work, **ph2dt_streams(ph2dt_params, codec)):
+                    subprocess.run([ph2dt, 'ph2dt.inp'], cwd=work, capture_output=True, check=True)
+                with fortran_files(work, **hypodd_streams(files, hypodd_params, codec)):
+                    subprocess.run([hypodd, hypodd_inp], cwd=work, capture_output=True, check=True)
+                timings.append(time.perf_counter() - start)
+                total_bytes = _dir_bytes(work)
+                with open(f"{work}/{files['reloc']}", 'r') as f:
+                    reloc = f.read()
+            finally:
+                shutil.rmtree(work, ignore_errors=True)
+        reference = reference or reloc
+        rows.append({'codec': codec or 'plain', 'inputs_mb': input_bytes / 1024 ** 2,
+                     'outputs_mb': (total_bytes - input_bytes) / 1024 ** 2, 'total_mb': total_bytes / 1024 ** 2,
+                     'seconds': min(timings), 'same_reloc': reloc == reference})
+
+    report = pd.DataFrame(rows)
+    report['saved'] = 1 - report['total_mb'] / report['total_mb'].iloc[0]
+    print(report.to_string(index=False, float_format='%.3f'))
+    return report
@@ -0,0 +1,296 @@
+"""
+File-system job queue for running relocation partitions on several hosts.
+
+A coordinator writes one JSON job per partition (run directory + pipeline
+spec) into a queue directory on a shared file system:
+
+    <queue>/pending/   jobs waiting for a worker
+    <queue>/leased/    jobs claimed by a worker (<job>~<lease token>.json, mtime = last heartbeat)
+    <queue>/done/      finished jobs (with result file and timings)
+    <queue>/failed/    jobs that failed max_attempts times
+
+Workers claim a job by renaming it from pending/ to leased/ (atomic, so each
+job is claimed once), touch it while it runs and rename it to done/ or failed/.
+A leased job whose heartbeat is older than the lease timeout (worker died,
+host lost) is renamed back to pending/ by any worker or the coordinator.
+No broker is needed; workers can run on any host that sees the directory.
+"""
+import glob
+import json
+import os
+import socket
+import threading
+import time
+import traceback
+import uuid
+import pandas as pd
+
+
+STATES = ('pending', 'leased', 'done', 'failed')
+DEFAULT_TARGET = 'run_hypodd:run_partition'
+
+
+def init_queue(queue_dir):
+    """Create the queue directories."""
+    for state in STATES:
+        os.makedirs(f'{queue_dir}/{state}', exist_ok=True)
+    return queue_dir
+
+
+def _write_json(path, data):
+    tmp = f'{path}.{uuid.uuid4().hex}.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp, path)
+
+
+def _rewrite_json(path, data):
+    """Rewrite an existing file in place. Raises FileNotFoundError instead of recreating a file that was moved away."""
+    with os.fdopen(os.open(path, os.O_WRONLY | os.O_TRUNC), 'w') as f:
+        json.dump(data, f, indent=2)
+
+
+def _read_json(path):
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def submit_job(queue_dir, run_dir, job_id=None, target=DEFAULT_TARGET, max_attempts=3, **spec):
+    """
+    Add one partition to the queue.
+
+    Parameters:
+    -----------
+    queue_dir : str
+        Queue directory (shared between hosts)
+    run_dir : str
+        Run directory of the partition (control files, hypoDD inputs/outputs)
+    job_id : str, optional
+        Default: name of run_dir
+    target : str
+        'module:function' called as function(run_dir, **spec) by the worker.
+        Must return the path of the partition's result CSV
+    max_attempts : int
+        Attempts before the job is moved to failed/
+    **spec : pipeline parameters (hypodd_inp, min_cc, max_obs_per_event, ...)
+
+    Returns: job_id
+    """
+    init_queue(queue_dir)
+    run_dir = os.path.abspath(run_dir)
+    job_id = job_id or os.path.basename(run_dir.rstrip('/'))
+    if any(glob.glob(f'{queue_dir}/{state}/{job_id}.json') for state in STATES) \
+            or glob.glob(f'{queue_dir}/leased/{job_id}~*.json'):
+        raise ValueError(f"Job {job_id} is already in the queue")
+    job = {'job_id': job_id, 'run_dir': run_dir, 'target': target, 'spec': spec,
+           'attempts': 0, 'max_attempts': max_attempts, 'submitted_at': time.time(), 'history': []}
+    # Written outside pending/ first so workers never see a partial file
+    _write_json(f'{queue_dir}/{job_id}.json.new', job)
+    os.rename(f'{queue_dir}/{job_id}.json.new', f'{queue_dir}/pending/{job_id}.json')
+    return job_id
+
+
+def submit_jobs(queue_dir, run_dirs, **spec):
+    """Submit one job per run directory (same spec). Returns the job IDs."""
+    job_ids = [submit_job(queue_dir, run_dir, **spec) for run_dir in run_dirs]
+    print(f"✅ Submitted {len(job_ids)} jobs to {queue_dir}")
+    return job_ids
+
+
+def queue_status(queue_dir):
+    """Number of jobs per state."""
+    return {state: len(glob.glob(f'{queue_dir}/{state}/*.json')) for state in STATES}
+
+
+def requeue_expired(queue_dir, lease_timeout=300):
+    """
+    Move leased jobs without a heartbeat for lease_timeout seconds back to pending/.
+
+    Returns: list of requeued job IDs
+    """
+    requeued = []
+    now = time.time()
+    for path in glob.glob(f'{queue_dir}/leased/*.json'):
+        try:
+            if now - os.stat(path).st_mtime <= lease_timeout:
+                continue
+            job_id = os.path.basename(path).split('~')[0]
+            os.rename(path, f'{queue_dir}/pending/{job_id}.json')
+        except FileNotFoundError:
+            continue  # finished or requeued by someone else meanwhile
+        requeued.append(job_id)
+    if requeued:
+        print(f"Requeued {len(requeued)} expired leases: {', '.join(requeued)}")
+    return requeued
+
+
+def claim_job(queue_dir, worker_id):
+    """
+    Claim a pending job (in job ID order).
+
+    Returns: (job dict, leased file) or (None, None) if the queue is empty
+    """
+    for path in sorted(glob.glob(f'{queue_dir}/pending/*.json')):
+        # A fresh token per claim: a worker whose lease expired can no longer touch or finish the job
+        leased = f'{queue_dir}/leased/{os.path.basename(path)[:-5]}~{uuid.uuid4().hex[:12]}.json'
+        try:
+            os.rename(path, leased)
+            os.utime(leased)  # rename keeps the submit time, which may already look expired
+        except FileNotFoundError:
+            continue  # claimed by another worker
+        job = _read_json(leased)
+        job['attempts'] += 1
+        job['history'].append({'worker': worker_id, 'claimed_at': time.time()})
+        try:
+            _rewrite_json(leased, job)
+        except FileNotFoundError:
+            continue  # lease already expired and requeued
+        return job, leased
+    return None, None
+
+
+def _heartbeat(leased, interval, stop, lost):
+    while not stop.wait(interval):
+        try:
+            os.utime(leased)
+        except FileNotFoundError:
+            lost.set()  # lease expired and the job was requeued
+            return
+
+
+def execute_job(job):
+    """Import and call the job's target. Returns the result file."""
+    import importlib
+
+    module, func = job['target'].split(':')
+    return getattr(importlib.import_module(module), func)(job['run_dir'], **job['spec'])
+
+
+def _finish(queue_dir, job, leased, state, **info):
+    job['history'][-1].update(info, finished_at=time.time())
+    target = f'{queue_dir}/{state}/{job["job_id"]}.json'
+    try:
+        # Update the leased file, then move it with one rename: once the job is in its new
+        # state it is complete and may be claimed at once. A lost lease (the file was moved
+        # away) raises instead of being recreated, so the job stays with its new owner.
+        _rewrite_json(leased, job)
+        os.rename(leased, target)
+    except FileNotFoundError:
+        return False
+    return True
+
+
+def run_worker(queue_dir, worker_id=None, lease_timeout=300, heartbeat=None, poll=5.0, exit_when_idle=True,
+               max_jobs=None):
+    """
+    Claim and execute jobs until the queue is empty (or forever).
+
+    Parameters:
+    -----------
+    queue_dir : str
+        Queue directory
+    worker_id : str, optional
+        Default: host:pid
+    lease_timeout : float
+        Seconds without heartbeat after which a lease is considered dead
+    heartbeat : float, optional
+        Heartbeat interval. Default: lease_timeout / 5
+    poll : float
+        Seconds between polls of an empty queue
+    exit_when_idle : bool
+        Return when no job is pending or leased
+    max_jobs : int, optional
+        Return after this many jobs
+
+    Returns: number of jobs completed by this worker
+    """
+    init_queue(queue_dir)
+    worker_id = worker_id or f'{socket.gethostname()}:{os.getpid()}'
+    heartbeat = heartbeat or lease_timeout / 5.0
+    n_done = 0
+
+    while max_jobs is None or n_done < max_jobs:
+        requeue_expired(queue_dir, lease_timeout)
+        job, leased = claim_job(queue_dir, worker_id)
+        if job is None:
+            status = queue_status(queue_dir)
+            if exit_when_idle and status['pending'] == 0 and status['leased'] == 0:
+                break
+            time.sleep(poll)
+            continue
+
+        print(f"[{worker_id}] running {job['job_id']} (attempt {job['attempts']}/{job['max_attempts']})")
+        stop, lost = threading.Event(), threading.Event()
+        beat = threading.Thread(target=_heartbeat, args=(leased, heartbeat, stop, lost), daemon=True)
+        beat.start()
+        start = time.time()
+        try:
+            result, error = execute_job(job), None
+            if result is False or (isinstance(result, str) and not os.path.exists(result)):
+                error = f'job returned {result!r}'
+        except Exception:
+            result, error = None, traceback.format_exc()
+        stop.set()
+        beat.join()
+        elapsed = round(time.time() - start, 3)
+
+        if lost.is_set():
+            print(f"[{worker_id}] lease on {job['job_id']} expired while running, result discarded")
+            continue
+        if error is None:
+            if _finish(queue_dir, job, leased, 'done', worker=worker_id, elapsed_s=elapsed, result=result):
+                n_done += 1
+                print(f"[{worker_id}] {job['job_id']} done in {elapsed:.1f}s")
+            continue
+
+        print(f"[{worker_id}] {job['job_id']} FAILED after {elapsed:.1f}s: {error.strip().splitlines()[-1]}")
+        state = 'failed' if job['attempts'] >= job['max_attempts'] else 'pending'
+        _finish(queue_dir, job, leased, state, worker=worker_id, elapsed_s=elapsed, error=error)
+
+    return n_done
+
+
+def wait_for_queue(queue_dir, lease_timeout=300, poll=10.0):
+    """Block until no job is pending or leased, requeueing expired leases meanwhile. Returns queue_status."""
+    while True:
+        requeue_expired(queue_dir, lease_timeout)
+        status = queue_status(queue_dir)
+        if status['pending'] == 0 and status['leased'] == 0:
+            return status
+        time.sleep(poll)
+
+
+def gather_results(queue_dir, output_csv=None):
+    """
+    Merge the result CSVs of all finished jobs into one catalog.
+
+    Events relocated in several partitions (overlapping regions) are kept once,
+    from the partition with the most cross-correlation observations for them.
+
+    Returns: merged DataFrame (with a 'partition' column)
+    """
+    frames = []
+    for path in sorted(glob.glob(f'{queue_dir}/done/*.json')):
+        job = _read_json(path)
+        result = job['history'][-1].get('result')
+        if not isinstance(result, str) or not os.path.exists(result):
+            print(f"Warning: result of {job['job_id']} not found ({result})")
+            continue
+        frames.append(pd.read_csv(result).assign(partition=job['job_id']))
+
+    if not frames:
+        print(f"No results in {queue_dir}/done")
+        return pd.DataFrame()
+    merged = pd.concat(frames, ignore_index=True)
+    n_rows = len(merged)
+    if 'event_id' in merged.columns and merged['event_id'].notna().any():
+        n_obs = merged.reindex(columns=['n_cc_p', 'n_cc_s']).fillna(0).sum(axis=1)
+        order = merged.assign(_n_obs=n_obs).sort_values(['event_id', '_n_obs'], ascending=[True, False], kind='stable')
+        keep = order[~order['event_id'].duplicated() | order['event_id'].isna()].index
+        merged = merged.loc[keep.sort_values()].reset_index(drop=True)
+
+    if output_csv:
+        merged.to_csv(output_csv, index=False)
+    print(f"✅ Gathered {len(merged)} events from {len(frames)} partitions "
+          f"({n_rows - len(merged)} duplicates dropped)" + (f" -> {output_csv}" if output_csv else ''))
+    return merged
@@ -0,0 +1,289 @@
+"""
+Vectorized readers for legacy NCSN/hypoDD catalogs (.pha and Hypoinverse .arc).
+
+Both readers return the same columnar tables the CSV converters use:
+  events: event_id, origin_time, latitude, longitude, depth, magnitude,
+          uncertainty_x, uncertainty_z, rms              (catalog CSV layout)
+  picks:  event_id, template_id, origin_time, station, travel_time_p,
+          travel_time_s, lag_time_p, lag_time_s, cc_p, cc_s  (detection CSV layout)
+
+Legacy events are their own templates (template_id == event_id) and the pick
+weights are stored in cc_p/cc_s, so csv_to_pha re-exports them unchanged.
+"""
+
+import os
+import numpy as np
+import pandas as pd
+
+
+PICK_COLUMNS = ['event_id', 'template_id', 'origin_time', 'station',
+                'travel_time_p', 'travel_time_s', 'lag_time_p', 'lag_time_s', 'cc_p', 'cc_s']
+EVENT_COLUMNS = ['event_id', 'origin_time', 'latitude', 'longitude', 'depth', 'magnitude',
+                 'uncertainty_x', 'uncertainty_z', 'rms']
+
+# NCSN quality code -> pick weight (as in ncsn2pha.f)
+NCSN_WEIGHTS = np.array([1.0, 0.5, 0.2, 0.1])
+
+
+def _origin_times(yr, mo, dy, hr, mn, sc):
+    """Build ISO8601 origin times from integer/float component arrays."""
+    base = pd.to_datetime(pd.DataFrame({'year': yr, 'month': mo, 'day': dy}))
+    t = base + pd.to_timedelta(hr * 3600 + mn * 60, unit='s') + pd.to_timedelta(np.round(sc * 1e6), unit='us')
+    return t.dt.strftime('%Y-%m-%dT%H:%M:%S.%fZ').to_numpy()
+
+
+def _picks_table(event_ids, origin_times, station, phase, tt, weight):
+    """
+    Pivot long-form picks (one row per phase) into one row per event/station
+    with P and S columns, keeping the first pick per event/station/phase.
+    """
+    long = pd.DataFrame({'event_id': event_ids, 'station': station, 'phase': phase,
+                         'tt': tt, 'w': weight, 'order': np.arange(len(tt))})
+    long = long.drop_duplicates(['event_id', 'station', 'phase'])
+    first = long.groupby(['event_id', 'station'], sort=False)['order'].min()
+    wide = long.pivot(index=['event_id', 'station'], columns='phase', values=['tt', 'w'])
+    wide = wide.reindex(first.index)
+
+    picks = pd.DataFrame({
+        'event_id': wide.index.get_level_values(0),
+        'station': wide.index.get_level_values(1),
+    })
+    for pha in ('P', 'S'):
+        has_phase = ('tt', pha) in wide.columns
+        picks[f'travel_time_{pha.lower()}'] = wide[('tt', pha)].to_numpy(dtype=float) if has_phase else np.nan
+        picks[f'cc_{pha.lower()}'] = wide[('w', pha)].to_numpy(dtype=float) if has_phase else np.nan
+    picks['template_id'] = picks['event_id']
+    picks['lag_time_p'] = np.nan
+    picks['lag_time_s'] = np.nan
+    picks['origin_time'] = picks['event_id'].map(pd.Series(origin_times, index=event_ids).groupby(level=0).first())
+    return picks[PICK_COLUMNS]
+
+
+def read_pha_lines(pha_file):
+    """
+    Read a hypoDD .pha file as written, one row per pick line (nothing is deduplicated).
+
+    Returns: (events DataFrame, phases DataFrame with event_id, origin_time, station,
+              tt, weight (NaN where not numeric) and phase)
+    """
+    raw = pd.read_csv(pha_file, sep=r'\s+', header=None, names=range(15), dtype=str,
+                      engine='c', skip_blank_lines=True)
+    is_header = (raw[0] == '#').to_numpy()
+    if len(raw) and not is_header[0]:
+        raise ValueError(f"{pha_file} does not start with an event header line")
+
+    hdr = raw.loc[is_header, 1:14].apply(pd.to_numeric).to_numpy()
+    event_ids = raw.loc[is_header, 14].to_numpy()
+    origin_times = _origin_times(hdr[:, 0].astype(int), hdr[:, 1].astype(int), hdr[:, 2].astype(int),
+                                 hdr[:, 3], hdr[:, 4], hdr[:, 5])
+    events = pd.DataFrame({
+        'event_id': event_ids,
+        'origin_time': origin_times,
+        'latitude': hdr[:, 6],
+        'longitude': hdr[:, 7],
+        'depth': hdr[:, 8],
+        'magnitude': hdr[:, 9],
+        'uncertainty_x': hdr[:, 10],
+        'uncertainty_z': hdr[:, 11],
+        'rms': hdr[:, 12],
+    })
+
+    # Event index of every line: number of headers seen so far
+    event_idx = np.cumsum(is_header) - 1
+    pick_rows = ~is_header
+    phases = pd.DataFrame({
+        'event_id': event_ids[event_idx[pick_rows]],
+        'origin_time': origin_times[event_idx[pick_rows]],
+        'station': raw.loc[pick_rows, 0].to_numpy(),
+        'tt': pd.to_numeric(raw.loc[pick_rows, 1], errors='coerce').to_numpy(),
+        'weight': pd.to_numeric(raw.loc[pick_rows, 2], errors='coerce').to_numpy(),
+        'phase': raw.loc[pick_rows, 3].to_numpy(),
+    })
+    return events, phases
+
+
+def read_pha(pha_file):
+    """
+    Read a hypoDD .pha file (ncsn2pha / csv_to_pha layout) in one pass.
+
+    Format: # YR MO DY HR MN SC LAT LON DEP MAG EH EZ RMS ID
+            STA TT WGHT PHA
+
+    Returns: (events DataFrame, picks DataFrame)
+    """
+    events, phases = read_pha_lines(pha_file)
+    if phases[['tt', 'weight']].isna().to_numpy().any():
+        raise ValueError(f"{pha_file} has pick lines with non-numeric travel times or weights")
+    picks = _picks_table(phases['event_id'].to_numpy(), phases['origin_time'].to_numpy(),
+                         phases['station'].to_numpy(), phases['phase'].to_numpy(),
+                         phases['tt'].to_numpy(), phases['weight'].to_numpy())
+    print(f"Read {len(events)} events and {len(phases)} phases from {pha_file}")
+    return events, picks
+
+
+def _line_matrix(data, width):
+    """
+    Split raw bytes into lines and return an (n_lines, width) uint8 matrix,
+    right-padded with blanks.
+    """
+    buf = np.frombuffer(data, dtype=np.uint8)
+    ends = np.flatnonzero(buf == ord('\n'))
+    if len(buf) and buf[-1] != ord('\n'):
+        ends = np.append(ends, len(buf))
+    starts = np.concatenate([[0], ends[:-1] + 1])
+    lengths = ends - starts
+    # Drop carriage returns of CRLF files
+    lengths -= (lengths > 0) & (buf[np.maximum(ends - 1, 0)] == ord('\r'))
+
+    cols = np.arange(width)
+    idx = starts[:, None] + cols
+    inside = cols < lengths[:, None]
+    return np.where(inside, buf[np.minimum(idx, len(buf) - 1)], ord(' ')).astype(np.uint8)
+
+
+def _fixed_float(block, decimals=0):
+    """
+    Parse fixed-width numeric fields column-wise, Fortran style: blanks are
+    ignored and `decimals` implied decimal places apply unless a '.' is present.
+    """
+    is_digit = (block >= ord('0')) & (block <= ord('9'))
+    digits = np.where(is_digit, block.astype(np.int64) - ord('0'), 0)
+    # Number of digits to the right of each position
+    right = np.cumsum(is_digit[:, ::-1], axis=1)[:, ::-1] - is_digit
+    value = (digits * 10 ** right).sum(axis=1).astype(float)
+
+    is_dot = block == ord('.')
+    has_dot = is_dot.any(axis=1)
+    dot_pos = np.argmax(is_dot, axis=1)
+    after_dot = np.where(np.arange(block.shape[1]) > dot_pos[:, None], is_digit, False).sum(axis=1)
+    scale = np.where(has_dot, after_dot, decimals)
+
+    sign = np.where((block == ord('-')).any(axis=1), -1.0, 1.0)
+    return sign * value / 10.0 ** scale
+
+
+def _field(mat, start, end, decimals=0):
+    """Parse 1-based inclusive Fortran columns start:end."""
+    return _fixed_float(mat[:, start - 1:end], decimals)
+
+
+def _text(mat, start, end):
+    block = np.ascontiguousarray(mat[:, start - 1:end])
+    return block.view(f'S{end - start + 1}').ravel().astype(str)
+
+
+def read_arc(arc_file):
+    """
+    Read a Hypoinverse Y2000 archive (.arc) file with vectorized fixed-width parsing.
+
+    Selection and weighting follow ncsn2pha.f (NCSN convention): P picks from
+    vertical components (3rd letter 'Z'), S picks from horizontals, quality
+    codes 0-3 mapped to weights 1.0/0.5/0.2/0.1, negated when the importance
+    is >= 0.5. Station codes are NET+SITE, as written by ncsn2pha.
+
+    Returns: (events DataFrame, picks DataFrame)
+    """
+    with open(arc_file, 'rb') as f:
+        mat = _line_matrix(f.read(), 180)
+
+    first = mat[:, 0]
+    mat = mat[first != ord('$')]  # shadow lines
+    is_term = (mat[:, :3] == ord(' ')).all(axis=1)
+    prev_term = np.concatenate([[True], is_term[:-1]])
+    is_header = prev_term & ~is_term
+    is_phase = ~prev_term & ~is_term
+
+    if is_header.any() and not _text(mat[is_header][:1], 1, 2)[0] in ('19', '20'):
+        raise ValueError(f"{arc_file} is not in Hypoinverse Y2000 archive format")
+
+    # --- event headers
+    hdr = mat[is_header]
+    date = _field(hdr, 1, 8).astype(np.int64)
+    yr, mo, dy = date // 10000, date // 100 % 100, date % 100
+    hr, mn, sc = _field(hdr, 9, 10), _field(hdr, 11, 12), _field(hdr, 13, 16, 2)
+    lat = _field(hdr, 17, 18) + _field(hdr, 20, 23, 2) / 60
+    lat = np.where(hdr[:, 18] == ord('S'), -lat, lat)
+    lon = _field(hdr, 24, 26) + _field(hdr, 28, 31, 2) / 60
+    lon = np.where(hdr[:, 26] == ord('E'), lon, -lon)
+    event_ids = _field(hdr, 137, 146).astype(np.int64).astype(str)
+    origin_times = _origin_times(yr, mo, dy, hr, mn, sc)
+
+    events = pd.DataFrame({
+        'event_id': event_ids,
+        'origin_time': origin_times,
+        'latitude': lat,
+        'longitude': lon,
+        'depth': _field(hdr, 32, 36, 2),
+        'magnitude': _field(hdr, 148, 150, 2),
+        'uncertainty_x': _field(hdr, 86, 89, 2),
+        'uncertainty_z': _field(hdr, 90, 93, 2),
+        'rms': _field(hdr, 49, 52, 2),
+    })
+
+    # --- phase lines
+    event_idx = (np.cumsum(is_header) - 1)[is_phase]
+    ph = mat[is_phase]
+    ev_min, ev_sec, ev_yr = mn[event_idx], sc[event_idx], yr[event_idx]
+    p_min = _field(ph, 28, 29)
+    dmin = np.where(p_min < ev_min, p_min + 60, p_min) - ev_min
+    station = np.char.strip(np.char.add(_text(ph, 6, 7), _text(ph, 1, 5)))
+    vertical = ph[:, 11] == ord('Z')
+    hand_timed_old = (ph[:, 108] == ord('H')) & (ev_yr < 1954)
+
+    rows, tts, wghts, phases = [], [], [], []
+    for pha, remark, qual_col, sec_cols, imp_cols, comp_ok in (
+            ('P', (14, 15), 17, (30, 34), (101, 104), vertical),
+            ('S', (47, 48), 50, (42, 46), (105, 108), ~vertical)):
+        qual_char = ph[:, qual_col - 1]
+        qual = np.where((qual_char >= ord('0')) & (qual_char <= ord('9')), qual_char.astype(int) - ord('0'), 9)
+        has_remark = (ph[:, remark[0] - 1:remark[1]] != ord(' ')).any(axis=1)
+        keep = (qual < 4) & has_remark & comp_ok & ~hand_timed_old
+
+        wght = NCSN_WEIGHTS[np.minimum(qual, 3)]
+        wght = np.where(_field(ph, *imp_cols, 3) >= 0.5, -wght, wght)
+        tt = dmin * 60.0 + (_field(ph, *sec_cols, 2) - ev_sec)
+
+        sel = np.flatnonzero(keep)
+        rows.append(sel)
+        tts.append(tt[sel])
+        wghts.append(wght[sel])
+        phases.append(np.full(len(sel), pha))
+
+    # Restore file order (P before S within a line)
+    rows = np.concatenate(rows)
+    order = np.lexsort((np.concatenate(phases) == 'S', rows))
+    rows = rows[order]
+    picks = _picks_table(
+        event_ids[event_idx[rows]],
+        origin_times[event_idx[rows]],
+        station[rows],
+        np.concatenate(phases)[order],
+        np.concatenate(tts)[order],
+        np.concatenate(wghts)[order],
+    )
+
+    print(f"Read {len(events)} events and {len(rows)} phases from {arc_file}")
+    return events, picks
+
+
+def import_legacy(input_file, picks_csv=None, catalog_csv=None):
+    """
+    Import a legacy .pha or .arc catalog and optionally save it as CSV tables.
+
+    picks_csv:   output in the detection CSV layout (input for csv_to_pha)
+    catalog_csv: output in the catalog CSV layout (input for load_catalog)
+
+    Returns: (events DataFrame, picks DataFrame)
+    """
+    if os.path.splitext(input_file)[1].lower() == '.arc':
+        events, picks = read_arc(input_file)
+    else:
+        events, picks = read_pha(input_file)
+
+    if picks_csv:
+        picks.to_csv(picks_csv, index=False)
+        print(f"Saved picks to {picks_csv}")
+    if catalog_csv:
+        events.to_csv(catalog_csv, index=False)
+        print(f"Saved catalog to {catalog_csv}")
+    return events, picks
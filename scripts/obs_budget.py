@@ -0,0 +1,152 @@
+"""
+Observation budgets for cross-correlation differential times.
+
+Prolific templates produce far more .cc observations than hypoDD needs: the
+data count is limited by MAXDATA and LSQR time grows with every redundant
+lag. select_observations() caps the observations per event and in total.
+An observation counts against both events of its pair (the detected event
+id1 and the template id2), so a prolific template is capped like any other
+event. Within an event, observations are ranked per (phase, station azimuth
+bin) by CC and taken round-robin over the bins, so the kept data has the best
+lags while keeping the azimuthal and P/S coverage of the event. All ranking is
+vectorized over the long-form observation table (see csv_hypodd.cc_observations).
+"""
+import numpy as np
+import pandas as pd
+
+
+def station_azimuths(ev_lat, ev_lon, sta_lat, sta_lon):
+    """Azimuth (degrees clockwise from north) from events to stations, element-wise."""
+    lat1, lon1 = np.radians(ev_lat), np.radians(ev_lon)
+    lat2, lon2 = np.radians(sta_lat), np.radians(sta_lon)
+    dlon = lon2 - lon1
+    x = np.sin(dlon) * np.cos(lat2)
+    y = np.cos(lat1) * np.sin(lat2) - np.sin(lat1) * np.cos(lat2) * np.cos(dlon)
+    return np.degrees(np.arctan2(x, y)) % 360.0
+
+
+def _event_locations(obs, catalog_info, column='event_id'):
+    """Latitude/longitude of the event in `column` of each observation (template location as fallback)."""
+    if not catalog_info:
+        nan = np.full(len(obs), np.nan)
+        return nan, nan.copy()
+    lat = pd.Series({k: v['lat'] for k, v in catalog_info.items()})
+    lon = pd.Series({k: v['lon'] for k, v in catalog_info.items()})
+    ev, tmpl = obs[column].astype(str), obs['template_id'].astype(str)
+    ev_lat = ev.map(lat).fillna(tmpl.map(lat)).to_numpy(dtype=float)
+    ev_lon = ev.map(lon).fillna(tmpl.map(lon)).to_numpy(dtype=float)
+    return ev_lat, ev_lon
+
+
+def _group_rank(keys, order):
+    """Rank (0, 1, ...) of each row within its group of equal keys, in the given row order."""
+    sorted_keys = keys[order]
+    starts = np.ones(len(order), dtype=bool)
+    starts[1:] = sorted_keys[1:] != sorted_keys[:-1]
+    group_start = np.maximum.accumulate(np.where(starts, np.arange(len(order)), 0))
+    rank = np.empty(len(order), dtype=np.int64)
+    rank[order] = np.arange(len(order)) - group_start
+    return rank
+
+
+def select_observations(obs, stations=None, catalog_info=None, max_per_event=None, max_total=None, n_az_bins=8):
+    """
+    Apply per-event and global observation budgets.
+
+    Parameters:
+    -----------
+    obs : DataFrame
+        Long-form observations (id1, id2, event_id, template_id, station, phase, dt, weight)
+    stations : DataFrame, optional
+        Station table (station, latitude, longitude) used for the azimuth bins
+    catalog_info : dict, optional
+        Output of load_catalog, event locations for the azimuth bins
+    max_per_event : int, optional
+        Max. observations per event, summed over all its pairs. An observation
+        counts against both id1 and id2, so templates are capped as well
+    max_total : int, optional
+        Max. observations in total (e.g. a share of MAXDATA)
+    n_az_bins : int
+        Number of station azimuth bins per event. Without locations all
+        stations fall into one bin and only P/S balance and CC are used
+
+    Returns:
+    --------
+    (selected observations in input order, report dict)
+    """
+    n = len(obs)
+    cc = obs['weight'].to_numpy(dtype=float)
+    phase = (obs['phase'].to_numpy() == 'S').astype(np.int64)
+    sta = None
+    if stations is not None and catalog_info:
+        sta = stations.assign(station=stations['station'].astype(str)).drop_duplicates('station').set_index('station')
+
+    def bin_ranks(event, location_column):
+        # rank within (event, phase, azimuth bin) by CC, seen from the event's location
+        az_bin = np.zeros(n, dtype=np.int64)
+        if sta is not None:
+            sta_lat = obs['station'].map(sta['latitude']).to_numpy(dtype=float)
+            sta_lon = obs['station'].map(sta['longitude']).to_numpy(dtype=float)
+            ev_lat, ev_lon = _event_locations(obs, catalog_info, location_column)
+            az = station_azimuths(ev_lat, ev_lon, sta_lat, sta_lon)
+            located = np.isfinite(az)
+            az_bin[located] = (az[located] * n_az_bins / 360.0).astype(np.int64) % n_az_bins
+        bin_key = (event * 2 + phase) * n_az_bins + az_bin
+        return _group_rank(bin_key, np.lexsort((-cc, bin_key)))
+
+    # --- every observation belongs to two events: the detection (id1) and the template (id2)
+    id1 = obs['id1'].to_numpy(dtype=np.int64)
+    id2 = obs['id2'].to_numpy(dtype=np.int64)
+    bin_rank = bin_ranks(id1, 'event_id')
+
+    # --- round-robin over the bins within each event: every bin/phase contributes its best
+    # observation before any bin contributes a second. Both roles are ranked together, so an
+    # event's budget is shared between its detections and the detections it is template for
+    event = np.concatenate([id1, id2])
+    role_bin_rank = np.concatenate([bin_rank, bin_ranks(id2, 'template_id')])
+    role_cc = np.concatenate([cc, cc])
+    role_rank = _group_rank(event, np.lexsort((-role_cc, role_bin_rank, event)))
+    event_rank = np.maximum(role_rank[:n], role_rank[n:])
+
+    keep = np.ones(n, dtype=bool)
+    if max_per_event is not None:
+        keep &= event_rank < max_per_event
+    dropped_event = n - int(keep.sum())
+
+    dropped_total = 0
+    if max_total is not None and keep.sum() > max_total:
+        # Global budget: smallest (bin rank, -CC) first, so each event keeps its coverage
+        candidates = np.flatnonzero(keep)
+        score = bin_rank[candidates] - cc[candidates] / 2.0
+        best = candidates[np.argpartition(score, max_total - 1)[:max_total]] if max_total > 0 else candidates[:0]
+        dropped_total = int(keep.sum()) - len(best)
+        keep[:] = False
+        keep[best] = True
+
+    selected = obs[keep]
+    report = {
+        'n_input': n,
+        'n_kept': int(keep.sum()),
+        'dropped_event_budget': dropped_event,
+        'dropped_global_budget': dropped_total,
+        'events_limited': int(len(np.unique(event[role_rank >= max_per_event]))) if max_per_event is not None else 0,
+        'kept_p': int(((phase == 0) & keep).sum()),
+        'kept_s': int(((phase == 1) & keep).sum()),
+        'mean_cc_input': float(cc.mean()) if n else None,
+        'mean_cc_kept': float(cc[keep].mean()) if keep.any() else None,
+        'pairs_input': int(obs[['id1', 'id2']].drop_duplicates().shape[0]),
+        'pairs_kept': int(selected[['id1', 'id2']].drop_duplicates().shape[0]),
+    }
+    return selected, report
+
+
+def print_budget_report(report):
+    """Print how much data the observation budgets removed."""
+    n_dropped = report['n_input'] - report['n_kept']
+    frac = n_dropped / report['n_input'] if report['n_input'] else 0.0
+    print(f"Observation budget: kept {report['n_kept']} of {report['n_input']} observations "
+          f"(dropped {n_dropped}, {frac:.1%}; P={report['kept_p']}, S={report['kept_s']})")
+    print(f"  per-event budget dropped {report['dropped_event_budget']} "
+          f"({report['events_limited']} events limited), global budget dropped {report['dropped_global_budget']}")
+    print(f"  pairs: {report['pairs_kept']} of {report['pairs_input']}, mean CC "
+          f"{report['mean_cc_input'] or 0:.3f} -> {report['mean_cc_kept'] or 0:.3f}")
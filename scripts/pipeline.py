@@ -0,0 +1,202 @@
+"""
+Make-style pipeline for the HypoDD workflow.
+
+Each stage declares its input files, parameters and output files. Content
+hashes of inputs/outputs from the last successful execution are recorded in
+a JSON manifest in the run directory, and only stale stages are re-run.
+Stages that do not depend on each other run concurrently.
+"""
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+MANIFEST_NAME = 'pipeline_manifest.json'
+
+
+def stage(name, func, inputs=(), outputs=(), params=None):
+    """
+    Define a pipeline stage.
+
+    Parameters:
+    -----------
+    name : str
+        Unique stage name
+    func : callable
+        Called as func(**params). Returning False marks the stage as failed.
+    inputs : list of str
+        Files read by the stage
+    outputs : list of str
+        Files written by the stage
+    params : dict, optional
+        JSON-serializable parameters passed to func and included in the freshness check
+    """
+    return {
+        'name': name,
+        'func': func,
+        'inputs': [os.path.abspath(p) for p in inputs],
+        'outputs': [os.path.abspath(p) for p in outputs],
+        'params': params or {},
+    }
+
+
+def file_hash(path, hash_cache=None):
+    """
+    SHA-256 of a file's content.
+
+    hash_cache: dict {path: {'size': s, 'mtime_ns': t, 'sha256': h}} from a previous run.
+                If size and mtime are unchanged the recorded hash is reused.
+    """
+    st = os.stat(path)
+    cached = (hash_cache or {}).get(path)
+    if cached and cached['size'] == st.st_size and cached['mtime_ns'] == st.st_mtime_ns:
+        return cached
+
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    return {'size': st.st_size, 'mtime_ns': st.st_mtime_ns, 'sha256': h.hexdigest()}
+
+
+def load_manifest(manifest_file):
+    if not os.path.exists(manifest_file):
+        return {'stages': {}, 'files': {}}
+    with open(manifest_file, 'r') as f:
+        return json.load(f)
+
+
+def save_manifest(manifest, manifest_file):
+    tmp_file = f'{manifest_file}.tmp'
+    with open(tmp_file, 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_file, manifest_file)
+
+
+def stage_levels(stages):
+    """
+    Group stages into levels that can run concurrently.
+
+    A stage depends on every stage that writes one of its inputs.
+    Returns: list of lists of stage dicts
+    """
+    producers = {}
+    for s in stages:
+        for out in s['outputs']:
+            if out in producers:
+                raise ValueError(f"{out} is written by both {producers[out]} and {s['name']}")
+            producers[out] = s['name']
+
+    deps = {s['name']: {producers[p] for p in s['inputs'] if p in producers} - {s['name']}
+            for s in stages}
+
+    levels, done = [], set()
+    remaining = list(stages)
+    while remaining:
+        level = [s for s in remaining if deps[s['name']] <= done]
+        if not level:
+            raise ValueError(f"Dependency cycle among stages: {[s['name'] for s in remaining]}")
+        levels.append(level)
+        done.update(s['name'] for s in level)
+        remaining = [s for s in remaining if s['name'] not in done]
+    return levels
+
+
+def stale_reason(s, manifest):
+    """
+    Return why a stage must be re-run, or None if it is up to date.
+    """
+    record = manifest['stages'].get(s['name'])
+    if record is None:
+        return 'never run'
+    if record['params'] != s['params']:
+        return 'parameters changed'
+    for path in s['inputs']:
+        if not os.path.exists(path):
+            return f'missing input {os.path.basename(path)}'
+        if file_hash(path, manifest['files'])['sha256'] != record['inputs'].get(path):
+            return f'{os.path.basename(path)} changed'
+    for path in s['outputs']:
+        if not os.path.exists(path):
+            return f'missing output {os.path.basename(path)}'
+        if file_hash(path, manifest['files'])['sha256'] != record['outputs'].get(path):
+            return f'{os.path.basename(path)} modified since last run'
+    return None
+
+
+def _execute(s):
+    start = time.time()
+    try:
+        ok = s['func'](**s['params']) is not False
+        error = None if ok else 'stage returned failure'
+    except Exception as e:
+        ok, error = False, str(e)
+    if ok:
+        missing = [os.path.basename(p) for p in s['outputs'] if not os.path.exists(p)]
+        if missing:
+            ok, error = False, f"outputs not created: {', '.join(missing)}"
+    return ok, error, time.time() - start
+
+
+def run_pipeline(stages, manifest_file, max_workers=4, force=False):
+    """
+    Execute stale stages in dependency order.
+
+    Parameters:
+    -----------
+    stages : list of dict
+        Stages created with stage()
+    manifest_file : str
+        JSON file recording hashes from the last successful execution of each stage
+    max_workers : int
+        Max number of stages executed concurrently within a level
+    force : bool
+        Re-run every stage regardless of freshness
+
+    Returns:
+    --------
+    True if all stages are up to date or ran successfully, False otherwise
+    """
+    manifest = load_manifest(manifest_file)
+
+    for level in stage_levels(stages):
+        to_run = []
+        for s in level:
+            reason = 'forced' if force else stale_reason(s, manifest)
+            if reason is None:
+                print(f"[{s['name']}] up to date, skipping")
+            else:
+                print(f"[{s['name']}] stale ({reason})")
+                to_run.append(s)
+
+        if not to_run:
+            continue
+
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            results = list(pool.map(_execute, to_run))
+
+        failed = False
+        for s, (ok, error, elapsed) in zip(to_run, results):
+            if not ok:
+                print(f"[{s['name']}] FAILED after {elapsed:.1f}s: {error}")
+                manifest['stages'].pop(s['name'], None)
+                failed = True
+                continue
+
+            record = {'params': s['params'], 'inputs': {}, 'outputs': {}, 'elapsed_s': round(elapsed, 3)}
+            for key in ('inputs', 'outputs'):
+                for path in s[key]:
+                    if os.path.exists(path):
+                        manifest['files'][path] = file_hash(path, manifest['files'])
+                        record[key][path] = manifest['files'][path]['sha256']
+            manifest['stages'][s['name']] = record
+            print(f"[{s['name']}] done in {elapsed:.1f}s")
+
+        save_manifest(manifest, manifest_file)
+        if failed:
+            return False
+
+    print("✅ Pipeline up to date")
+    return True
@@ -0,0 +1,251 @@
+"""
+SQLite catalog of relocation runs.
+
+Each reloc_to_csv output is ingested together with the run's control files
+and a summary report, so events can be queried across all runs without
+re-reading every CSV.
+"""
+import json
+import os
+import sqlite3
+from datetime import datetime, timezone
+import pandas as pd
+
+
+# Columns written by reloc_to_csv (event_id is optional if no mapping was used)
+EVENT_COLUMNS = [
+    'event_id', 'hypodd_id', 'latitude', 'longitude', 'depth',
+    'x_m', 'y_m', 'z_m', 'ex_m', 'ey_m', 'ez_m',
+    'year', 'month', 'day', 'hour', 'minute', 'second', 'magnitude',
+    'n_cc_p', 'n_cc_s', 'n_cat_p', 'n_cat_s', 'rms_cc', 'rms_cat',
+    'cluster_id', 'origin_time', 'origin_time_relocated',
+]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id      TEXT PRIMARY KEY,
+    run_dir     TEXT,
+    source_file TEXT,
+    ingested_at TEXT,
+    params      TEXT,
+    report      TEXT
+);
+CREATE TABLE IF NOT EXISTS events (
+    row_id      INTEGER PRIMARY KEY,
+    run_id      TEXT NOT NULL REFERENCES runs(run_id),
+    event_id    TEXT,
+    hypodd_id   INTEGER,
+    latitude    REAL,
+    longitude   REAL,
+    depth       REAL,
+    x_m REAL, y_m REAL, z_m REAL,
+    ex_m REAL, ey_m REAL, ez_m REAL,
+    year INTEGER, month INTEGER, day INTEGER,
+    hour INTEGER, minute INTEGER, second REAL,
+    magnitude   REAL,
+    n_cc_p INTEGER, n_cc_s INTEGER, n_cat_p INTEGER, n_cat_s INTEGER,
+    rms_cc REAL, rms_cat REAL,
+    cluster_id  INTEGER,
+    origin_time TEXT,
+    origin_time_relocated INTEGER DEFAULT 1
+);
+CREATE INDEX IF NOT EXISTS idx_events_event_id ON events(event_id);
+CREATE INDEX IF NOT EXISTS idx_events_run_id ON events(run_id);
+CREATE INDEX IF NOT EXISTS idx_events_origin_time ON events(origin_time);
+CREATE VIRTUAL TABLE IF NOT EXISTS events_rtree USING rtree(
+    row_id, min_lat, max_lat, min_lon, max_lon, min_depth, max_depth
+);
+"""
+
+
+def connect(db_file):
+    """Open (and create if needed) the run catalog."""
+    con = sqlite3.connect(db_file)
+    con.execute('PRAGMA journal_mode=WAL')
+    con.execute('PRAGMA synchronous=NORMAL')
+    con.executescript(SCHEMA)
+    # Catalogs created before origin_time_relocated existed: their runs relocated every origin time
+    columns = {row[1] for row in con.execute('PRAGMA table_info(events)')}
+    if 'origin_time_relocated' not in columns:
+        with con:
+            con.execute('ALTER TABLE events ADD COLUMN origin_time_relocated INTEGER DEFAULT 1')
+    return con
+
+
+def _read_params(params_files):
+    params = {}
+    for path in params_files or []:
+        if os.path.exists(path):
+            with open(path, 'r') as f:
+                params[os.path.basename(path)] = f.read()
+    return params
+
+
+def _summary_report(df):
+    return {
+        'n_events': int(len(df)),
+        'n_clusters': int(df['cluster_id'].nunique()),
+        'rms_cc_mean': float(df.loc[df['rms_cc'] >= 0, 'rms_cc'].mean()) if (df['rms_cc'] >= 0).any() else None,
+        'rms_cat_mean': float(df.loc[df['rms_cat'] >= 0, 'rms_cat'].mean()) if (df['rms_cat'] >= 0).any() else None,
+        'depth_range_km': [float(df['depth'].min()), float(df['depth'].max())],
+    }
+
+
+def ingest_run(db_file, reloc_csv, run_id=None, params_files=None, report=None, chunk_size=100000):
+    """
+    Ingest a reloc_to_csv output into the run catalog.
+
+    Parameters:
+    -----------
+    db_file : str
+        Path to the SQLite database
+    reloc_csv : str or DataFrame
+        CSV written by reloc_to_csv (or the DataFrame it returned)
+    run_id : str, optional
+        Run identifier. Default: name of the directory containing reloc_csv
+    params_files : list of str, optional
+        Control files (ph2dt.inp, hypoDD.inp, ...) stored verbatim with the run
+    report : dict, optional
+        Run report. Default: summary statistics of the relocated events
+    chunk_size : int
+        Rows inserted per executemany call
+
+    Existing rows of the same run_id are replaced. Everything is written in one transaction.
+
+    Returns: run_id
+    """
+    if isinstance(reloc_csv, pd.DataFrame):
+        df, source_file = reloc_csv, None
+    else:
+        df, source_file = pd.read_csv(reloc_csv), os.path.abspath(reloc_csv)
+
+    if run_id is None:
+        if source_file is None:
+            raise ValueError("run_id is required when ingesting a DataFrame")
+        run_id = os.path.basename(os.path.dirname(source_file))
+
+    df = df.reindex(columns=EVENT_COLUMNS)
+    df['event_id'] = df['event_id'].astype(object).where(df['event_id'].notna(), None)
+    # CSVs written before the early-stop marking have all origin times relocated
+    df['origin_time_relocated'] = df['origin_time_relocated'].fillna(True).astype(bool).astype(int)
+    if report is None:
+        report = _summary_report(df)
+
+    con = connect(db_file)
+    try:
+        with con:
+            next_row = con.execute('SELECT COALESCE(MAX(row_id), 0) + 1 FROM events').fetchone()[0]
+            con.execute('DELETE FROM events_rtree WHERE row_id IN (SELECT row_id FROM events WHERE run_id = ?)', (run_id,))
+            con.execute('DELETE FROM events WHERE run_id = ?', (run_id,))
+            con.execute('INSERT OR REPLACE INTO runs VALUES (?, ?, ?, ?, ?, ?)', (
+                run_id,
+                os.path.dirname(source_file) if source_file else None,
+                source_file,
+                datetime.now(timezone.utc).isoformat(),
+                json.dumps(_read_params(params_files)),
+                json.dumps(report),
+            ))
+
+            event_sql = (f"INSERT INTO events (row_id, run_id, {', '.join(EVENT_COLUMNS)}) "
+                         f"VALUES ({', '.join('?' * (len(EVENT_COLUMNS) + 2))})")
+            rtree_sql = 'INSERT INTO events_rtree VALUES (?, ?, ?, ?, ?, ?, ?)'
+
+            for start in range(0, len(df), chunk_size):
+                chunk = df.iloc[start:start + chunk_size]
+                row_ids = range(next_row + start, next_row + start + len(chunk))
+                values = chunk.astype(object).where(chunk.notna(), None).to_numpy()
+                con.executemany(event_sql, ((rid, run_id, *row) for rid, row in zip(row_ids, values.tolist())))
+
+                lat = chunk['latitude'].to_numpy()
+                lon = chunk['longitude'].to_numpy()
+                dep = chunk['depth'].to_numpy()
+                con.executemany(rtree_sql, zip(row_ids, lat, lat, lon, lon, dep, dep))
+    finally:
+        con.close()
+
+    print(f"Ingested {len(df)} events as run '{run_id}' into {db_file}")
+    return run_id
+
+
+def _run_filter(run_ids, column='e.run_id'):
+    if run_ids is None:
+        return '', []
+    run_ids = [run_ids] if isinstance(run_ids, str) else list(run_ids)
+    return f" AND {column} IN ({', '.join('?' * len(run_ids))})", run_ids
+
+
+def list_runs(db_file):
+    """Return all ingested runs (params and report decoded from JSON) as a DataFrame."""
+    con = connect(db_file)
+    try:
+        df = pd.read_sql_query('SELECT * FROM runs ORDER BY ingested_at', con)
+    finally:
+        con.close()
+    df['params'] = df['params'].map(json.loads)
+    df['report'] = df['report'].map(json.loads)
+    return df
+
+
+def query_events(db_file, event_ids=None, run_ids=None, time_range=None):
+    """
+    Query relocated events by original event ID, run and/or origin time.
+
+    time_range: (start, end) ISO8601 strings, compared to origin_time
+    Returns: DataFrame
+    """
+    where, args = ' WHERE 1=1', []
+    if event_ids is not None:
+        event_ids = [event_ids] if isinstance(event_ids, str) else list(event_ids)
+        where += f" AND e.event_id IN ({', '.join('?' * len(event_ids))})"
+        args += event_ids
+    sql, run_args = _run_filter(run_ids)
+    where += sql
+    args += run_args
+    if time_range is not None:
+        where += ' AND e.origin_time BETWEEN ? AND ?'
+        args += list(time_range)
+
+    con = connect(db_file)
+    try:
+        return pd.read_sql_query(f'SELECT e.* FROM events e{where} ORDER BY e.origin_time, e.run_id', con, params=args)
+    finally:
+        con.close()
+
+
+def query_box(db_file, lat_range, lon_range, depth_range=(-1e9, 1e9), run_ids=None):
+    """
+    Query all relocated events inside a lat/lon/depth box using the R-tree index.
+
+    Returns: DataFrame
+    """
+    sql, run_args = _run_filter(run_ids)
+    query = ('SELECT e.* FROM events_rtree r JOIN events e ON e.row_id = r.row_id '
+             'WHERE r.min_lat >= ? AND r.max_lat <= ? AND r.min_lon >= ? AND r.max_lon <= ? '
+             'AND r.min_depth >= ? AND r.max_depth <= ?' + sql + ' ORDER BY e.origin_time, e.run_id')
+    args = [lat_range[0], lat_range[1], lon_range[0], lon_range[1], depth_range[0], depth_range[1]] + run_args
+
+    con = connect(db_file)
+    try:
+        return pd.read_sql_query(query, con, params=args)
+    finally:
+        con.close()
+
+
+def best_runs_for_event(db_file, event_id, metric='rms_cc'):
+    """
+    Rank all relocations of one event across runs.
+
+    metric: column to sort by ascending (e.g. 'rms_cc', 'rms_cat', 'ez_m').
+            Negative values (-9 = data type not used) are ranked last.
+    Returns: DataFrame, best run first
+    """
+    if metric not in EVENT_COLUMNS:
+        raise ValueError(f"Unknown metric: {metric}")
+    con = connect(db_file)
+    try:
+        return pd.read_sql_query(
+            f'SELECT e.* FROM events e WHERE e.event_id = ? '
+            f'ORDER BY ({metric} IS NULL OR {metric} < 0), {metric}, e.run_id',
+            con, params=[event_id])
+    finally:
+        con.close()
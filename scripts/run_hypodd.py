@@ -1,20 +1,88 @@
+import importlib.util
 import os
 import subprocess
 import sys
-from csv_hypodd import csv_to_pha, csv_to_cc, create_event_id_mapping, create_station_file, load_catalog, reloc_to_csv
+import threading
+import warm_daemon
+
+# Hand the command to a running warm daemon before the heavy imports below
+if __name__ == '__main__':
+    _status = warm_daemon.forward(sys.argv)
+    if _status is not None:
+        sys.exit(_status)
+
+from csv_hypodd import csv_to_pha, csv_to_cc, create_event_id_mapping, create_station_file, detection_event_ids, load_catalog, load_event_id_mapping, ph2dt_station_radius, read_ph2dt_inp, reloc_to_csv, select_stations
 from compare_utils import compare_relocations, run_comparison_test
+from pipeline import stage, run_pipeline, MANIFEST_NAME
+from run_catalog import ingest_run
+from event_registry import import_mapping, load_registry
+from legacy_import import import_legacy
+from validate_inputs import validate_inputs, validate_run_inputs, print_report, read_inc_limits
+from hypodd_ext import build_extension, compare_backends, read_hypodd_files, read_hypodd_inp
+from hypodd_formats import read_dt_cc, write_dt_cc
+from hypodd_io import benchmark_io, fortran_files, hypodd_streams, ph2dt_streams, remove_variants
+from catalog_store import build_catalog_store, store_is_current
+from job_queue import submit_job, run_worker, wait_for_queue, gather_results, queue_status
+from dry_run import dry_run, PH2DT_PARAMS
+from dt_stats import dt_file_stats, save_report
+from closure_qc import apply_closure_qc, print_closure_report, CLOSURE_TOL_S
+from detection_dedupe import dedupe_detections, DUPLICATE_TOL_S
+from convergence import run_watched, shift_below, watch_run, print_history, save_history, HISTORY_FILE
 
 # Paths
 script_dir  = os.path.dirname(os.path.abspath(__file__))
 HYPODD_ROOT = os.path.abspath(f'{script_dir}/../HypoDD-2.1b')
 RUN_DIR     = os.path.abspath(f'{script_dir}/../data/runs/run_detections_test')
 EXAMPLE_DIR = os.path.abspath(f'{script_dir}/../HypoDD-2.1b/examples/example2')
+RUN_CATALOG = os.path.abspath(f'{script_dir}/../data/hypoDD_outputs/run_catalog.sqlite')
+# original -> hypoDD event IDs shared by all runs and partitions (see event_registry.py)
+EVENT_REGISTRY = os.path.abspath(f'{script_dir}/../data/hypoDD_outputs/event_registry.npz')
 
 # CSV inputs
 input_dir   = f'{script_dir}/../data/input_csvs'
 CSV_FILE    = f'{input_dir}/nc73818801_fmf_detections_phase_picks.csv'
 STATION_CSV = f'{input_dir}/stations_2000_onshore_permanent_50km_cleaned_2022.csv'
 CATALOG_CSV = f'{input_dir}/yoon_shelly_ferndale-2022-12-01.csv'
+# Parquet stores of the reference catalogs (derived data, see catalog_store.py)
+CATALOG_CACHE = os.path.abspath(f'{script_dir}/../data/catalog_cache')
+
+
+def catalog_store_path(catalog_csv):
+    """Parquet store of a catalog CSV in CATALOG_CACHE (<catalog name>_store)."""
+    return f'{CATALOG_CACHE}/{os.path.splitext(os.path.basename(catalog_csv))[0]}_store'
+
+
+CATALOG_STORE = catalog_store_path(CATALOG_CSV)
+
+# Detection table with duplicate detections merged (written per run directory, see detection_dedupe.py)
+MERGED_CSV_NAME = 'detections_merged.csv'
+# Detection table of one partition, optional (see partition_inputs)
+PARTITION_CSV_NAME = 'detections.csv'
+DUPLICATES_NAME = 'duplicate_detections.csv'
+
+# Observation budget for .cc files: half of MAXDATA, the rest is left for dt.ct
+MAX_CC_OBS = read_inc_limits().get('MAXDATA', 3000000) // 2
+
+
+_catalog_lock = threading.Lock()
+
+
+def reference_catalog(detection_csv=CSV_FILE, catalog_csv=CATALOG_CSV):
+    """
+    Load the catalog entries of the events and templates in the detection CSV.
+
+    Reads from the Parquet store (built or refreshed from catalog_csv when pyarrow
+    is installed), otherwise filters the CSV.
+    """
+    event_ids = detection_event_ids(detection_csv)
+    if importlib.util.find_spec('pyarrow') is None:
+        return load_catalog(catalog_csv, event_ids=event_ids)
+    store = catalog_store_path(catalog_csv)
+    # Pipeline stages call this concurrently
+    with _catalog_lock:
+        if not store_is_current(store, catalog_csv):
+            build_catalog_store(catalog_csv, store)
+    return load_catalog(store, event_ids=event_ids)
 
 
 def compile_hypodd():
@@ -35,7 +103,7 @@ def run_example():
     
     if not os.path.exists(ph2dt):
         print(f"ERROR: {ph2dt} not found. Run: python run_hypodd.py compile")
-        return
+        return False
     
     print("\n1. Running ph2dt...")
     result = subprocess.run([ph2dt, 'ph2dt.inp'], cwd=EXAMPLE_DIR, capture_output=True, text=True)
@@ -43,7 +111,7 @@ def run_example():
     if result.returncode != 0:
         print("STDERR:", result.stderr)
         print(f"ph2dt failed with code {result.returncode}")
-        return
+        return False
     
     print("\n2. Running hypoDD...")
     result = subprocess.run([hypodd, 'hypoDD.inp'], cwd=EXAMPLE_DIR, capture_output=True, text=True)
@@ -51,60 +119,144 @@ def run_example():
     if result.returncode != 0:
         print("STDERR:", result.stderr)
         print(f"hypoDD failed with code {result.returncode}")
-        return
+        return False
     
     print("\nExample complete. Check example2 outputs.")
+    return True
 
 
-def prepare_inputs():
-    """Convert CSV to HypoDD formats in run directory."""
-    print("Converting CSV to HypoDD formats...")
-    
-    pha_file = f'{RUN_DIR}/detections.pha'
+def write_run_cc(csv_file, cc_file, event_mapping, catalog_info, station_csv=STATION_CSV, min_cc=0.6,
+                 max_obs_per_event=None, max_obs_total=MAX_CC_OBS, closure_tol=CLOSURE_TOL_S):
+    """Write a run's .cc with the observation budget and closure check (shared by prepare and the pipeline)."""
+    remove_variants(cc_file)
+    csv_to_cc(csv_file, cc_file, min_cc=min_cc, event_id_mapping=event_mapping,
+              max_obs_per_event=max_obs_per_event, max_obs_total=max_obs_total,
+              station_csv=station_csv, catalog_info=catalog_info, closure_tol=closure_tol)
+
+
+def _prepare_run_inputs(pha_file, apply_lag_correction=False):
+    """Station file, merged detections, event mapping, .pha and .cc in RUN_DIR (prepare and prepare_catalog)."""
     cc_file = f'{RUN_DIR}/detections.cc'
     sta_file = f'{RUN_DIR}/station.dat'
     mapping_file = f'{RUN_DIR}/event_id_mapping.csv'
-    
-    create_station_file(STATION_CSV, sta_file)
-    catalog_info = load_catalog(CATALOG_CSV)
-    event_mapping = create_event_id_mapping(CSV_FILE, mapping_file)
-    csv_to_pha(CSV_FILE, pha_file, catalog_info, event_mapping)
-    csv_to_cc(CSV_FILE, cc_file, min_cc=0.6, event_id_mapping=event_mapping)
-    
+
+    catalog_info = reference_catalog()
+    create_station_file(STATION_CSV, sta_file, CSV_FILE, catalog_info, ph2dt_station_radius(f'{RUN_DIR}/ph2dt.inp'))
+    csv_file = f'{RUN_DIR}/{MERGED_CSV_NAME}'
+    dedupe_detections(CSV_FILE, csv_file, f'{RUN_DIR}/{DUPLICATES_NAME}')
+    event_mapping = create_event_id_mapping(csv_file, mapping_file, registry_file=EVENT_REGISTRY)
+    remove_variants(pha_file)
+    csv_to_pha(csv_file, pha_file, catalog_info, event_mapping, apply_lag_correction=apply_lag_correction)
+    write_run_cc(csv_file, cc_file, event_mapping, catalog_info)
+
+
+def prepare_inputs():
+    """Convert CSV to HypoDD formats in run directory."""
+    print("Converting CSV to HypoDD formats...")
+    _prepare_run_inputs(f'{RUN_DIR}/detections.pha')
     print(f"Files ready in {RUN_DIR}/")
 
 
-def run_ph2dt():
-    """Run ph2dt to create differential times."""
+def detections_csv(run_dir=RUN_DIR):
+    """Detection table the run's inputs were written from (merged duplicates if the run has one)."""
+    merged = f'{run_dir}/{MERGED_CSV_NAME}'
+    return merged if os.path.exists(merged) else CSV_FILE
+
+
+def validate_csv(run_dir=RUN_DIR, min_cc=0.6):
+    """Validate CSV inputs against output formats and compiled HypoDD limits."""
+    print("\nValidating CSV inputs...")
+    mapping_file = f'{run_dir}/event_id_mapping.csv'
+    event_mapping = load_event_id_mapping(mapping_file) if os.path.exists(mapping_file) else None
+    # Station codes shared by several networks are resolved by the station stage
+    report = validate_inputs(detections_csv(run_dir), select_stations(STATION_CSV), reference_catalog(), event_mapping,
+                             min_cc=min_cc)
+    print_report(report)
+    return report['ok']
+
+
+def preflight(run_dir=RUN_DIR, hypodd_inp=None):
+    """
+    Validate the station, phase (ph2dt.inp) and .cc (hypodd_inp, if given) files of a run
+    directory against their formats and the compiled HypoDD limits.
+    """
+    print("\nValidating inputs...")
+    ph2dt_params = read_ph2dt_inp(f'{run_dir}/ph2dt.inp')
+    cc_file = None
+    if hypodd_inp is not None:
+        cc_name = read_hypodd_files(f'{run_dir}/{hypodd_inp}')['cc']
+        cc_file = f'{run_dir}/{cc_name}' if cc_name else None
+    report = validate_run_inputs(f"{run_dir}/{ph2dt_params['station_file']}", f"{run_dir}/{ph2dt_params['phase_file']}",
+                                 cc_file)
+    print_report(report)
+    return report['ok']
+
+
+def run_ph2dt(run_dir=RUN_DIR, validate=True, compress=None):
+    """Run ph2dt to create differential times.
+
+    Compressed station/phase files (<name>.gz/.zst) are streamed to ph2dt (see hypodd_io).
+    compress: 'gz' or 'zst' to write dt.ct compressed
+    """
+    if validate and not preflight(run_dir):
+        print("ph2dt not started: fix the validation errors above")
+        return False
+    
     print("\nRunning ph2dt...")
     cmd = [f'{HYPODD_ROOT}/src/ph2dt/ph2dt', 'ph2dt.inp']
-    result = subprocess.run(cmd, cwd=RUN_DIR, capture_output=True, text=True)
+    remove_variants(f'{run_dir}/dt.ct' + (f'.{compress}' if compress else ''))
+    with fortran_files(run_dir, **ph2dt_streams(read_ph2dt_inp(f'{run_dir}/ph2dt.inp'), compress)):
+        result = subprocess.run(cmd, cwd=run_dir, capture_output=True, text=True)
     
     # Print output
     print(result.stdout)
     if result.returncode != 0:
         print("STDERR:", result.stderr)
-        print(f"hypoDD failed with code {result.returncode}")
-        return
+        print(f"ph2dt failed with code {result.returncode}")
+        return False
     
     print("✅ ph2dt complete. Check dt.ct and event.dat")
+    return True
 
 
-def run_hypodd(inp_file):
+def run_hypodd(inp_file, run_dir=RUN_DIR, validate=True, track_convergence=False, stop_shift_m=None, compress=None):
     """Run hypoDD relocation.
     
     Note: hypoDD cannot handle absolute paths for input file.
     We must pass only the filename and run from the directory containing the file.
+
+    track_convergence: collect the per-iteration snapshots into convergence.npz (see convergence.py)
+    stop_shift_m: stop once the 90th percentile of the event shifts stays below this (m) for 2 iterations
+    compress: 'gz' or 'zst' to write the residual file compressed. Compressed inputs
+              (<name>.gz/.zst) are always served to hypoDD (see hypodd_io)
     """
     # Extract just the filename (no path)
     inp_filename = os.path.basename(inp_file)
-    if not os.path.exists(f'{RUN_DIR}/{inp_filename}'):
-        print(f"ERROR: {RUN_DIR}/{inp_filename} not found.")
-        return
+    if not os.path.exists(f'{run_dir}/{inp_filename}'):
+        print(f"ERROR: {run_dir}/{inp_filename} not found.")
+        return False
+
+    if validate and not preflight(run_dir, inp_filename):
+        print("hypoDD not started: fix the validation errors above")
+        return False
     
-    print(f"\nRunning hypoDD with {inp_filename} in {RUN_DIR}...")
+    print(f"\nRunning hypoDD with {inp_filename} in {run_dir}...")
     cmd = [f'{HYPODD_ROOT}/src/hypoDD/hypoDD', inp_filename]
-    result = subprocess.run(cmd, cwd=RUN_DIR, capture_output=True, text=True)
+    inp_path = f'{run_dir}/{inp_filename}'
+    res_name = read_hypodd_files(inp_path)['res']
+    if res_name:
+        remove_variants(f'{run_dir}/{res_name}' + (f'.{compress}' if compress else ''))
+    with fortran_files(run_dir, **hypodd_streams(read_hypodd_files(inp_path), read_hypodd_inp(inp_path), compress)):
+        if track_convergence or stop_shift_m:
+            ok, history = run_watched(cmd[0], inp_filename, run_dir,
+                                      stop_when=shift_below(stop_shift_m) if stop_shift_m else None)
+        else:
+            result = subprocess.run(cmd, cwd=run_dir, capture_output=True, text=True)
+    if track_convergence or stop_shift_m:
+        print_history(history)
+        if ok:
+            print(f"✅ hypoDD complete. Check output in {run_dir}/")
+        return ok
     
     # Print output
     print(result.stdout)
@@ -113,62 +265,237 @@ def run_hypodd(inp_file):
     if result.returncode != 0:
         print("STDERR:", result.stderr)
         print(f"hypoDD failed with code {result.returncode}")
-        return
+        return False
     
-    print(f"✅ hypoDD complete. Check output in {RUN_DIR}/")
+    print(f"✅ hypoDD complete. Check output in {run_dir}/")
+    return True
 
 
 def prepare_inputs_catalog_only():
     """Convert CSV to HypoDD formats with lag-corrected travel times for catalog-only method."""
     print("Converting CSV to HypoDD formats (with lag correction for catalog-only method)...")
-    
     pha_file = f'{RUN_DIR}/detections_cat.pha'
-    cc_file = f'{RUN_DIR}/detections.cc'
-    sta_file = f'{RUN_DIR}/station.dat'
-    mapping_file = f'{RUN_DIR}/event_id_mapping.csv'
-    
-    # Station file and mapping are same as before
-    create_station_file(STATION_CSV, sta_file)
-    catalog_info = load_catalog(CATALOG_CSV)
-    event_mapping = create_event_id_mapping(CSV_FILE, mapping_file)
-    
-    # Generate lag-corrected .pha file
-    csv_to_pha(CSV_FILE, pha_file, catalog_info, event_mapping, apply_lag_correction=True)
-    csv_to_cc(CSV_FILE, cc_file, min_cc=0.6, event_id_mapping=event_mapping)
-    
+    # Station file, mapping and .cc are the same as for prepare
+    _prepare_run_inputs(pha_file, apply_lag_correction=True)
     print(f"Lag-corrected files ready in {RUN_DIR}/")
     print(f"  - {pha_file} (travel times adjusted by lag for detected events)")
 
 
-if __name__ == '__main__':
+def partition_inputs(run_dir):
+    """
+    CSV inputs of a run directory: its own detections.csv (a partition of the detection
+    table) if it has one, otherwise CSV_FILE; STATION_CSV and CATALOG_CSV.
+
+    Returns: dict with detection_csv, station_csv, catalog_csv (absolute paths)
+    """
+    own = f'{run_dir}/{PARTITION_CSV_NAME}'
+    return {'detection_csv': os.path.abspath(own if os.path.exists(own) else CSV_FILE),
+            'station_csv': os.path.abspath(STATION_CSV), 'catalog_csv': os.path.abspath(CATALOG_CSV)}
+
+
+def build_pipeline(run_dir=RUN_DIR, hypodd_inp='hypoDD_my2.inp', min_cc=0.6, max_obs_per_event=None, max_obs_total=MAX_CC_OBS,
+                   closure_tol=CLOSURE_TOL_S, dedupe_tol=DUPLICATE_TOL_S, compress=None,
+                   detection_csv=CSV_FILE, station_csv=STATION_CSV, catalog_csv=CATALOG_CSV):
+    """
+    Declare the prepare -> ph2dt -> hypoDD -> convert workflow as pipeline stages.
+    
+    The station file, event mapping, .pha and .cc stages only depend on the CSV
+    inputs (and the mapping), so they run concurrently and are skipped when unchanged.
+    detection_csv, station_csv, catalog_csv: CSV inputs of this run (see partition_inputs)
+    dedupe_tol: origin time tolerance (s) for merging detections of one earthquake by
+                several templates, None to convert every detection as its own event
+    closure_tol: triplet closure tolerance (s) of the .cc lags, None to skip the check
+    compress: 'gz' or 'zst' to keep the .pha, .cc, dt.ct and .res files compressed
+    """
+    suffix = f'.{compress}' if compress else ''
+    sta_file = f'{run_dir}/station.dat'
+    mapping_file = f'{run_dir}/event_id_mapping.csv'
+    pha_file = f'{run_dir}/detections.pha{suffix}'
+    cc_file = f'{run_dir}/detections.cc{suffix}'
+    ct_file = f'{run_dir}/dt.ct{suffix}'
+    reloc_file = f'{run_dir}/hypoDD.reloc'
+    csv_file = f'{run_dir}/{MERGED_CSV_NAME}'
+
+    def catalog():
+        return reference_catalog(detection_csv, catalog_csv)
+
+    # a stale variant (detections.pha next to detections.pha.gz) would make the inputs ambiguous
+    def write_pha():
+        remove_variants(pha_file)
+        csv_to_pha(csv_file, pha_file, catalog(), load_event_id_mapping(mapping_file))
+
+    def write_cc(min_cc, max_obs_per_event, max_obs_total, closure_tol):
+        write_run_cc(csv_file, cc_file, load_event_id_mapping(mapping_file), catalog(), station_csv, min_cc,
+                     max_obs_per_event, max_obs_total, closure_tol)
+
+    return [
+        stage('station', lambda: create_station_file(station_csv, sta_file, detection_csv, catalog(),
+                                                     ph2dt_station_radius(f'{run_dir}/ph2dt.inp')),
+              inputs=[station_csv, detection_csv, catalog_csv, f'{run_dir}/ph2dt.inp'], outputs=[sta_file]),
+        stage('dedupe', lambda tol_s: dedupe_detections(detection_csv, csv_file, f'{run_dir}/{DUPLICATES_NAME}', tol_s),
+              params={'tol_s': dedupe_tol}, inputs=[detection_csv], outputs=[csv_file, f'{run_dir}/{DUPLICATES_NAME}']),
+        stage('mapping', lambda: create_event_id_mapping(csv_file, mapping_file, registry_file=EVENT_REGISTRY),
+              inputs=[csv_file], outputs=[mapping_file]),
+        stage('pha', write_pha,
+              inputs=[csv_file, catalog_csv, mapping_file], outputs=[pha_file]),
+        stage('cc', write_cc,
+              params={'min_cc': min_cc, 'max_obs_per_event': max_obs_per_event, 'max_obs_total': max_obs_total,
+                      'closure_tol': closure_tol},
+              inputs=[csv_file, station_csv, catalog_csv, mapping_file], outputs=[cc_file]),
+        stage('ph2dt', lambda: run_ph2dt(run_dir, compress=compress),
+              inputs=[f'{run_dir}/ph2dt.inp', sta_file, pha_file],
+              outputs=[ct_file] + [f'{run_dir}/{name}' for name in ('event.dat', 'event.sel', 'station.sel')]),
+        stage('hypodd', lambda: run_hypodd(hypodd_inp, run_dir, compress=compress),
+              inputs=[f'{run_dir}/{hypodd_inp}', cc_file, ct_file] + [f'{run_dir}/{name}' for name in ('event.sel', 'station.sel')],
+              outputs=[reloc_file]),
+        stage('convert', lambda: reloc_to_csv(reloc_file, event_id_mapping_file=mapping_file),
+              inputs=[reloc_file, mapping_file], outputs=[f'{run_dir}/hypoDD.csv']),
+    ]
+
+
+def run_partition(run_dir, hypodd_inp='hypoDD_my2.inp', force=False, **params):
+    """
+    Run the pipeline of one partition (job target of the distributed queue).
+
+    params: build_pipeline parameters. CSV inputs not in params (older job specs)
+            are taken from partition_inputs(run_dir)
+
+    Returns: path of the partition's hypoDD.csv, or False if a stage failed
+    """
+    params = {**partition_inputs(run_dir), **params}
+    ok = run_pipeline(build_pipeline(run_dir, hypodd_inp, **params), f'{run_dir}/{MANIFEST_NAME}', force=force)
+    return f'{run_dir}/hypoDD.csv' if ok else False
+
+
+def main(argv):
+    """Run one CLI command (argv as argv). Returns the exit status."""
     hypoinp_file = 'hypoDD_my2.inp'
     hypoout_file = f'{RUN_DIR}/hypoDD.reloc'
+    ok = True  # False: a stage reported failure (validation errors, non-zero exit code)
     try:
-        if sys.argv[1] == 'compile':
+        if argv[1] == 'compile':
             compile_hypodd()
-        elif sys.argv[1] == 'example':
-            run_example()
-        elif sys.argv[1] == 'prepare':
+        elif argv[1] == 'example':
+            ok = run_example()
+        elif argv[1] == 'prepare':
             prepare_inputs()
-        elif sys.argv[1] == 'prepare_catalog':
+        elif argv[1] == 'prepare_catalog':
             prepare_inputs_catalog_only()
-        elif sys.argv[1] == 'ph2dt':
-            run_ph2dt()
-        elif sys.argv[1] == 'hypodd':
-            run_hypodd(hypoinp_file)
-        elif sys.argv[1] == 'convert':
+        elif argv[1] == 'validate':
+            ok = validate_csv()
+            ok = preflight(hypodd_inp=hypoinp_file) and ok
+        elif argv[1] == 'ph2dt':
+            ok = run_ph2dt()
+        elif argv[1] == 'hypodd':
+            stop_shift = float(argv[argv.index('--stop-shift') + 1]) if '--stop-shift' in argv else None
+            ok = run_hypodd(hypoinp_file, track_convergence='--track' in argv, stop_shift_m=stop_shift)
+        elif argv[1] == 'convergence':
+            history = watch_run(RUN_DIR)
+            print_history(history)
+            if history['clusters']:
+                save_history(history, f'{RUN_DIR}/{HISTORY_FILE}', remove_snapshots=RUN_DIR if '--clean' in argv else None)
+        elif argv[1] == 'dtstats':
+            save_report(dt_file_stats(argv[2]), argv[3] if len(argv) > 3 else f'{argv[2]}_qc')
+        elif argv[1] == 'dedupe':
+            dedupe_detections(CSV_FILE, f'{RUN_DIR}/{MERGED_CSV_NAME}', f'{RUN_DIR}/{DUPLICATES_NAME}',
+                              float(argv[2]) if len(argv) > 2 else DUPLICATE_TOL_S)
+        elif argv[1] == 'closure':
+            tol = float(argv[argv.index('--tol') + 1]) if '--tol' in argv else CLOSURE_TOL_S
+            obs, report = apply_closure_qc(read_dt_cc(argv[2]), tol=tol,
+                                           mode='downweight' if '--downweight' in argv else 'drop')
+            print_closure_report(report)
+            if len(argv) > 3 and not argv[3].startswith('--'):
+                write_dt_cc(obs, argv[3])
+                print(f"✅ Wrote {argv[3]}")
+        elif argv[1] == 'dryrun':
+            overrides = dict(arg.split('=') for arg in argv[2:])
+            dry_run(RUN_DIR, hypoinp_file,
+                    ph2dt={k: float(v) for k, v in overrides.items() if k in PH2DT_PARAMS},
+                    hypodd={k: float(v) for k, v in overrides.items() if k not in PH2DT_PARAMS})
+        elif argv[1] == 'convert':
             reloc_to_csv(hypoout_file, event_id_mapping_file=f'{RUN_DIR}/event_id_mapping.csv')
+        elif argv[1] == 'ingest':
+            run_id = argv[2] if len(argv) > 2 else None
+            ingest_run(RUN_CATALOG, f'{RUN_DIR}/hypoDD.csv', run_id=run_id,
+                       params_files=[f'{RUN_DIR}/ph2dt.inp', f'{RUN_DIR}/{hypoinp_file}'])
+        elif argv[1] == 'registry':
+            for mapping_file in argv[3:] if argv[2:3] == ['import'] else []:
+                import_mapping(EVENT_REGISTRY, mapping_file)
+            registry = load_registry(EVENT_REGISTRY)
+            print(f"{EVENT_REGISTRY}: {len(registry['hypodd'])} events"
+                  + (f", IDs {registry['hypodd'].min()} to {registry['hypodd'].max()}" if len(registry['hypodd']) else ''))
+        elif argv[1] == 'import':
+            base = os.path.splitext(os.path.basename(argv[2]))[0]
+            import_legacy(argv[2], picks_csv=f'{input_dir}/{base}_picks.csv',
+                          catalog_csv=f'{input_dir}/{base}_catalog.csv')
+        elif argv[1] == 'build_catalog':
+            build_catalog_store(CATALOG_CSV, CATALOG_STORE, partition=argv[2] if len(argv) > 2 else 'year')
+        elif argv[1] == 'build_ext':
+            build_extension(force='--force' in argv[2:])
+        elif argv[1] == 'compare_ext':
+            compare_backends(EXAMPLE_DIR)
+        elif argv[1] == 'run':
+            compress = argv[argv.index('--compress') + 1] if '--compress' in argv else None
+            ok = run_pipeline(build_pipeline(RUN_DIR, hypoinp_file, compress=compress), f'{RUN_DIR}/{MANIFEST_NAME}',
+                              force='--force' in argv[2:])
+        elif argv[1] == 'iobench':
+            run_dir = argv[2] if len(argv) > 2 else EXAMPLE_DIR
+            benchmark_io(run_dir, 'hypoDD.inp' if run_dir == EXAMPLE_DIR else hypoinp_file,
+                         ph2dt=f'{HYPODD_ROOT}/src/ph2dt/ph2dt', hypodd=f'{HYPODD_ROOT}/src/hypoDD/hypoDD')
+        elif argv[1] == 'daemon':
+            action = argv[2] if len(argv) > 2 else 'start'
+            if action == 'start':
+                warm_daemon.serve(main)
+            elif action == 'stop':
+                print("Daemon stopped" if warm_daemon.stop_daemon() else "No daemon running")
+            else:
+                print(warm_daemon.daemon_status() or "No daemon running")
+        elif argv[1] == 'submit':
+            for run_dir in argv[3:]:
+                submit_job(argv[2], run_dir, hypodd_inp=hypoinp_file, **partition_inputs(run_dir))
+            print(f"✅ Submitted {len(argv) - 3} jobs to {argv[2]}")
+        elif argv[1] == 'worker':
+            run_worker(argv[2], exit_when_idle='--wait' not in argv[3:])
+        elif argv[1] == 'gather':
+            print(wait_for_queue(argv[2]) if '--wait' in argv[4:] else queue_status(argv[2]))
+            gather_results(argv[2], argv[3])
         else:
             print("Usage: python run_hypodd.py <command> [args]")
             print("\nCommands:")
             print("  compile             - Compile HypoDD Fortran codes")
+            print("  build_ext [--force] - Build the in-process hypoDD extension (f2py)")
+            print("  build_catalog [year|region] - Convert the reference catalog CSV to a partitioned Parquet store")
+            print("  compare_ext         - Check the extension against the hypoDD binary on example2")
             print("  example             - Run HypoDD example2 test")
             print("  prepare             - Convert CSV to HypoDD input files")
             print("  prepare_catalog     - Convert CSV with lag corrections")
+            print("  validate            - Check inputs against file formats and compiled HypoDD limits")
             print("  ph2dt               - Run ph2dt to create differential times")
             print("  hypodd              - Run hypoDD relocation (default: hypoDD.inp, edit file name in python script)")
+            print("  hypodd --track | --stop-shift <m>  - Collect per-iteration snapshots / stop once shifts settle")
+            print("  convergence [--clean]        - Pack existing hypoDD.reloc.CCC.III snapshots into convergence.npz")
+            print("  dtstats <dt.cc|dt.ct> [prefix]  - One-pass QC statistics per station/phase and pair")
+            print("  dedupe [tol_s]      - Merge detections of one earthquake by several templates (detections_merged.csv)")
+            print("  closure <in.cc> [out.cc] [--tol s] [--downweight] - Triplet closure QC of .cc lags (drop/down-weight offenders)")
+            print("  dryrun [param=value ...]     - Predict the events ph2dt/hypoDD keep, e.g. dryrun maxngh=10 obsct=4")
             print("  convert             - Convert .reloc to CSV (default: hypoDD.reloc, edit file name in python script)")
+            print("  ingest [run_id]     - Store hypoDD.csv and run parameters in the SQLite run catalog")
+            print("  import <file>       - Import a legacy .pha/.arc catalog into pick and catalog CSVs")
+            print("  registry [import <mapping.csv> ...] - Show the event ID registry / add existing mappings to it")
+            print("  run [--force]       - Run prepare/ph2dt/hypodd/convert, skipping stages whose outputs are up to date")
+            print("  run --compress gz|zst        - Same, keeping .pha/.cc/dt.ct/.res compressed (streamed to ph2dt/hypoDD)")
+            print("  iobench [run_dir]   - Compare plain and compressed ph2dt/hypoDD runs (bytes written, time)")
+            print("  daemon [start|stop|status]   - Warm daemon that keeps modules and parsed CSVs in memory")
+            print("  submit <queue> <run_dir>...  - Queue run directories as jobs for distributed workers")
+            print("  worker <queue> [--wait]      - Claim and run queued jobs (any host sharing the queue directory)")
+            print("  gather <queue> <out.csv> [--wait] - Merge the results of finished jobs into one catalog")
             print("  compare             - Run both CC and catalog methods and compare")
             
     except Exception as e:
-        print(f"ERROR: {e}\n\n")
\ No newline at end of file
+        print(f"ERROR: {e}\n\n")
+        return 1
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
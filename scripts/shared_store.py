@@ -0,0 +1,202 @@
+"""
+Shared-memory column store for picks/pairs tables.
+
+The numeric columns of a table (travel times, lags, CC, ...) are copied once
+into shared memory blocks; string columns (event_id, station, ...) are stored
+as integer codes plus a dictionary array. Worker processes attach by name and
+get read-only NumPy views, so fanning out to N workers does not multiply memory.
+
+A memory-mapped .npy directory can be used instead when the store has to
+outlive the creating process.
+"""
+import json
+import os
+import secrets
+import sys
+from multiprocessing import Pool, parent_process, shared_memory
+import numpy as np
+import pandas as pd
+
+
+def encode_table(df):
+    """
+    Split a DataFrame into NumPy columns.
+
+    Numeric columns are kept as-is, other columns are factorized into int32
+    codes (-1 = missing) with a fixed-width UTF-8 dictionary.
+
+    Returns: (columns dict {name: array}, dictionaries dict {name: bytes array})
+    """
+    columns, dictionaries = {}, {}
+    for col in df.columns:
+        if pd.api.types.is_numeric_dtype(df[col]):
+            columns[col] = np.ascontiguousarray(df[col].to_numpy())
+        else:
+            codes, uniques = pd.factorize(df[col], sort=False)
+            columns[col] = codes.astype(np.int32)
+            dictionaries[col] = np.array([str(u).encode('utf-8') for u in uniques], dtype=bytes)
+    return columns, dictionaries
+
+
+# Names of blocks created by this process
+_owned_blocks = set()
+
+
+def _attach_block(name):
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=False)
+    shm = shared_memory.SharedMemory(name=name)
+    # Pool workers share the creator's resource tracker. An independent process
+    # has its own tracker, which would unlink the block when it exits (bpo-39959).
+    if name not in _owned_blocks and parent_process() is None:
+        from multiprocessing import resource_tracker
+        resource_tracker.unregister(shm._name, 'shared_memory')
+    return shm
+
+
+def create_shared_store(table):
+    """
+    Copy a table into shared memory.
+
+    Parameters:
+    -----------
+    table : DataFrame or str
+        Table or path to a CSV file (e.g. the detections CSV)
+
+    Returns:
+    --------
+    (meta, blocks): meta is a small picklable dict to pass to workers,
+    blocks are the SharedMemory objects owned by the caller (see unlink_shared_store)
+    """
+    df = pd.read_csv(table) if isinstance(table, str) else table
+    columns, dictionaries = encode_table(df)
+
+    prefix = f'hdd_{secrets.token_hex(4)}'
+    meta = {'n_rows': len(df), 'columns': {}, 'dictionaries': {}}
+    blocks = []
+    for kind, arrays in (('columns', columns), ('dictionaries', dictionaries)):
+        for col, arr in arrays.items():
+            shm = shared_memory.SharedMemory(name=f'{prefix}_{len(blocks)}', create=True, size=max(arr.nbytes, 1))
+            np.ndarray(arr.shape, dtype=arr.dtype, buffer=shm.buf)[:] = arr
+            _owned_blocks.add(shm.name)
+            meta[kind][col] = {'shm': shm.name, 'dtype': arr.dtype.str, 'shape': arr.shape}
+            blocks.append(shm)
+
+    nbytes = sum(b.size for b in blocks)
+    print(f"Created shared store {prefix} with {len(df)} rows ({nbytes / 1e6:.1f} MB)")
+    return meta, blocks
+
+
+def attach_shared_store(meta):
+    """
+    Attach to a store created by create_shared_store.
+
+    Returns: dict with 'n_rows', 'columns' and 'dictionaries' (read-only arrays);
+             keep the dict alive while using the arrays and pass it to close_store.
+    """
+    store = {'n_rows': meta['n_rows'], 'columns': {}, 'dictionaries': {}, '_blocks': []}
+    for kind in ('columns', 'dictionaries'):
+        for col, info in meta[kind].items():
+            shm = _attach_block(info['shm'])
+            arr = np.ndarray(tuple(info['shape']), dtype=np.dtype(info['dtype']), buffer=shm.buf)
+            arr.flags.writeable = False
+            store[kind][col] = arr
+            store['_blocks'].append(shm)
+    return store
+
+
+def close_store(store):
+    """Release a worker's views of the shared store."""
+    store['columns'].clear()
+    store['dictionaries'].clear()
+    for shm in store.pop('_blocks', []):
+        shm.close()
+
+
+def unlink_shared_store(blocks):
+    """Free the shared memory (call once, from the creating process)."""
+    for shm in blocks:
+        shm.close()
+        shm.unlink()
+        _owned_blocks.discard(shm.name)
+
+
+def save_npy_store(table, directory):
+    """
+    Write a table as a directory of .npy column files plus meta.json.
+
+    Returns: directory
+    """
+    df = pd.read_csv(table) if isinstance(table, str) else table
+    columns, dictionaries = encode_table(df)
+    os.makedirs(directory, exist_ok=True)
+
+    meta = {'n_rows': len(df), 'columns': {}, 'dictionaries': {}}
+    for kind, arrays in (('columns', columns), ('dictionaries', dictionaries)):
+        for i, (col, arr) in enumerate(arrays.items()):
+            fname = f'{kind}_{i}.npy'
+            np.save(f'{directory}/{fname}', arr)
+            meta[kind][col] = {'file': fname}
+    with open(f'{directory}/meta.json', 'w') as f:
+        json.dump(meta, f, indent=2)
+
+    print(f"Saved column store for {len(df)} rows in {directory}")
+    return directory
+
+
+def open_npy_store(directory):
+    """
+    Memory-map a store written by save_npy_store (read-only, shared through the page cache).
+    """
+    with open(f'{directory}/meta.json', 'r') as f:
+        meta = json.load(f)
+    store = {'n_rows': meta['n_rows'], 'columns': {}, 'dictionaries': {}}
+    for kind in ('columns', 'dictionaries'):
+        for col, info in meta[kind].items():
+            store[kind][col] = np.load(f"{directory}/{info['file']}", mmap_mode='r')
+    return store
+
+
+def decode(store, col, codes=None):
+    """Map integer codes of a string column back to str values."""
+    codes = store['columns'][col] if codes is None else np.asarray(codes)
+    values = np.asarray(store['dictionaries'][col]).astype(str)
+    return np.where(codes >= 0, values[np.maximum(codes, 0)], None)
+
+
+def to_frame(store, rows=None, columns=None):
+    """
+    Materialize (a subset of) the store as a DataFrame copy in the calling process.
+
+    rows: integer index array or boolean mask, default all rows
+    """
+    columns = columns or list(store['columns'])
+    data = {}
+    for col in columns:
+        values = store['columns'][col] if rows is None else store['columns'][col][rows]
+        data[col] = decode(store, col, values) if col in store['dictionaries'] else np.array(values)
+    return pd.DataFrame(data)
+
+
+_worker_store = None
+
+
+def _init_worker(meta):
+    global _worker_store
+    _worker_store = attach_shared_store(meta)
+
+
+def _call_worker(args):
+    func, part = args
+    return func(_worker_store, part)
+
+
+def map_shared(meta, func, partitions, processes=None):
+    """
+    Run func(store, partition) for each partition in a process pool.
+
+    Every worker attaches to the shared store once; func must be a module-level
+    function. Returns the list of results in partition order.
+    """
+    with Pool(processes, initializer=_init_worker, initargs=(meta,)) as pool:
+        return pool.map(_call_worker, [(func, part) for part in partitions])
@@ -0,0 +1,426 @@
+"""
+3D travel-time fields for simulps velocity models (hypoDD IMOD=9).
+
+Reads the .vel grids used by hypoDD's 3D mode (e.g. examples/example3/
+pkf3D_P.vel, pkf3D_PS.vel), resamples them onto a uniform grid and computes
+one travel-time field per station and phase with a fast-marching eikonal
+solver (second-order upwind differences). By reciprocity, the field of a station gives the travel time
+from any hypocenter to that station, and its gradient gives the partial
+derivatives hypoDD computes by ray tracing (partials_3d.f).
+
+Fields are cached as .npy files keyed by a hash of model, grid, coordinate
+origin and station, and opened memory-mapped, so they are computed once and
+shared between processes. Coordinates follow hypoDD: setorg/dist short-distance
+conversion around (LAT_3D, LON_3D) with anticlockwise rotation ROT_3D, depth in km.
+"""
+import hashlib
+import heapq
+import json
+import math
+import os
+from multiprocessing import Pool
+import numpy as np
+import pandas as pd
+
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+CACHE_DIR = os.path.abspath(f'{script_dir}/../data/tt3d_cache')
+
+# hypoDD uses t_S = 1.73 * t_P when the model has no S velocities (partials_3d.f)
+DEFAULT_VPVS = 1.73
+SOLVER_VERSION = 1
+
+
+def read_simulps_vel(vel_file):
+    """
+    Read a simulps velocity model as read by hypoDD (get_vel3d.f).
+
+    Returns: dict with 'bld', node coordinates 'x', 'y', 'z' (km) and
+             'vp', 'vs' arrays indexed [ix, iy, iz] ('vs' is None for P-only models)
+    """
+    with open(vel_file, 'r') as f:
+        lines = f.read().split('\n')
+
+    head = lines[0].split()
+    bld, nx, ny, nz = float(head[0]), int(head[1]), int(head[2]), int(head[3])
+
+    # Free-format reads: node coordinates may continue over several lines
+    pos, values = 1, []
+    while len(values) < nx + ny + nz:
+        values += [float(v) for v in lines[pos].split()]
+        pos += 1
+    x, y, z = np.array(values[:nx]), np.array(values[nx:nx + ny]), np.array(values[nx + ny:nx + ny + nz])
+
+    def read_3i3(line):
+        line = line.ljust(9)
+        return [int(line[k:k + 3]) if line[k:k + 3].strip() else 0 for k in (0, 3, 6)]
+
+    # Fixed nodes, ended by a blank/zero line
+    while read_3i3(lines[pos])[0] > 0:
+        pos += 1
+    pos += 1
+    # Linked nodes: master, link type, linked nodes (zero line), ..., ended by a zero line
+    while read_3i3(lines[pos])[0] > 0:
+        pos += 2
+        while read_3i3(lines[pos])[0] > 0:
+            pos += 1
+        pos += 1
+    pos += 1
+
+    tokens = np.array(' '.join(lines[pos:]).split(), dtype=float)
+    n = nx * ny * nz
+    if len(tokens) < n:
+        raise ValueError(f"{vel_file}: expected {n} velocities, found {len(tokens)}")
+    # File order: for each z layer, ny rows of nx values
+    vp = tokens[:n].reshape(nz, ny, nx).transpose(2, 1, 0).copy()
+    vs = None
+    if len(tokens) >= 2 * n:
+        vpvs = tokens[n:2 * n].reshape(nz, ny, nx).transpose(2, 1, 0)
+        vs = vp / vpvs
+    return {'bld': bld, 'x': x, 'y': y, 'z': z, 'vp': vp, 'vs': vs}
+
+
+def geo_to_xy(lat, lon, origin):
+    """
+    Convert lat/lon to model x/y (km) like hypoDD's setorg + dist (WGS72 short-distance conversion).
+
+    origin: (LAT_3D, LON_3D, ROT_3D) from the hypoDD control file
+    """
+    orlat, orlon, rot = origin
+    rad = 0.017453292
+    rearth, ellip = 6378.135, 298.26
+    olat, olon = orlat * 60.0, orlon * 60.0
+    phi = olat * rad / 60.0
+    rlatc = math.tan(phi - math.sin(phi * 2.0) / ellip) / math.tan(phi)
+    lat1 = math.atan(rlatc * math.tan(olat * rad / 60.0))
+    lat2 = math.atan(rlatc * math.tan((olat + 1.0) * rad / 60.0))
+    r = rearth * (1.0 - math.sin(lat1) ** 2 / ellip)
+    aa = r * (lat2 - lat1)
+    bb = r * math.acos(math.sin(lat1) ** 2 + math.cos(rad / 60.0) * math.cos(lat1) ** 2) / math.cos(lat1)
+
+    q = 60.0 * np.asarray(lat, dtype=float) - olat
+    yp = q + olat
+    lat_p = np.arctan(rlatc * np.tan(rad * yp / 60.0))
+    lat3 = (lat1 + lat_p) / 2.0
+    xx = (60.0 * np.asarray(lon, dtype=float) - olon) * bb * np.cos(lat3)
+    q = q * aa
+    if rot != 0.0:
+        sint, cost = math.sin(rot * rad), math.cos(rot * rad)
+        q, xx = cost * q + sint * xx, cost * xx - sint * q
+    return xx, q
+
+
+def _axis_weights(nodes, coords):
+    """Lower node index and linear weight of each coordinate along one (possibly uneven) axis, clamped (see _outside)."""
+    coords = np.clip(np.asarray(coords, dtype=float), nodes[0], nodes[-1])
+    i0 = np.clip(np.searchsorted(nodes, coords, side='right') - 1, 0, len(nodes) - 2)
+    w = (coords - nodes[i0]) / (nodes[i0 + 1] - nodes[i0])
+    return i0, w
+
+
+def _outside(axes, points):
+    """Points (n, 3) outside the grid extent, where _trilinear would extrapolate the edge values."""
+    return np.any([(points[:, k] < ax[0]) | (points[:, k] > ax[-1]) for k, ax in enumerate(axes)], axis=0)
+
+
+def _trilinear(values, axes, points, gradient=False):
+    """Trilinear interpolation of values[ix, iy, iz] at points (n, 3); optionally the gradient of the interpolant."""
+    (ix, wx), (iy, wy), (iz, wz) = [_axis_weights(ax, points[:, k]) for k, ax in enumerate(axes)]
+    c = {(a, b, d): values[ix + a, iy + b, iz + d] for a in (0, 1) for b in (0, 1) for d in (0, 1)}
+
+    def lerp(v0, v1, w):
+        return v0 + (v1 - v0) * w
+
+    c00, c01 = lerp(c[0, 0, 0], c[1, 0, 0], wx), lerp(c[0, 0, 1], c[1, 0, 1], wx)
+    c10, c11 = lerp(c[0, 1, 0], c[1, 1, 0], wx), lerp(c[0, 1, 1], c[1, 1, 1], wx)
+    c0, c1 = lerp(c00, c10, wy), lerp(c01, c11, wy)
+    value = lerp(c0, c1, wz)
+    if not gradient:
+        return value
+
+    dx = [axes[k][i + 1] - axes[k][i] for k, i in enumerate((ix, iy, iz))]
+    d_dz = (c1 - c0) / dx[2]
+    d_dy = lerp((c10 - c00), (c11 - c01), wz) / dx[1]
+    ddx = {(b, d): c[1, b, d] - c[0, b, d] for b in (0, 1) for d in (0, 1)}
+    d_dx = lerp(lerp(ddx[0, 0], ddx[1, 0], wy), lerp(ddx[0, 1], ddx[1, 1], wy), wz) / dx[0]
+    return value, np.column_stack([d_dx, d_dy, d_dz])
+
+
+def model_grid(model, spacing=1.0, extent=None):
+    """
+    Resample a simulps model onto a uniform grid (linear interpolation between nodes, as in simulps).
+
+    extent: (xmin, xmax, ymin, ymax, zmin, zmax) in km. Default: the inner nodes
+            (the outermost simulps nodes are distant padding)
+    Returns: dict with uniform axes 'x', 'y', 'z', 'spacing' and 'vp', 'vs' on the grid
+    """
+    if extent is None:
+        extent = (model['x'][1], model['x'][-2], model['y'][1], model['y'][-2], model['z'][1], model['z'][-2])
+    axes = [np.arange(lo, hi + spacing / 2, spacing) for lo, hi in zip(extent[::2], extent[1::2])]
+    pts = np.stack(np.meshgrid(*axes, indexing='ij'), axis=-1).reshape(-1, 3)
+    shape = tuple(len(a) for a in axes)
+    node_axes = (model['x'], model['y'], model['z'])
+    grid = {'x': axes[0], 'y': axes[1], 'z': axes[2], 'spacing': spacing,
+            'vp': _trilinear(model['vp'], node_axes, pts).reshape(shape)}
+    grid['vs'] = _trilinear(model['vs'], node_axes, pts).reshape(shape) if model['vs'] is not None else None
+    return grid
+
+
+def fast_marching(slowness, spacing, source, init_radius=3.0, second_order=True):
+    """
+    Fast-marching solution of |grad T| = slowness on a uniform grid.
+
+    Parameters:
+    -----------
+    slowness : ndarray (nx, ny, nz)
+        Slowness (s/km) at the grid nodes
+    spacing : float
+        Node spacing (km)
+    source : (fx, fy, fz)
+        Source position in fractional grid indices
+    init_radius : float
+        Nodes within this many cells of the source get straight-ray times
+    second_order : bool
+        Use second-order upwind differences where available (much smaller error
+        than first order for the same grid)
+
+    Returns: travel times (nx, ny, nz), float64
+    """
+    nx, ny, nz = slowness.shape
+    nynz = ny * nz
+    n = nx * nynz
+    s = slowness.ravel().tolist()
+    t = [math.inf] * n
+    known = bytearray(n)
+    heap = []
+    fx, fy, fz = source
+
+    # --- straight-ray initialization around the source
+    ix0, iy0, iz0 = int(round(fx)), int(round(fy)), int(round(fz))
+    s_src = float(_trilinear(slowness, [np.arange(m, dtype=float) for m in (nx, ny, nz)],
+                             np.array([[fx, fy, fz]]))[0])
+    r = int(math.ceil(init_radius))
+    for i in range(max(ix0 - r, 0), min(ix0 + r, nx - 1) + 1):
+        for j in range(max(iy0 - r, 0), min(iy0 + r, ny - 1) + 1):
+            for k in range(max(iz0 - r, 0), min(iz0 + r, nz - 1) + 1):
+                d = math.sqrt((i - fx) ** 2 + (j - fy) ** 2 + (k - fz) ** 2)
+                if d <= init_radius:
+                    idx = i * nynz + j * nz + k
+                    t[idx] = d * spacing * 0.5 * (s_src + s[idx])
+                    known[idx] = 1
+    if not any(known):
+        raise ValueError(f"Source {source} is outside the grid")
+
+    def update(idx):
+        # Upwind terms (alpha, beta) per axis: alpha * (T - beta)^2; second order where
+        # two known nodes line up on the upwind side (3T - 4t1 + t2 = 2h|dT/dx|)
+        i, rem = divmod(idx, nynz)
+        j, k = divmod(rem, nz)
+        terms = []
+        for pos, size, step in ((i, nx, nynz), (j, ny, nz), (k, nz, 1)):
+            best = None
+            for sign in (-1, 1):
+                nb = idx + sign * step
+                if 0 <= pos + sign < size and known[nb] and (best is None or t[nb] < best[1]):
+                    t1 = t[nb]
+                    nb2 = nb + sign * step
+                    if second_order and 0 <= pos + 2 * sign < size and known[nb2] and t[nb2] <= t1:
+                        best = (2.25, (4.0 * t1 - t[nb2]) / 3.0, t1)
+                    else:
+                        best = (1.0, t1, t1)
+            if best is not None:
+                terms.append(best)
+        terms.sort(key=lambda term: term[2])
+        hs2 = (spacing * s[idx]) ** 2
+        tt = terms[0][2] + spacing * s[idx]
+        a = b = c = 0.0
+        for m, (alpha, beta, t1) in enumerate(terms):
+            if m > 0 and tt <= t1:
+                break
+            a += alpha
+            b += alpha * beta
+            c += alpha * beta * beta
+            disc = b * b - a * (c - hs2)
+            if disc < 0:
+                break
+            tt = (b + math.sqrt(disc)) / a
+        return tt
+
+    def push_neighbors(idx):
+        i, rem = divmod(idx, nynz)
+        j, k = divmod(rem, nz)
+        for ok, nb in ((i > 0, idx - nynz), (i < nx - 1, idx + nynz), (j > 0, idx - nz),
+                       (j < ny - 1, idx + nz), (k > 0, idx - 1), (k < nz - 1, idx + 1)):
+            if ok and not known[nb]:
+                tt = update(nb)
+                if tt < t[nb]:
+                    t[nb] = tt
+                    heapq.heappush(heap, (tt, nb))
+
+    for idx in [i for i in range(n) if known[i]]:
+        push_neighbors(idx)
+    while heap:
+        tt, idx = heapq.heappop(heap)
+        if known[idx] or tt > t[idx]:
+            continue
+        known[idx] = 1
+        push_neighbors(idx)
+
+    return np.array(t).reshape(nx, ny, nz)
+
+
+def _hash_arrays(*items):
+    h = hashlib.sha256()
+    for item in items:
+        if isinstance(item, np.ndarray):
+            h.update(np.ascontiguousarray(item).tobytes())
+        else:
+            h.update(json.dumps(item, sort_keys=True, default=float).encode())
+    return h.hexdigest()
+
+
+def _grid_index(grid, x, y, z):
+    return tuple((c - axis[0]) / grid['spacing'] for c, axis in zip((x, y, z), (grid['x'], grid['y'], grid['z'])))
+
+
+def _compute_field(args):
+    slowness, spacing, source, path = args
+    field = fast_marching(slowness, spacing, source).astype(np.float32)
+    tmp = f'{path}.tmp.npy'
+    np.save(tmp, field)
+    os.replace(tmp, path)
+    return path
+
+
+def station_fields(vel_file, stations, origin, phases=('P', 'S'), spacing=1.0, extent=None,
+                   cache_dir=CACHE_DIR, processes=None):
+    """
+    Travel-time fields of all stations, computed once and cached as memory-mapped .npy files.
+
+    Parameters:
+    -----------
+    vel_file : str
+        simulps model (.vel)
+    stations : DataFrame
+        station, latitude, longitude, elevation (m)
+    origin : (LAT_3D, LON_3D, ROT_3D)
+        Model origin and rotation, as in the hypoDD control file
+    phases : tuple
+        'P' and/or 'S'. Without S velocities, S times are 1.73 * P times (as in hypoDD)
+    spacing : float
+        Grid spacing (km)
+    extent : tuple, optional
+        (xmin, xmax, ymin, ymax, zmin, zmax). Default: inner model nodes, extended up to
+        the station elevations. Stations outside the extent are skipped
+    cache_dir : str
+        Cache directory
+    processes : int, optional
+        Worker processes for the fields not yet cached
+
+    Returns:
+    --------
+    dict with 'grid' (axes and spacing), 'origin' and
+    'fields' {(station, phase): (memmap, scale)} (scale is 1.73 for S fields derived from P)
+    """
+    model = read_simulps_vel(vel_file)
+    sx, sy = geo_to_xy(stations['latitude'].to_numpy(), stations['longitude'].to_numpy(), origin)
+    sz = -stations['elevation'].to_numpy(dtype=float) / 1000.0
+    if extent is None:
+        # Inner nodes in x/y; z extended up to the highest station
+        zmin = max(min(model['z'][1], math.floor(sz.min() / spacing) * spacing), model['z'][0])
+        extent = (model['x'][1], model['x'][-2], model['y'][1], model['y'][-2], zmin, model['z'][-2])
+    inside = ((sx >= extent[0]) & (sx <= extent[1]) & (sy >= extent[2]) & (sy <= extent[3])
+              & (sz >= extent[4]) & (sz <= extent[5]))
+    if not inside.all():
+        print(f"Skipping {(~inside).sum()} stations outside the grid extent {tuple(float(e) for e in extent)}: "
+              f"{', '.join(stations['station'].astype(str)[~inside].iloc[:10])}")
+    grid = model_grid(model, spacing, extent)
+
+    model_key = _hash_arrays(model['x'], model['y'], model['z'], model['vp'],
+                             model['vs'] if model['vs'] is not None else np.zeros(0),
+                             [float(e) for e in extent], spacing, list(origin), SOLVER_VERSION)
+    os.makedirs(cache_dir, exist_ok=True)
+
+    paths, jobs = {}, []
+    for sta, x, y, z in zip(stations['station'].astype(str)[inside], sx[inside], sy[inside], sz[inside]):
+        source = _grid_index(grid, x, y, z)
+        for phase in phases:
+            solve_phase = 'S' if phase == 'S' and grid['vs'] is not None else 'P'
+            key = _hash_arrays(model_key, sta, round(float(x), 6), round(float(y), 6), round(float(z), 6), solve_phase)
+            path = f'{cache_dir}/{sta}_{solve_phase}_{key[:16]}.npy'
+            paths[(sta, phase)] = (path, phase != solve_phase)
+            if not os.path.exists(path) and path not in [j[3] for j in jobs]:
+                vel = grid['vs'] if solve_phase == 'S' else grid['vp']
+                jobs.append((1.0 / vel, spacing, source, path))
+
+    if jobs:
+        print(f"Computing {len(jobs)} travel-time fields ({len(grid['x'])}x{len(grid['y'])}x{len(grid['z'])} nodes)...")
+        if processes == 1:
+            for job in jobs:
+                _compute_field(job)
+        else:
+            with Pool(processes) as pool:
+                pool.map(_compute_field, jobs)
+    print(f"✅ {len(paths)} travel-time fields ready ({len(paths) - len(jobs)} from cache {cache_dir})")
+
+    fields = {}
+    for key, (path, scaled) in paths.items():
+        field = np.load(path, mmap_mode='r')
+        fields[key] = (field, DEFAULT_VPVS if scaled else 1.0)
+    return {'grid': {k: grid[k] for k in ('x', 'y', 'z', 'spacing')}, 'origin': tuple(origin), 'fields': fields}
+
+
+def travel_times(tt, station, phase, lat, lon, depth, gradient=False, warn=True):
+    """
+    Travel times (s) from hypocenters to a station by trilinear interpolation of its field.
+
+    Parameters:
+    -----------
+    tt : dict
+        Output of station_fields
+    station, phase : str
+        Station code and 'P'/'S'
+    lat, lon, depth : array-like
+        Hypocenters (depth in km)
+    gradient : bool
+        Also return dT/dx, dT/dy, dT/dz (s/km, model coordinates) at the hypocenters
+    warn : bool
+        Print a warning when hypocenters are outside the grid
+
+    Returns: times, or (times, gradients (n, 3)); NaN for hypocenters outside the grid
+    """
+    field, scale = tt['fields'][(station, phase)]
+    x, y = geo_to_xy(np.atleast_1d(lat), np.atleast_1d(lon), tt['origin'])
+    points = np.column_stack([x, y, np.atleast_1d(depth).astype(float)])
+    axes = (tt['grid']['x'], tt['grid']['y'], tt['grid']['z'])
+    outside = _outside(axes, points)
+    if warn and outside.any():
+        print(f"WARNING: {outside.sum()} of {len(points)} hypocenters are outside the travel-time grid (NaN)")
+    if not gradient:
+        value = _trilinear(field, axes, points) * scale
+        value[outside] = np.nan
+        return value
+    value, grad = _trilinear(field, axes, points, gradient=True)
+    value, grad = value * scale, grad * scale
+    value[outside], grad[outside] = np.nan, np.nan
+    return value, grad
+
+
+def travel_time_table(tt, events, phases=('P', 'S')):
+    """
+    Travel times from all events to all stations of tt.
+
+    events: DataFrame with latitude, longitude, depth (and optionally an ID column)
+    Returns: DataFrame indexed like events with one column per (station, phase); NaN rows
+             for events outside the grid
+    """
+    lat, lon, depth = events['latitude'].to_numpy(), events['longitude'].to_numpy(), events['depth'].to_numpy()
+    x, y = geo_to_xy(lat, lon, tt['origin'])
+    outside = _outside((tt['grid']['x'], tt['grid']['y'], tt['grid']['z']), np.column_stack([x, y, depth]))
+    if outside.any():
+        print(f"WARNING: {outside.sum()} of {len(events)} events are outside the travel-time grid (NaN)")
+    columns = {}
+    for station, phase in tt['fields']:
+        if phase in phases:
+            columns[(station, phase)] = travel_times(tt, station, phase, lat, lon, depth, warn=False)
+    return pd.DataFrame(columns, index=events.index)
@@ -0,0 +1,384 @@
+"""
+Pre-flight validation of HypoDD inputs.
+
+Checks the detection/station tables against the fixed-width formats written
+by csv_to_pha/csv_to_cc and the array limits compiled into ph2dt/hypoDD
+(include/*.inc), so runs that would crash or silently drop data are blocked
+before any Fortran time is spent. validate_run_inputs() applies the same
+checks to the station.dat/.pha/.cc files of a run directory. All checks are
+vectorized.
+"""
+import glob
+import os
+import re
+import numpy as np
+import pandas as pd
+from hypodd_formats import read_dt_cc, read_station_dat
+from hypodd_io import compressed_source
+from legacy_import import read_pha_lines
+
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+INCLUDE_DIR = os.path.abspath(f'{script_dir}/../HypoDD-2.1b/include')
+
+# Largest ID that fits the .cc header ({id:9d}); .pha uses i10
+MAX_HYPODD_ID = 999999999
+# Station codes are read into character*7
+MAX_STA_LEN = 7
+
+# (column, min, max, format) for every numeric field written to .pha/.cc/station.dat
+FIELD_RANGES = [
+    ('travel_time_p', -999.999, 9999.999, '.pha TT (8.3f)'),
+    ('travel_time_s', -999.999, 9999.999, '.pha TT (8.3f)'),
+    ('lag_time_p', -9.999999, 99.999999, '.cc DT (9.6f)'),
+    ('lag_time_s', -9.999999, 99.999999, '.cc DT (9.6f)'),
+    # Negative weights are legacy picks flagged by importance (see legacy_import)
+    ('cc_p', -1.0, 1.0, 'pick weight (6.3f)'),
+    ('cc_s', -1.0, 1.0, 'pick weight (6.3f)'),
+]
+STATION_RANGES = [
+    ('latitude', -90.0, 90.0, 'station.dat LAT (9.5f)'),
+    ('longitude', -180.0, 180.0, 'station.dat LON (10.5f)'),
+    ('elevation', -9999.9, 99999.9, 'station.dat ELV (6.1f)'),
+]
+
+
+def read_inc_limits(include_dir=INCLUDE_DIR):
+    """
+    Parse integer PARAMETER values (MAXEVE, MAXSTA, MEV, ...) from Fortran include files.
+
+    Comment lines and commented-out parameter blocks are ignored.
+
+    Returns: dict {NAME: value}
+    """
+    limits = {}
+    for inc_file in sorted(glob.glob(f'{include_dir}/*.inc')):
+        with open(inc_file, 'r') as f:
+            lines = [line.rstrip('\n') for line in f
+                     if line[:1] not in ('c', 'C', '*', '!') and line.strip()]
+        # Join continuation lines (non-blank character in column 6)
+        source = ''
+        for line in lines:
+            if len(line) > 5 and line[:5].strip() == '' and line[5] not in (' ', '0', '\t'):
+                source += line[6:]
+            else:
+                source += '\n' + line
+        for body in re.findall(r'parameter\s*\(([^)]*)\)', source, flags=re.IGNORECASE):
+            for name, value in re.findall(r'(\w+)\s*=\s*([-\d]+)\s*(?:,|$)', body.replace('\n', ' ')):
+                limits[name.upper()] = int(value)
+    return limits
+
+
+def _issue(report, level, check, message, examples=None, n=None):
+    report[level].append({
+        'check': check,
+        'message': message,
+        'n': int(n) if n is not None else None,
+        'examples': [str(e) for e in (examples if examples is not None else [])][:5],
+    })
+
+
+def validate_inputs(csv_file, station_csv, catalog_info=None, event_id_mapping=None,
+                    min_cc=0.0, include_dir=INCLUDE_DIR):
+    """
+    Validate detection and station tables before running ph2dt/hypoDD.
+
+    Parameters:
+    -----------
+    csv_file : str or DataFrame
+        Detection phase picks (event_id, template_id, origin_time, station, ...)
+    station_csv : str or DataFrame
+        Station table (station, latitude, longitude, elevation)
+    catalog_info : dict, optional
+        Output of load_catalog, used to check that every event has a starting location
+    event_id_mapping : dict, optional
+        {original_event_id: synthetic_id}, checked against the output field widths
+    min_cc : float
+        CC threshold used by csv_to_cc
+    include_dir : str
+        Directory with hypoDD.inc / ph2dt.inc
+
+    Returns:
+    --------
+    dict with 'ok', 'errors', 'warnings', 'counts' and 'limits'
+    """
+    df = pd.read_csv(csv_file) if isinstance(csv_file, str) else csv_file
+    sta = pd.read_csv(station_csv) if isinstance(station_csv, str) else station_csv
+    limits = read_inc_limits(include_dir)
+    report = {'errors': [], 'warnings': [], 'counts': {}, 'limits': limits}
+
+    # --- required columns
+    required = ['event_id', 'template_id', 'origin_time', 'station', 'travel_time_p', 'travel_time_s',
+                'lag_time_p', 'lag_time_s', 'cc_p', 'cc_s']
+    missing = [c for c in required if c not in df.columns]
+    if missing:
+        _issue(report, 'errors', 'columns', f"Detection table is missing columns: {missing}")
+        report['ok'] = False
+        return report
+
+    # --- station membership (picks vs station table)
+    pick_sta = df['station'].astype(str).to_numpy(dtype=str)
+    sta_codes = sta['station'].astype(str).to_numpy(dtype=str)
+    unknown = ~np.isin(pick_sta, sta_codes)
+    if unknown.any():
+        _issue(report, 'errors', 'station_missing',
+               f"{unknown.sum()} picks use stations not in the station table (ph2dt drops them)",
+               np.unique(pick_sta[unknown]), unknown.sum())
+
+    dup_sta = pd.Series(sta_codes).duplicated(keep=False).to_numpy()
+    if dup_sta.any():
+        _issue(report, 'errors', 'station_duplicate',
+               "Station codes listed more than once (ph2dt stops: 'station is listed twice')",
+               np.unique(sta_codes[dup_sta]), dup_sta.sum())
+
+    too_long = np.char.str_len(np.union1d(pick_sta, sta_codes)) > MAX_STA_LEN
+    if too_long.any():
+        _issue(report, 'errors', 'station_code_width',
+               f"Station codes longer than {MAX_STA_LEN} characters are truncated by ph2dt/hypoDD",
+               np.union1d(pick_sta, sta_codes)[too_long], too_long.sum())
+
+    # --- duplicate picks
+    dup_picks = df.duplicated(['event_id', 'template_id', 'station'], keep=False).to_numpy()
+    if dup_picks.any():
+        _issue(report, 'errors', 'duplicate_picks',
+               "Duplicate (event_id, template_id, station) rows",
+               df.loc[dup_picks, 'event_id'].unique(), dup_picks.sum())
+
+    # --- numeric ranges / format widths
+    for col, lo, hi, fmt in FIELD_RANGES:
+        values = pd.to_numeric(df[col], errors='coerce').to_numpy(dtype=float)
+        bad = np.isfinite(values) & ((values < lo) | (values > hi))
+        if bad.any():
+            _issue(report, 'errors', f'range_{col}', f"{col} outside [{lo}, {hi}] for {fmt}",
+                   values[bad], bad.sum())
+        not_numeric = df[col].notna().to_numpy() & ~np.isfinite(values)
+        if not_numeric.any():
+            _issue(report, 'errors', f'nan_{col}', f"{col} is not a finite number",
+                   df.loc[not_numeric, col], not_numeric.sum())
+
+    for pha in ('p', 's'):
+        lag = df[f'lag_time_{pha}'].notna().to_numpy()
+        cc = df[f'cc_{pha}'].notna().to_numpy()
+        tt = df[f'travel_time_{pha}'].notna().to_numpy()
+        silent = lag & ~cc
+        if silent.any():
+            _issue(report, 'warnings', f'nan_weight_{pha}',
+                   f"{pha.upper()} lags without CC are dropped from .cc", df.loc[silent, 'event_id'].unique(), silent.sum())
+        orphan = lag & ~tt
+        if orphan.any():
+            _issue(report, 'warnings', f'lag_without_tt_{pha}',
+                   f"{pha.upper()} lags without a travel time (not in .pha)", df.loc[orphan, 'event_id'].unique(), orphan.sum())
+
+    for col, lo, hi, fmt in STATION_RANGES:
+        values = pd.to_numeric(sta[col], errors='coerce').to_numpy(dtype=float)
+        bad = ~np.isfinite(values) | (values < lo) | (values > hi)
+        if bad.any():
+            _issue(report, 'errors', f'station_{col}', f"Station {col} missing or outside [{lo}, {hi}] for {fmt}",
+                   sta_codes[bad], bad.sum())
+
+    # --- origin times
+    times = pd.to_datetime(df['origin_time'], errors='coerce', utc=True, format='ISO8601')
+    bad_time = times.isna().to_numpy()
+    if bad_time.any():
+        _issue(report, 'errors', 'origin_time', "Unparseable origin_time",
+               df.loc[bad_time, 'origin_time'], bad_time.sum())
+
+    # --- event IDs
+    events = df['event_id'].unique()
+    if event_id_mapping is not None:
+        ids = pd.Series(events).map(event_id_mapping)
+        unmapped = ids.isna().to_numpy()
+        if unmapped.any():
+            _issue(report, 'errors', 'id_unmapped', "Events missing from the ID mapping",
+                   events[unmapped], unmapped.sum())
+        ids = ids.dropna().to_numpy(dtype=np.int64)
+        overflow = (ids > MAX_HYPODD_ID) | (ids < 0)
+        if overflow.any():
+            _issue(report, 'errors', 'id_width',
+                   f"Synthetic IDs do not fit the .cc header field ({{id:9d}}, max {MAX_HYPODD_ID})",
+                   ids[overflow], overflow.sum())
+
+        detected = df['event_id'] != df['template_id']
+        templates = df.loc[detected, 'template_id'].unique()
+        unmapped_tmpl = ~pd.Series(templates).isin(list(event_id_mapping)).to_numpy()
+        if unmapped_tmpl.any():
+            _issue(report, 'errors', 'template_unmapped',
+                   "Templates referenced in .cc pairs are not in the ID mapping (csv_to_cc fails)",
+                   templates[unmapped_tmpl], unmapped_tmpl.sum())
+
+    if catalog_info is not None:
+        keys = pd.Series(list(catalog_info.keys()), dtype=str)
+        ev_str = df['event_id'].astype(str)
+        no_loc = ~(ev_str.isin(keys) | df['template_id'].astype(str).isin(keys))
+        no_loc_events = ev_str[no_loc].unique()
+        if len(no_loc_events):
+            _issue(report, 'warnings', 'no_start_location',
+                   "Events with neither own nor template catalog location (written at 0,0,0)",
+                   no_loc_events, len(no_loc_events))
+
+    # --- counts vs compiled limits
+    n_events = len(events)
+    pick_stations = np.unique(pick_sta)
+    phases_per_event = (df['travel_time_p'].notna().astype(int) + df['travel_time_s'].notna().astype(int)) \
+        .groupby(df['event_id']).sum()
+    n_cc = int(((df['lag_time_p'].notna() & (df['cc_p'] >= min_cc)).sum()
+                + (df['lag_time_s'].notna() & (df['cc_s'] >= min_cc)).sum()))
+    report['counts'] = {
+        'events': int(n_events),
+        'picks': int(len(df)),
+        'stations_in_table': int(len(sta_codes)),
+        'stations_with_picks': int(len(pick_stations)),
+        'max_phases_per_event': int(phases_per_event.max()) if len(phases_per_event) else 0,
+        'cc_observations': n_cc,
+    }
+
+    _check_limits(report, 'stations_in_table')
+    report['ok'] = len(report['errors']) == 0
+    return report
+
+
+def _check_limits(report, stations_count):
+    """Compare report['counts'] with the compiled array limits."""
+    counts, limits = report['counts'], report['limits']
+    for count, limit, program in (
+            ('events', 'MEV', 'ph2dt'),
+            ('events', 'MAXEVE', 'hypoDD'),
+            (stations_count, 'MSTA', 'ph2dt'),
+            ('stations_with_picks', 'MAXSTA', 'hypoDD'),
+            ('max_phases_per_event', 'MOBS', 'ph2dt'),
+            ('cc_observations', 'MAXDATA', 'hypoDD')):
+        if limit in limits and count in counts and counts[count] > limits[limit]:
+            _issue(report, 'errors', f'limit_{limit}',
+                   f"{count} = {counts[count]} exceeds {limit} = {limits[limit]} compiled into {program}")
+
+
+def _check_values(report, table, columns, file_type, ids):
+    """NaN and format-width checks of the numeric columns of a .pha/.cc table (ranges from FIELD_RANGES)."""
+    ranges = {col: (lo, hi, fmt) for col, lo, hi, fmt in FIELD_RANGES}
+    for col, field in columns:
+        lo, hi, fmt = ranges[field]
+        values = table[col].to_numpy(dtype=float)
+        not_finite = ~np.isfinite(values)
+        if not_finite.any():
+            _issue(report, 'errors', f'nan_{file_type}_{col}', f".{file_type} {col} is not a finite number",
+                   ids[not_finite].unique(), not_finite.sum())
+        out = np.isfinite(values) & ((values < lo) | (values > hi))
+        if out.any():
+            _issue(report, 'errors', f'range_{file_type}_{col}', f".{file_type} {col} outside [{lo}, {hi}] for {fmt}",
+                   values[out], out.sum())
+
+
+def validate_run_inputs(station_file, phase_file, cc_file=None, include_dir=INCLUDE_DIR):
+    """
+    Validate the hypoDD input files of a run directory as written (station.dat, .pha, .cc).
+
+    Parameters:
+    -----------
+    station_file, phase_file : str
+        Files named in ph2dt.inp (or compressed siblings, see hypodd_io.compressed_source)
+    cc_file : str, optional
+        Cross-correlation file named in the hypoDD control file
+    include_dir : str
+        Directory with hypoDD.inc / ph2dt.inc
+
+    Returns:
+    --------
+    dict with 'ok', 'errors', 'warnings', 'counts' and 'limits' (as validate_inputs)
+    """
+    report = {'errors': [], 'warnings': [], 'counts': {}, 'limits': read_inc_limits(include_dir)}
+    try:
+        sources = [compressed_source(f) for f in (station_file, phase_file, cc_file) if f is not None]
+        missing = [f for f, src in zip((station_file, phase_file, cc_file), sources) if src is None]
+        if missing:
+            _issue(report, 'errors', 'files', "Input files not found (run prepare first)", missing, len(missing))
+        else:
+            sta = read_station_dat(sources[0])
+            events, phases = read_pha_lines(sources[1])
+            cc = read_dt_cc(sources[2]) if cc_file is not None else None
+    except (ValueError, pd.errors.ParserError) as e:
+        _issue(report, 'errors', 'format', str(e))
+    if report['errors']:
+        report['ok'] = False
+        return report
+
+    # --- stations
+    sta_codes = sta['station'].astype(str).to_numpy(dtype=str)
+    pick_sta = phases['station'].astype(str).to_numpy(dtype=str)
+    dup_sta = pd.Series(sta_codes).duplicated(keep=False).to_numpy()
+    if dup_sta.any():
+        _issue(report, 'errors', 'station_duplicate',
+               "Station codes listed more than once (ph2dt stops: 'station is listed twice')",
+               np.unique(sta_codes[dup_sta]), dup_sta.sum())
+    unknown = ~np.isin(pick_sta, sta_codes)
+    if unknown.any():
+        _issue(report, 'warnings', 'station_missing',
+               f"{unknown.sum()} picks use stations not in {os.path.basename(station_file)} (ph2dt drops them)",
+               np.unique(pick_sta[unknown]), unknown.sum())
+
+    # --- pick lines as written (ph2dt reads duplicates as separate observations)
+    dup_picks = phases.duplicated(['event_id', 'station', 'phase'], keep=False).to_numpy()
+    if dup_picks.any():
+        _issue(report, 'errors', 'duplicate_picks', "Duplicate (event, station, phase) pick lines in the .pha file",
+               phases.loc[dup_picks, 'event_id'].unique(), dup_picks.sum())
+    bad_phase = ~phases['phase'].isin(['P', 'S']).to_numpy()
+    if bad_phase.any():
+        _issue(report, 'errors', 'phase_label', "Pick lines with a phase other than P or S",
+               phases.loc[bad_phase, 'phase'].unique(), bad_phase.sum())
+    _check_values(report, phases, [('tt', 'travel_time_p'), ('weight', 'cc_p')], 'pha', phases['event_id'])
+
+    # --- events
+    ids = pd.to_numeric(events['event_id'], errors='coerce').to_numpy(dtype=float)
+    bad_id = ~np.isfinite(ids) | (ids < 0) | (ids > MAX_HYPODD_ID)
+    if bad_id.any():
+        _issue(report, 'errors', 'id_width',
+               f"Event IDs are not integers that fit the .cc header field ({{id:9d}}, max {MAX_HYPODD_ID})",
+               events.loc[bad_id, 'event_id'], bad_id.sum())
+    dup_id = events['event_id'].duplicated(keep=False).to_numpy()
+    if dup_id.any():
+        _issue(report, 'errors', 'duplicate_event_id', "Event IDs listed more than once in the .pha file",
+               events.loc[dup_id, 'event_id'].unique(), dup_id.sum())
+    no_loc = ((events['latitude'] == 0) & (events['longitude'] == 0)).to_numpy()
+    if no_loc.any():
+        _issue(report, 'warnings', 'no_start_location', "Events without a starting location (0,0 in .pha)",
+               events.loc[no_loc, 'event_id'], no_loc.sum())
+
+    # --- cross-correlation pairs
+    if cc is not None:
+        _check_values(report, cc, [('dt', 'lag_time_p'), ('weight', 'cc_p')], 'cc', cc['id1'])
+        unknown_ids = ~np.isin(np.concatenate([cc['id1'], cc['id2']]), ids[~bad_id].astype(np.int64))
+        if unknown_ids.any():
+            _issue(report, 'warnings', 'cc_unknown_event', "Events in .cc pairs that are not in the .pha file",
+                   np.unique(np.concatenate([cc['id1'], cc['id2']])[unknown_ids]), unknown_ids.sum())
+        cc_unknown_sta = ~cc['station'].astype(str).isin(sta_codes).to_numpy()
+        if cc_unknown_sta.any():
+            _issue(report, 'warnings', 'cc_station_missing',
+                   f"{cc_unknown_sta.sum()} .cc observations use stations not in {os.path.basename(station_file)}",
+                   cc.loc[cc_unknown_sta, 'station'].unique(), cc_unknown_sta.sum())
+
+    phases_per_event = phases.groupby('event_id', sort=False).size()
+    report['counts'] = {
+        'events': int(len(events)),
+        'phases': int(phases_per_event.sum()),
+        'stations_in_file': int(len(sta_codes)),
+        'stations_with_picks': int(len(np.unique(pick_sta))),
+        'max_phases_per_event': int(phases_per_event.max()) if len(phases_per_event) else 0,
+    }
+    if cc is not None:
+        report['counts']['cc_observations'] = int(len(cc))
+    _check_limits(report, 'stations_in_file')
+    report['ok'] = len(report['errors']) == 0
+    return report
+
+
+def print_report(report):
+    """Print a validation report."""
+    for level in ('errors', 'warnings'):
+        for issue in report[level]:
+            n = f" (n={issue['n']})" if issue['n'] is not None else ''
+            examples = f" e.g. {', '.join(issue['examples'])}" if issue['examples'] else ''
+            print(f"{'ERROR' if level == 'errors' else 'WARNING'} [{issue['check']}]{n}: {issue['message']}{examples}")
+    counts = ', '.join(f'{k}={v}' for k, v in report['counts'].items())
+    if report['ok']:
+        print(f"✅ Inputs valid ({counts})")
+    else:
+        print(f"❌ {len(report['errors'])} validation error(s) ({counts})")
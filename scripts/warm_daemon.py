@@ -0,0 +1,261 @@
+"""
+Warm worker daemon for run_hypodd.py commands.
+
+Every CLI call re-imports pandas/numpy and the wrapper modules and re-parses
+the detection, station and catalog CSVs before doing any work. The daemon is
+a long-lived local process that keeps the modules imported and the parsed
+tables in an LRU cache, bounded in bytes. It listens on a Unix socket for
+JSON requests. run_hypodd.py forwards its commands to the daemon when the
+daemon is running and streams the output back, so the CLI behaves the same.
+
+Protocol: one JSON line per request
+({"argv": [...], "cwd": ...} or {"command": "ping"|"clear"|"shutdown"}),
+answered with JSON lines ({"output": ...} while running, then {"done": true, "status": n}).
+
+This module imports only the standard library, so forwarding stays cheap.
+"""
+import json
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from contextlib import redirect_stderr, redirect_stdout
+
+
+SOCKET_PATH = os.environ.get('HYPODD_DAEMON_SOCKET',
+                             os.path.join(tempfile.gettempdir(), f'hypodd_daemon_{os.getuid()}.sock'))
+DEFAULT_CACHE_BYTES = int(os.environ.get('HYPODD_DAEMON_CACHE_MB', 2048)) * 1024 ** 2
+
+# CLI commands that run in the daemon when it is up (everything else runs locally)
+FORWARDED_COMMANDS = {'prepare', 'prepare_catalog', 'validate', 'ph2dt', 'hypodd', 'dryrun', 'convergence', 'dtstats', 'closure', 'dedupe', 'iobench', 'convert', 'compare',
+                      'run', 'ingest', 'import', 'registry', 'build_catalog', 'submit', 'gather'}
+
+
+# --- LRU cache ----------------------------------------------------------------
+
+def new_cache(max_bytes=DEFAULT_CACHE_BYTES):
+    """Empty LRU cache (use with cache_get)."""
+    return {'entries': OrderedDict(), 'max_bytes': max_bytes, 'bytes': 0,
+            'hits': 0, 'misses': 0, 'evictions': 0, 'lock': threading.Lock()}
+
+
+def _nbytes(value):
+    if hasattr(value, 'memory_usage'):  # DataFrame
+        return int(value.memory_usage(deep=True).sum())
+    if hasattr(value, 'nbytes'):  # ndarray
+        return int(value.nbytes)
+    return sys.getsizeof(value)
+
+
+def cache_get(cache, key, loader):
+    """
+    Cached value of key, calling loader() on a miss.
+
+    Least recently used entries are evicted while the cache exceeds max_bytes.
+    A value larger than max_bytes is returned without being cached.
+    """
+    with cache['lock']:
+        if key in cache['entries']:
+            cache['entries'].move_to_end(key)
+            cache['hits'] += 1
+            return cache['entries'][key][0]
+    value = loader()
+    size = _nbytes(value)
+    with cache['lock']:
+        cache['misses'] += 1
+        if size > cache['max_bytes']:
+            return value
+        if key not in cache['entries']:
+            cache['entries'][key] = (value, size)
+            cache['bytes'] += size
+        while cache['bytes'] > cache['max_bytes']:
+            _, (_, evicted) = cache['entries'].popitem(last=False)
+            cache['bytes'] -= evicted
+            cache['evictions'] += 1
+    return value
+
+
+def cache_stats(cache):
+    with cache['lock']:
+        return {'entries': len(cache['entries']), 'mb': round(cache['bytes'] / 1024 ** 2, 1),
+                'max_mb': round(cache['max_bytes'] / 1024 ** 2, 1),
+                'hits': cache['hits'], 'misses': cache['misses'], 'evictions': cache['evictions']}
+
+
+def cache_clear(cache):
+    with cache['lock']:
+        cache['entries'].clear()
+        cache['bytes'] = 0
+
+
+# --- server -------------------------------------------------------------------
+
+def _send(conn, message):
+    conn.sendall((json.dumps(message) + '\n').encode())
+
+
+class _SocketWriter:
+    """stdout replacement that streams writes to the client (and drops them if it went away)."""
+
+    def __init__(self, conn):
+        self.conn, self.closed_by_client = conn, False
+
+    def write(self, text):
+        if text and not self.closed_by_client:
+            try:
+                _send(self.conn, {'output': text})
+            except OSError:
+                self.closed_by_client = True
+        return len(text)
+
+    def flush(self):
+        pass
+
+
+def serve(main, socket_path=SOCKET_PATH, max_bytes=DEFAULT_CACHE_BYTES):
+    """
+    Run the daemon in the foreground until a shutdown request.
+
+    Parameters:
+    -----------
+    main : callable
+        CLI entry point, main(argv) -> exit status (run_hypodd.main)
+    socket_path : str
+        Unix socket to listen on (private to the user)
+    max_bytes : int
+        Size limit of the table cache
+    """
+    from csv_hypodd import set_table_cache
+
+    if os.path.exists(socket_path):
+        if daemon_running(socket_path):
+            print(f"Daemon already running on {socket_path}")
+            return
+        os.unlink(socket_path)  # stale socket of a dead daemon
+
+    cache = new_cache(max_bytes)
+    set_table_cache(lambda key, loader: cache_get(cache, key, loader))
+    run_lock = threading.Lock()  # commands share stdout and cwd, so they run one at a time
+    stop = threading.Event()
+
+    def handle(conn):
+        with conn, conn.makefile('r') as reader:
+            request = json.loads(reader.readline() or '{}')
+            command = request.get('command')
+            if command == 'ping':
+                _send(conn, {'done': True, 'status': 0, 'pid': os.getpid(), 'cache': cache_stats(cache)})
+                return
+            if command == 'clear':
+                cache_clear(cache)
+                _send(conn, {'done': True, 'status': 0})
+                return
+            if command == 'shutdown':
+                stop.set()
+                _send(conn, {'done': True, 'status': 0})
+                return
+
+            with run_lock:
+                writer = _SocketWriter(conn)
+                start, cwd = time.time(), os.getcwd()
+                try:
+                    os.chdir(request.get('cwd', cwd))
+                    with redirect_stdout(writer), redirect_stderr(writer):
+                        status = main(request['argv'])
+                except Exception as e:
+                    writer.write(f"ERROR: {e}\n")
+                    status = 1
+                finally:
+                    os.chdir(cwd)
+                if not writer.closed_by_client:
+                    try:
+                        _send(conn, {'done': True, 'status': status or 0, 'elapsed_s': round(time.time() - start, 3)})
+                    except OSError:
+                        pass
+                print(f"{' '.join(request['argv'][1:])}: {time.time() - start:.2f}s, cache {cache_stats(cache)}")
+
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(socket_path)
+    os.chmod(socket_path, 0o600)
+    server.listen(16)
+    server.settimeout(0.5)
+    print(f"✅ Daemon listening on {socket_path} (pid {os.getpid()}, cache {max_bytes // 1024 ** 2} MB)")
+    try:
+        while not stop.is_set():
+            try:
+                conn, _ = server.accept()
+            except socket.timeout:
+                continue
+            conn.settimeout(None)
+            threading.Thread(target=handle, args=(conn,), daemon=True).start()
+    finally:
+        server.close()
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        set_table_cache(None)
+    print("Daemon stopped")
+
+
+# --- client -------------------------------------------------------------------
+
+def _request(message, socket_path=SOCKET_PATH, stream=None):
+    """Send one request; output messages are written to stream. Returns the final message."""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(socket_path)
+        _send(sock, message)
+        with sock.makefile('r') as reader:
+            for line in reader:
+                reply = json.loads(line)
+                if reply.get('done'):
+                    return reply
+                if stream is not None:
+                    stream.write(reply['output'])
+                    stream.flush()
+    raise ConnectionError("daemon closed the connection before the command finished")
+
+
+def daemon_running(socket_path=SOCKET_PATH):
+    """True if a daemon answers on socket_path."""
+    try:
+        return _request({'command': 'ping'}, socket_path)['status'] == 0
+    except OSError:
+        return False
+
+
+def daemon_status(socket_path=SOCKET_PATH):
+    """pid and cache statistics of the running daemon, or None."""
+    try:
+        return _request({'command': 'ping'}, socket_path)
+    except OSError:
+        return None
+
+
+def stop_daemon(socket_path=SOCKET_PATH):
+    """Ask the daemon to exit. Returns False if none was running."""
+    try:
+        _request({'command': 'shutdown'}, socket_path)
+        return True
+    except OSError:
+        return False
+
+
+def forward(argv, socket_path=SOCKET_PATH):
+    """
+    Run a CLI command in the daemon, if one is running.
+
+    argv: sys.argv of run_hypodd.py. Set HYPODD_NO_DAEMON=1 to always run locally.
+    Returns: exit status, or None if the command was not forwarded
+    """
+    if len(argv) < 2 or argv[1] not in FORWARDED_COMMANDS or os.environ.get('HYPODD_NO_DAEMON') \
+            or not os.path.exists(socket_path):
+        return None
+    try:
+        reply = _request({'argv': list(argv), 'cwd': os.getcwd()}, socket_path, stream=sys.stdout)
+    except (ConnectionRefusedError, FileNotFoundError):
+        return None  # stale socket
+    except ConnectionError as e:
+        print(f"ERROR: {e}")
+        return 1
+    return reply['status']